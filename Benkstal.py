@@ -3,19 +3,20 @@
 Script per deployare un'applicazione Docker da ECR ad AWS Elastic Beanstalk
 """
 
-import boto3
 import json
 import time
 from datetime import datetime
 from botocore.exceptions import ClientError
 
+import awsClients
+
 # ==============================================================================
 # CONFIGURAZIONE - Modifica questi parametri
 # ==============================================================================
 
 # Informazioni AWS
-AWS_REGION = "us-east-1"  # Cambia con la tua region
-AWS_ACCOUNT_ID = "724201375649"  # Il tuo Account ID
+AWS_REGION = awsClients.DEFAULT_REGION  # Regione comune del progetto (AWS_REGION / AWS_DEFAULT_REGION)
+AWS_ACCOUNT_ID = awsClients.get_account_id()  # Account delle credenziali correnti (STS)
 
 # Informazioni ECR
 ECR_REPOSITORY_NAME = "gymapp-frontend"  # Nome del repository ECR
@@ -34,9 +35,9 @@ AUTO_SELECT_HEALTHY_ENV = True  # Se True, seleziona automaticamente il primo en
 # INIZIALIZZAZIONE CLIENT BOTO3
 # ==============================================================================
 
-ecr_client = boto3.client('ecr', region_name=AWS_REGION)
-eb_client = boto3.client('elasticbeanstalk', region_name=AWS_REGION)
-s3_client = boto3.client('s3', region_name=AWS_REGION)
+ecr_client = awsClients.get_client('ecr', AWS_REGION)
+eb_client = awsClients.get_client('elasticbeanstalk', AWS_REGION)
+s3_client = awsClients.get_client('s3', AWS_REGION)
 
 
 def get_ecr_image_uri():
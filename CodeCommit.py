@@ -1,11 +1,11 @@
-import boto3
+import awsClients
 
 # Configurazione
 CODECOMMIT_REPO = "gymcloud-repo"
-REGION = "us-east-1"
+REGION = awsClients.DEFAULT_REGION
 
 # Client AWS
-codecommit = boto3.client("codecommit", region_name=REGION)
+codecommit = awsClients.get_client("codecommit", REGION)
 
 def ensure_codecommit_repo():
     """Crea il repository CodeCommit se non esiste."""
@@ -1,20 +1,22 @@
-import boto3
 import json
 import time 
 
+import awsClients
+
+REGION = awsClients.DEFAULT_REGION
+
 # Client AWS
-iam = boto3.client("iam")
-s3 = boto3.client("s3")
-codepipeline = boto3.client("codepipeline")
-codebuild = boto3.client("codebuild")
+iam = awsClients.get_client("iam", REGION)
+s3 = awsClients.get_client("s3", REGION)
+codepipeline = awsClients.get_client("codepipeline", REGION)
+codebuild = awsClients.get_client("codebuild", REGION)
 
 # Parametri principali
 PIPELINE_ROLE_NAME = "gymcloud-pipeline-role"
 CODEBUILD_ROLE_NAME = "gymcloud-codebuild-role"
 PIPELINE_NAME = "gymcloud-pipeline"
 ARTIFACT_BUCKET = "gym-users-fronted"
-REGION = "us-east-1"
-AWS_ACCOUNT_ID = "724201375649"
+AWS_ACCOUNT_ID = awsClients.get_account_id()
 
 # PARAMETRI GITHUB
 CODE_CONNECTION_ARN = "arn:aws:codeconnections:us-east-1:724201375649:connection/4456474c-2207-4002-916c-ff700e53165e" 
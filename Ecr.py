@@ -4,11 +4,12 @@ Script per configurare Amazon ECR per GymApp
 Crea il repository ECR e configura le policy necessarie per Beanstalk
 """
 
-import boto3
 import json
 import logging
 from botocore.exceptions import ClientError, NoCredentialsError
 
+import awsClients
+
 # Configurazione logging
 logging.basicConfig(
     level=logging.INFO,
@@ -17,16 +18,17 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class ECRManager:
-    def __init__(self, region='us-east-1'):
+    def __init__(self, region=None):
         """
         Inizializza il manager ECR
         
         Args:
-            region (str): Regione AWS dove creare le risorse
+            region (str): Regione AWS dove creare le risorse (default: regione comune del progetto)
         """
         try:
-            self.ecr_client = boto3.client('ecr', region_name=region)
-            self.iam_client = boto3.client('iam', region_name=region)
+            region = awsClients.get_region(region)
+            self.ecr_client = awsClients.get_client('ecr', region)
+            self.iam_client = awsClients.get_client('iam', region)
             self.region = region
             logger.info(f"Inizializzato ECRManager per regione: {region}")
         except NoCredentialsError:
@@ -172,7 +174,7 @@ class ECRManager:
                         "Sid": "AllowCrossAccountAccess",
                         "Effect": "Allow",
                         "Principal": {
-                            "AWS": f"arn:aws:iam::{boto3.client('sts').get_caller_identity()['Account']}:root"
+                            "AWS": f"arn:aws:iam::{awsClients.get_account_id()}:root"
                         },
                         "Action": [
                             "ecr:GetDownloadUrlForLayer",
@@ -361,7 +363,7 @@ def main():
     """
     try:
         # Configura i parametri
-        REGION = 'us-east-1'  # Cambia con la tua regione
+        REGION = awsClients.DEFAULT_REGION  # AWS_REGION / AWS_DEFAULT_REGION
         REPOSITORY_NAME = 'gymapp-frontend'
         
         # Inizializza il manager ECR
@@ -0,0 +1,102 @@
+"""
+Factory condivisa dei client boto3 per l'handler Lambda e gli script di provisioning
+Sessioni, client e resource vengono creati una sola volta per regione (e endpoint) e
+riutilizzati; l'account ID viene letto da STS una sola volta per processo. Tutti i client
+usano la stessa botocore.Config: pool di connessioni, keepalive TCP, retry adattivi e timeout.
+
+Regione unica per tutto il progetto: AWS_REGION (impostata da Lambda), poi
+AWS_DEFAULT_REGION, altrimenti us-east-1. Le tabelle DynamoDB stanno invece in
+DYNAMODB_REGION (eu-west-1 se non configurata), indipendentemente dalla regione della Lambda.
+"""
+
+import os
+import threading
+
+DEFAULT_REGION = os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION') or 'us-east-1'
+DYNAMODB_REGION = os.environ.get('DYNAMODB_REGION') or 'eu-west-1'
+
+# Parametri della botocore.Config condivisa
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '32'))
+MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '5'))
+CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', '2'))
+READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', '10'))
+
+_lock = threading.RLock()
+_config = None
+_sessions = {}
+_clients = {}
+_resources = {}
+_account_id = None
+
+def get_region(region=None):
+    return region or DEFAULT_REGION
+
+# botocore viene importato al primo client, non all'import del modulo (cold start)
+def get_config():
+    global _config
+    if _config is None:
+        with _lock:
+            if _config is None:
+                from botocore.config import Config
+                _config = Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS,
+                    tcp_keepalive=True,
+                    retries={'mode': 'adaptive', 'max_attempts': MAX_ATTEMPTS},
+                    connect_timeout=CONNECT_TIMEOUT,
+                    read_timeout=READ_TIMEOUT
+                )
+    return _config
+
+# Le sessioni boto3 non sono thread-safe: client e resource vengono creati sotto lock,
+# poi i client possono essere usati da più thread
+def get_session(region=None):
+    region = get_region(region)
+    with _lock:
+        session = _sessions.get(region)
+        if session is None:
+            import boto3
+            session = _sessions[region] = boto3.session.Session(region_name=region)
+        return session
+
+def get_client(service, region=None, endpoint_url=None):
+    region = get_region(region)
+    key = (service, region, endpoint_url)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = get_session(region).client(
+                    service, endpoint_url=endpoint_url, config=get_config())
+    return client
+
+def get_resource(service, region=None, endpoint_url=None):
+    region = get_region(region)
+    key = (service, region, endpoint_url)
+    resource = _resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(key)
+            if resource is None:
+                resource = _resources[key] = get_session(region).resource(
+                    service, endpoint_url=endpoint_url, config=get_config())
+    return resource
+
+# Account ID dell'identità corrente (una sola chiamata STS per processo)
+def get_account_id():
+    global _account_id
+    if _account_id is None:
+        with _lock:
+            if _account_id is None:
+                _account_id = get_client('sts').get_caller_identity()['Account']
+    return _account_id
+
+def reset():
+    """Dimentica sessioni, client e account (es. dopo un cambio di credenziali)"""
+    global _config, _account_id
+    with _lock:
+        _sessions.clear()
+        _clients.clear()
+        _resources.clear()
+        _config = None
+        _account_id = None
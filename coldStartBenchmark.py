@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Misura il cold start di gymUsersHandler: per ogni route avvia un interprete Python
+# nuovo, importa il modulo e invoca handler una volta, come fa Lambda in un container
+# appena creato. Il tempo misurato va dall'inizio dell'import alla prima risposta.
+#
+# Le route che leggono la tabella richiedono un DynamoDB raggiungibile: in locale
+# impostare DYNAMODB_ENDPOINT_URL (es. DynamoDB Local su http://localhost:8000).
+#
+# Esempio:
+#   DYNAMODB_ENDPOINT_URL=http://localhost:8000 python coldStartBenchmark.py --runs 5 --max-ms 800
+
+HANDLER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# GET /cache/stats è riservata agli amministratori: i processi del benchmark ricevono questo token
+BENCHMARK_ADMIN_TOKEN = 'cold-start-benchmark'
+
+ROUTES = [
+    ('OPTIONS /users', {'httpMethod': 'OPTIONS', 'path': '/users'}),
+    ('GET /cache/stats', {'httpMethod': 'GET', 'path': '/cache/stats',
+                          'headers': {'X-Admin-Token': BENCHMARK_ADMIN_TOKEN}}),
+    ('GET /users', {'httpMethod': 'GET', 'path': '/users', 'queryStringParameters': {'limit': '50'}}),
+    ('GET /stats', {'httpMethod': 'GET', 'path': '/stats'}),
+]
+
+CHILD_SCRIPT = r'''
+import json, logging, sys, time
+logging.disable(logging.CRITICAL)
+start = time.perf_counter()
+import gymUsersHandler
+imported = time.perf_counter()
+response = gymUsersHandler.handler(json.loads(sys.argv[1]), None)
+done = time.perf_counter()
+print(json.dumps({
+    "importMs": (imported - start) * 1000,
+    "firstResponseMs": (done - imported) * 1000,
+    "totalMs": (done - start) * 1000,
+    "statusCode": response["statusCode"]
+}))
+'''
+
+def run_cold_start(event):
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT, json.dumps(event)],
+        cwd=HANDLER_DIR,
+        env={'METRICS_MODE': 'off', **os.environ, 'PYTHONDONTWRITEBYTECODE': '1', 'ADMIN_TOKEN': BENCHMARK_ADMIN_TOKEN},
+        capture_output=True,
+        text=True,
+        timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or "processo terminato con codice %d" % result.returncode)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def benchmark(routes, runs):
+    report = {}
+    for name, event in routes:
+        samples = [run_cold_start(event) for _ in range(runs)]
+        report[name] = {
+            'runs': runs,
+            'statusCodes': sorted({sample['statusCode'] for sample in samples}),
+            'importMs': round(statistics.median(sample['importMs'] for sample in samples), 1),
+            'firstResponseMs': round(statistics.median(sample['firstResponseMs'] for sample in samples), 1),
+            'totalMs': round(statistics.median(sample['totalMs'] for sample in samples), 1),
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del cold start di gymUsersHandler per route")
+    parser.add_argument('--runs', type=int, default=5, help="processi nuovi per route (si usa la mediana)")
+    parser.add_argument('--route', action='append', help="limita il benchmark a queste route (es. 'GET /users')")
+    parser.add_argument('--max-ms', type=float, help="soglia massima import + prima risposta per route")
+    parser.add_argument('--json', action='store_true', help="stampa il report in JSON")
+    args = parser.parse_args()
+
+    routes = [route for route in ROUTES if not args.route or route[0] in args.route]
+    if not routes:
+        print(f"Nessuna route corrispondente. Disponibili: {', '.join(name for name, _ in ROUTES)}")
+        return 2
+
+    try:
+        report = benchmark(routes, args.runs)
+    except RuntimeError as e:
+        print(f"Errore durante il benchmark: {e}")
+        return 2
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'Route':<20} {'import ms':>10} {'prima risp. ms':>15} {'totale ms':>10}  status")
+        for name, result in report.items():
+            print(f"{name:<20} {result['importMs']:>10} {result['firstResponseMs']:>15} "
+                  f"{result['totalMs']:>10}  {result['statusCodes']}")
+
+    if args.max_ms is not None:
+        slow = [name for name, result in report.items() if result['totalMs'] > args.max_ms]
+        if slow:
+            print(f"\nCold start oltre la soglia di {args.max_ms} ms: {', '.join(slow)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
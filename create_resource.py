@@ -1,19 +1,20 @@
-import boto3
 import json
 import time
 from botocore.exceptions import ClientError
 
+import awsClients
+
 class AWSResourceCreator:
-    def __init__(self, region='eu-west-1'):
-        self.region = region
-        self.account_id = boto3.client('sts').get_caller_identity()['Account']
+    def __init__(self, region=None):
+        self.region = region = awsClients.get_region(region)
+        self.account_id = awsClients.get_account_id()
         
-        # Inizializza i client AWS
-        self.codecommit = boto3.client('codecommit', region_name=region)
-        self.codepipeline = boto3.client('codepipeline', region_name=region)
-        self.codebuild = boto3.client('codebuild', region_name=region)
-        self.iam = boto3.client('iam', region_name=region)
-        self.s3 = boto3.client('s3', region_name=region)
+        # Inizializza i client AWS (condivisi tramite awsClients)
+        self.codecommit = awsClients.get_client('codecommit', region)
+        self.codepipeline = awsClients.get_client('codepipeline', region)
+        self.codebuild = awsClients.get_client('codebuild', region)
+        self.iam = awsClients.get_client('iam', region)
+        self.s3 = awsClients.get_client('s3', region)
         
         print(f"🌍 Regione: {region}")
         print(f"🆔 Account ID: {self.account_id}")
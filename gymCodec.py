@@ -0,0 +1,271 @@
+"""
+Codifica compatta degli elementi dei membri nella tabella gymcloudUsers
+In scrittura vengono omessi i valori uguali ai predefiniti (indirizzo e contatto di
+emergenza vuoti, "Nessuna" nelle informazioni mediche, ...) e i campi ricavabili da altri
+(firstName/lastName da fullName, updatedAt e membershipStartDate da createdAt); con
+CODEC_SHORT_NAMES=1 gli attributi hanno anche nomi brevi. In lettura decode restituisce
+sempre il formato dell'API e accetta sia gli elementi compatti sia quelli completi, quindi
+la migrazione (python gymCodec.py migrate) può girare mentre l'API è in servizio.
+
+Le chiavi della tabella e degli indici (userId, status, membershipType, createdAt,
+listPartition) e recordType non vengono mai rinominate né omesse: gli indici sparsi e il
+consumer dello stream le leggono direttamente.
+
+I dati letti di rado e sensibili (medicalInfo, emergencyContact) stanno in un elemento a
+parte, <userId>#DETAILS con recordType DETAILS, scritto solo se diversi dai predefiniti:
+le scansioni e le liste leggono soltanto l'elemento principale, più piccolo. L'elemento
+DETAILS non ha listPartition né le altre chiavi degli indici, quindi le liste (query
+sull'indice sparso dei membri) non lo leggono e non lo contano nel limit della pagina.
+"""
+
+import argparse
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from gymStorage import ConditionFailed, IF_EXISTS
+
+CODEC_SHORT_NAMES = os.environ.get('CODEC_SHORT_NAMES', '0') == '1'
+MIGRATION_WORKERS = int(os.environ.get('MIGRATION_WORKERS', '8'))
+MIGRATION_CHUNK_SIZE = 100
+
+KEY_ATTRIBUTES = frozenset({'userId', 'status', 'membershipType', 'createdAt', 'listPartition', 'recordType'})
+
+SHORT_NAMES = {
+    'firstName': 'fn',
+    'lastName': 'ln',
+    'fullName': 'n',
+    'email': 'e',
+    'phone': 'p',
+    'membershipStartDate': 'ms',
+    'membershipEndDate': 'me',
+    'isActive': 'a',
+    'updatedAt': 'u',
+    'birthDate': 'b',
+    'goal': 'g',
+    'address': 'ad',
+    'emergencyContact': 'ec',
+    'medicalInfo': 'mi'
+}
+LONG_NAMES = {short: name for name, short in SHORT_NAMES.items()}
+
+# Valori predefiniti dei nuovi membri (usati anche da gymUsersHandler.build_user_item).
+# Le mappe vengono confrontate campo per campo: si salvano solo i campi diversi
+DEFAULTS = {
+    'phone': '',
+    'isActive': True,
+    'birthDate': '',
+    'goal': 'Mantenersi in forma',
+    'address': {'street': '', 'city': '', 'zipCode': ''},
+    'emergencyContact': {'name': '', 'phone': '', 'relationship': ''},
+    'medicalInfo': {'allergies': 'Nessuna', 'conditions': 'Nessuna'}
+}
+
+# Campi salvati nell'elemento DETAILS invece che nell'elemento principale del membro
+DETAIL_FIELDS = ('medicalInfo', 'emergencyContact')
+DETAILS_KEY_SUFFIX = "#DETAILS"
+
+# Attributi da leggere per ricavare un campo omesso
+DEPENDENCIES = {
+    'firstName': ('fullName',),
+    'lastName': ('fullName',),
+    'updatedAt': ('createdAt',),
+    'membershipStartDate': ('createdAt',)
+}
+
+_MISSING = object()
+
+def default_value(name):
+    default = DEFAULTS[name]
+    return dict(default) if isinstance(default, dict) else default
+
+# Nome e cognome come li divide build_user_item (al primo spazio)
+def split_name(full_name):
+    parts = full_name.strip().split(' ', 1)
+    return parts[0], parts[1] if len(parts) > 1 else ''
+
+# Campi ricavabili dagli altri attributi di un elemento con i nomi dell'API
+def derived_values(item):
+    derived = {}
+    full_name = item.get('fullName')
+    if isinstance(full_name, str):
+        derived['firstName'], derived['lastName'] = split_name(full_name)
+    created_at = item.get('createdAt')
+    if isinstance(created_at, str):
+        derived['updatedAt'] = created_at
+        derived['membershipStartDate'] = created_at[:10]
+    return derived
+
+def stored_name(name, short_names):
+    return SHORT_NAMES.get(name, name) if short_names else name
+
+# Elemento da scrivere per un membro nel formato dell'API
+def encode(user, short_names=None):
+    short_names = CODEC_SHORT_NAMES if short_names is None else short_names
+    derived = derived_values(user)
+    encoded = {}
+    for name, value in user.items():
+        if name in KEY_ATTRIBUTES:
+            encoded[name] = value
+            continue
+        if name in derived and value == derived[name]:
+            continue
+        default = DEFAULTS.get(name, _MISSING)
+        if isinstance(default, dict) and isinstance(value, dict):
+            value = {key: item for key, item in value.items() if default.get(key, _MISSING) != item}
+            if not value:
+                continue
+        elif value == default:
+            continue
+        encoded[stored_name(name, short_names)] = value
+    return encoded
+
+def details_key(user_id):
+    return {'userId': user_id + DETAILS_KEY_SUFFIX}
+
+# Campi richiesti che si trovano nell'elemento DETAILS
+def detail_fields(fields):
+    return [field for field in (fields or DETAIL_FIELDS) if field in DETAIL_FIELDS]
+
+# Elementi da scrivere per un membro nel formato dell'API: (principale, DETAILS), con
+# DETAILS None se i dati medici e il contatto di emergenza sono quelli predefiniti
+def encode_member(user, short_names=None):
+    short_names = CODEC_SHORT_NAMES if short_names is None else short_names
+    item = encode(user, short_names)
+    details = {}
+    for name in DETAIL_FIELDS:
+        value = item.pop(stored_name(name, short_names), _MISSING)
+        if value is not _MISSING:
+            details[stored_name(name, short_names)] = value
+    if not details:
+        return item, None
+    return item, {**details_key(user['userId']), 'recordType': 'DETAILS', **details}
+
+# Membro nel formato dell'API a partire da un elemento compatto o completo; con fields
+# restituisce solo quei campi (l'elemento va letto con storage_fields(fields)). details è
+# l'elemento DETAILS letto a parte: i suoi campi prevalgono su quelli dell'elemento
+# principale, che li contiene solo per i membri non ancora migrati
+def decode(item, fields=None, details=None):
+    decoded = {LONG_NAMES.get(name, name): value for name, value in item.items()}
+    if details:
+        for name, value in details.items():
+            if name not in ('userId', 'recordType'):
+                decoded[LONG_NAMES.get(name, name)] = value
+    for name in (DEFAULTS if fields is None else [field for field in fields if field in DEFAULTS]):
+        value = decoded.get(name, _MISSING)
+        if value is _MISSING:
+            decoded[name] = default_value(name)
+        elif isinstance(value, dict) and isinstance(DEFAULTS[name], dict):
+            decoded[name] = {**DEFAULTS[name], **value}
+    for name, value in derived_values(decoded).items():
+        decoded.setdefault(name, value)
+    if fields is None:
+        return decoded
+    return {field: decoded[field] for field in fields if field in decoded}
+
+@functools.lru_cache(maxsize=128)
+def _storage_fields(fields):
+    names = []
+    for field in fields:
+        for dependency in (field, *DEPENDENCIES.get(field, ())):
+            for name in (dependency, SHORT_NAMES.get(dependency)):
+                if name is not None and name not in names:
+                    names.append(name)
+    return names
+
+# Attributi da proiettare per restituire i campi richiesti: nomi completi e brevi (la
+# tabella può contenere entrambi i formati) più gli attributi da cui si ricavano i campi omessi
+def storage_fields(fields):
+    if not fields:
+        return fields
+    return list(_storage_fields(tuple(fields)))
+
+# Riscrive i membri esistenti in formato compatto, spostando dati medici e contatto di
+# emergenza nell'elemento DETAILS, oppure, con expand, in formato completo in un solo
+# elemento (prima di tornare a una versione senza codec). Le due scritture di un membro sono
+# in una transazione e la condizione IF_EXISTS evita di ricreare un membro eliminato
+# durante la migrazione. Restituisce i contatori; le dimensioni sono quelle degli elementi
+# principali, cioè i byte letti dalle scansioni
+def migrate(expand=False, short_names=None, dry_run=False):
+    import gymUsersHandler
+
+    storage = gymUsersHandler.get_storage()
+    counters = {'scanned': 0, 'rewritten': 0, 'unchanged': 0, 'deleted': 0, 'bytesBefore': 0, 'bytesAfter': 0}
+
+    def operations_for(item):
+        if expand:
+            key = details_key(item['userId'])
+            details = storage.get(key)
+            target = decode(item, details=details)
+            operations = [{'put': target, 'condition': IF_EXISTS}]
+            if details is not None:
+                operations.append({'delete': key})
+            return target, operations if target != item or details is not None else []
+        target, details = encode_member(decode(item), short_names)
+        operations = [{'put': target, 'condition': IF_EXISTS}]
+        if details is not None:
+            operations.append({'put': details})
+        return target, operations if target != item else []
+
+    def rewrite(item):
+        target, operations = operations_for(item)
+        if not operations:
+            return 'unchanged', target
+        if dry_run:
+            return 'rewritten', target
+        try:
+            storage.transact(operations)
+            return 'rewritten', target
+        except ConditionFailed:
+            return 'deleted', target
+
+    def flush(pending, executor):
+        for item, (outcome, target) in zip(pending, executor.map(rewrite, pending)):
+            counters[outcome] += 1
+            counters['bytesBefore'] += item_size(item)
+            counters['bytesAfter'] += item_size(target)
+
+    pending = []
+    with ThreadPoolExecutor(max_workers=MIGRATION_WORKERS) as executor:
+        for item in gymUsersHandler.parallel_scan(filters=gymUsersHandler.MEMBER_FILTERS):
+            counters['scanned'] += 1
+            pending.append(item)
+            if len(pending) >= MIGRATION_CHUNK_SIZE:
+                flush(pending, executor)
+                pending = []
+        if pending:
+            flush(pending, executor)
+    return counters
+
+# Dimensione approssimata di un elemento come la calcola DynamoDB (nomi più valori)
+def item_size(value):
+    if isinstance(value, dict):
+        return sum(len(name.encode('utf-8')) + item_size(item) for name, item in value.items()) + 3
+    if isinstance(value, (list, tuple)):
+        return sum(item_size(item) for item in value) + 3
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, bool) or value is None:
+        return 1
+    return len(str(value))
+
+def main():
+    parser = argparse.ArgumentParser(description="Codifica compatta dei membri di gymcloudUsers")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help="riscrive i membri esistenti")
+    migrate_parser.add_argument('--expand', action='store_true',
+                                help="riscrive i membri in formato completo (ripristino)")
+    migrate_parser.add_argument('--short-names', choices=['on', 'off'],
+                                help="nomi brevi degli attributi (default: CODEC_SHORT_NAMES)")
+    migrate_parser.add_argument('--dry-run', action='store_true', help="conta senza scrivere")
+    args = parser.parse_args()
+
+    short_names = None if args.short_names is None else args.short_names == 'on'
+    counters = migrate(expand=args.expand, short_names=short_names, dry_run=args.dry_run)
+    print(f"Membri letti: {counters['scanned']}, riscritti: {counters['rewritten']}, "
+          f"invariati: {counters['unchanged']}, eliminati durante la migrazione: {counters['deleted']}")
+    print(f"Dimensione stimata degli elementi principali: {counters['bytesBefore']} -> {counters['bytesAfter']} byte")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,388 @@
+"""
+Importazione massiva di membri da file CSV caricati su S3
+La Lambda parte con la notifica S3 di un nuovo oggetto sotto IMPORT_PREFIX e legge il file
+in streaming, a segmenti di IMPORT_SEGMENT_ROWS righe. Ogni riga viene normalizzata
+(intestazioni in italiano o inglese, date, telefoni, tipi di abbonamento) e validata con le
+regole di gymUsersHandler; i membri validi sono scritti da IMPORT_WORKERS thread con
+BatchWriteItem. Le righe scartate finiscono in un report CSV per segmento.
+
+Dopo ogni segmento il checkpoint (IMPORT#<bucket>/<chiave>#<etag>, recordType IMPORT)
+salva la posizione in byte nel file: se il tempo residuo della Lambda scende sotto
+IMPORT_TIME_MARGIN_MS la funzione si reinvoca e riprende dal checkpoint con una GET Range.
+Gli userId derivano dal file e dal numero di riga, quindi un segmento ripetuto dopo
+un'interruzione non crea duplicati.
+"""
+
+import csv
+import datetime
+import io
+import itertools
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
+
+import awsClients
+import gymUsersHandler
+from gymStorage import ConditionFailed, IF_NOT_EXISTS, if_absent_or_equals
+
+logger = logging.getLogger()
+
+IMPORT_KEY_PREFIX = "IMPORT#"
+IMPORT_PREFIX = os.environ.get('IMPORT_PREFIX', 'imports/')
+IMPORT_REPORT_PREFIX = os.environ.get('IMPORT_REPORT_PREFIX', 'import-reports/')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+
+IMPORT_SEGMENT_ROWS = int(os.environ.get('IMPORT_SEGMENT_ROWS', '1000'))
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', '4'))
+# Tempo residuo minimo per iniziare un nuovo segmento, altrimenti la funzione si reinvoca
+IMPORT_TIME_MARGIN_MS = int(os.environ.get('IMPORT_TIME_MARGIN_MS', '60000'))
+IMPORT_JOB_TTL_SECONDS = 30 * 24 * 3600
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Intestazioni riconosciute (normalizzate: minuscole, senza accenti, spazi e punteggiatura)
+HEADER_ALIASES = {
+    'name': {'name', 'fullname', 'nomecompleto', 'nominativo'},
+    'firstName': {'firstname', 'nome'},
+    'lastName': {'lastname', 'surname', 'cognome'},
+    'email': {'email', 'mail', 'posta', 'postaelettronica', 'emailaddress', 'indirizzoemail'},
+    'phone': {'phone', 'telefono', 'tel', 'cellulare', 'mobile', 'phonenumber'},
+    'subscriptionType': {'subscriptiontype', 'membershiptype', 'abbonamento', 'tipoabbonamento', 'plan'},
+    'birthDate': {'birthdate', 'datanascita', 'datadinascita', 'dob', 'dateofbirth'},
+    'goal': {'goal', 'obiettivo'},
+    'status': {'status', 'stato'},
+    'joinDate': {'joindate', 'createdat', 'dataiscrizione', 'datadiiscrizione', 'iscrizione'}
+}
+COLUMN_BY_HEADER = {alias: field for field, aliases in HEADER_ALIASES.items() for alias in aliases}
+
+SUBSCRIPTION_ALIASES = {
+    'monthly': 'monthly', 'mensile': 'monthly',
+    'quarterly': 'quarterly', 'trimestrale': 'quarterly',
+    'yearly': 'yearly', 'annual': 'yearly', 'annuale': 'yearly',
+    'basic': 'basic', 'base': 'basic',
+    'premium': 'premium'
+}
+STATUS_ALIASES = {'attivo': 'active', 'sospeso': 'suspended', 'scaduto': 'expired'}
+PHONE_SEPARATORS_REGEX = re.compile(r'[\s.\-/()]')
+LINE_BREAKS_REGEX = re.compile(r'\s*[\r\n]+\s*')
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y')
+
+def get_s3():
+    return awsClients.get_client('s3', endpoint_url=S3_ENDPOINT_URL)
+
+def normalize_header(name):
+    ascii_name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]', '', ascii_name.lower())
+
+# Campo di ogni colonna dell'intestazione (None per le colonne ignorate)
+def map_columns(header):
+    columns = [COLUMN_BY_HEADER.get(normalize_header(name)) for name in header]
+    # "nome" senza "cognome" è il nome completo
+    if 'firstName' in columns and 'lastName' not in columns and 'name' not in columns:
+        columns[columns.index('firstName')] = 'name'
+    if 'email' not in columns or not {'name', 'firstName'} & set(columns):
+        raise ValueError("Intestazione CSV senza colonne per nome ed email")
+    return columns
+
+def parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value[:10], date_format).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(value)
+
+# Dati del membro nel formato di POST /users a partire dai valori di una riga:
+# restituisce (dati, None) oppure (None, messaggio di errore)
+def normalize_row(values, columns):
+    raw = {}
+    for field, value in zip(columns, values):
+        if field and value.strip():
+            # Una cella tra virgolette può contenere a capo: nei nomi e negli altri testi
+            # diventano spazi
+            raw[field] = LINE_BREAKS_REGEX.sub(' ', value.strip())
+
+    user_data = {
+        'name': raw.get('name') or ' '.join(part for part in (raw.get('firstName'), raw.get('lastName')) if part),
+        'email': raw.get('email', '').lower()
+    }
+    if raw.get('phone'):
+        user_data['phone'] = PHONE_SEPARATORS_REGEX.sub('', raw['phone'])
+    if raw.get('subscriptionType'):
+        subscription_type = SUBSCRIPTION_ALIASES.get(normalize_header(raw['subscriptionType']))
+        if subscription_type is None:
+            return None, f"Tipo di abbonamento non valido: {raw['subscriptionType']}"
+        user_data['subscriptionType'] = subscription_type
+    if raw.get('goal'):
+        user_data['goal'] = raw['goal']
+    if raw.get('status'):
+        status = raw['status'].lower()
+        user_data['status'] = STATUS_ALIASES.get(status, status)
+    for field in ('birthDate', 'joinDate'):
+        if raw.get(field):
+            try:
+                user_data[field] = parse_date(raw[field])
+            except ValueError:
+                return None, f"Data non valida in {field}: {raw[field]}"
+
+    error = gymUsersHandler.validate_user_data(user_data)
+    return (None, error) if error else (user_data, None)
+
+# Righe di uno stream di byte con il numero di byte consumati fino all'ultima riga letta:
+# dopo ogni riga restituita da csv.reader, offset è la posizione da cui riprendere
+class ByteCountingLines:
+    def __init__(self, chunks, offset=0):
+        self.chunks = chunks
+        self.offset = offset
+
+    @staticmethod
+    def _decode(line):
+        # I gestionali esportano spesso in Windows-1252 invece che in UTF-8
+        try:
+            return line.decode('utf-8')
+        except UnicodeDecodeError:
+            return line.decode('cp1252', errors='replace')
+
+    def __iter__(self):
+        pending = b''
+        for chunk in self.chunks:
+            pending += chunk
+            start = 0
+            while True:
+                end = pending.find(b'\n', start)
+                if end < 0:
+                    break
+                line = pending[start:end + 1]
+                start = end + 1
+                self.offset += len(line)
+                yield self._decode(line)
+            pending = pending[start:]
+        if pending:
+            self.offset += len(pending)
+            yield self._decode(pending)
+
+# Attributi numerici del checkpoint (Decimal quando letti da DynamoDB)
+JOB_COUNTERS = ('offset', 'rowsRead', 'imported', 'skipped', 'rejected', 'segments', 'invocations', 'version')
+
+def job_key(bucket, key, etag):
+    return {'userId': f"{IMPORT_KEY_PREFIX}{bucket}/{key}#{etag}"}
+
+# userId stabile per riga del file: ripetere un segmento riscrive gli stessi membri
+def import_user_id(job, row_number):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{job['userId']}#{row_number}"))
+
+def load_or_create_job(storage, bucket, key, etag):
+    job = {
+        **job_key(bucket, key, etag),
+        'recordType': 'IMPORT',
+        'bucket': bucket,
+        'objectKey': key,
+        'etag': etag,
+        # Non status: con createdAt finirebbe in status-createdAt-index tra i membri
+        'jobStatus': 'running',
+        'offset': 0,
+        'header': None,
+        'delimiter': None,
+        'rowsRead': 0,
+        'imported': 0,
+        'skipped': 0,
+        'rejected': 0,
+        'segments': 0,
+        'invocations': 1,
+        'version': 0,
+        'createdAt': datetime.datetime.utcnow().isoformat(),
+        'expiresAt': int(time.time()) + IMPORT_JOB_TTL_SECONDS
+    }
+    try:
+        storage.put(job, IF_NOT_EXISTS)
+        return job
+    except ConditionFailed:
+        job = storage.get(job_key(bucket, key, etag))
+        return {**job, **{name: int(job[name]) for name in JOB_COUNTERS}}
+
+# Salva il checkpoint solo se nessun'altra invocazione lo ha aggiornato nel frattempo
+# (consegne ripetute della notifica S3): solleva ConditionFailed altrimenti
+def save_job(storage, job):
+    previous_version = job['version']
+    job['version'] = previous_version + 1
+    storage.put(job, if_absent_or_equals('version', previous_version))
+
+def report_key(job, segment):
+    return f"{IMPORT_REPORT_PREFIX}{job['objectKey']}/{job['etag']}/rejected-{segment:05d}.csv"
+
+def write_report(job, segment, rejects):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['row', 'error', *job['header']])
+    for row_number, error, values in rejects:
+        writer.writerow([row_number, error, *values])
+    get_s3().put_object(
+        Bucket=job['bucket'], Key=report_key(job, segment),
+        Body=buffer.getvalue().encode('utf-8'), ContentType='text/csv'
+    )
+
+# Normalizza, valida e scrive un segmento: restituisce (importati, già presenti, scartati).
+# I numeri di riga del report contano le righe di dati dopo l'intestazione
+def process_segment(job, rows, columns, first_row_number, executor):
+    rejects = []
+    candidates = {}
+    for row_number, values in enumerate(rows, first_row_number):
+        if not any(cell.strip() for cell in values):
+            continue
+        user_data, error = normalize_row(values, columns)
+        if not error and user_data['email'] in candidates:
+            error = "Email duplicata nel file"
+        if error:
+            rejects.append((row_number, error, values))
+            continue
+        user = gymUsersHandler.build_user_item(user_data)
+        user['userId'] = import_user_id(job, row_number)
+        if user_data.get('joinDate'):
+            user['createdAt'] = f"{user_data['joinDate']}T00:00:00"
+        candidates[user['email']] = (row_number, values, user)
+
+    # Email già registrate: se la sentinella appartiene allo userId della riga il membro
+    # è stato scritto da un'invocazione precedente interrotta prima del checkpoint
+    skipped = 0
+    existing = gymUsersHandler.batch_get_with_retry(
+        [gymUsersHandler.email_key(email) for email in candidates], fields=['userId', 'ownerId']
+    )
+    for item in existing:
+        row_number, values, user = candidates.pop(item['userId'][len(gymUsersHandler.EMAIL_KEY_PREFIX):])
+        if item.get('ownerId') == user['userId']:
+            skipped += 1
+        else:
+            rejects.append((row_number, "Un utente con questa email esiste già", values))
+
+    users = [user for _, _, user in candidates.values()]
+    chunk_size = max(1, -(-len(users) // IMPORT_WORKERS))
+    chunks = [users[start:start + chunk_size] for start in range(0, len(users), chunk_size)]
+    failed_ids = set().union(*executor.map(gymUsersHandler.write_members_batch, chunks))
+    for row_number, values, user in candidates.values():
+        if user['userId'] in failed_ids:
+            rejects.append((row_number, "Scrittura non completata", values))
+
+    if rejects:
+        rejects.sort(key=lambda reject: reject[0])
+        write_report(job, job['segments'], rejects)
+    return len(users) - len(failed_ids), skipped, len(rejects)
+
+# Riprende l'importazione in una nuova invocazione asincrona della stessa Lambda
+def reinvoke(context, job):
+    awsClients.get_client('lambda').invoke(
+        FunctionName=context.function_name,
+        InvocationType='Event',
+        Payload=json.dumps({'importJob': {
+            'bucket': job['bucket'], 'key': job['objectKey'], 'etag': job['etag']
+        }}).encode()
+    )
+
+def time_is_short(context):
+    return context is not None and context.get_remaining_time_in_millis() < IMPORT_TIME_MARGIN_MS
+
+# Importa (o riprende) un file: restituisce il checkpoint aggiornato
+def run_import(bucket, key, etag, context=None):
+    storage = gymUsersHandler.get_storage()
+    job = load_or_create_job(storage, bucket, key, etag)
+    if job['jobStatus'] != 'running':
+        logger.info("Import %s already %s", job['userId'], job['jobStatus'])
+        return job
+
+    # IfMatch: se il file è stato sostituito la ripresa fallisce invece di leggere l'altro
+    params = {'Bucket': bucket, 'Key': key, 'IfMatch': f'"{etag}"'}
+    if job['offset']:
+        params['Range'] = f"bytes={job['offset']}-"
+    body = get_s3().get_object(**params)['Body']
+    lines = ByteCountingLines(body.iter_chunks(READ_CHUNK_SIZE), job['offset'])
+    line_iterator = iter(lines)
+
+    try:
+        if job['header'] is None:
+            first_line = next(line_iterator, '').lstrip('\ufeff')
+            job['delimiter'] = ';' if first_line.count(';') > first_line.count(',') else ','
+            job['header'] = next(csv.reader([first_line], delimiter=job['delimiter']), [])
+            job['offset'] = lines.offset
+        columns = map_columns(job['header'])
+    except ValueError as e:
+        job.update(jobStatus='failed', error=str(e), completedAt=datetime.datetime.utcnow().isoformat())
+        save_job(storage, job)
+        logger.error("Import %s failed: %s", job['userId'], e)
+        return job
+
+    reader = csv.reader(line_iterator, delimiter=job['delimiter'])
+    with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as executor:
+        while True:
+            if time_is_short(context):
+                job['invocations'] += 1
+                save_job(storage, job)
+                reinvoke(context, job)
+                logger.info("Import %s paused at byte %d, resuming in a new invocation",
+                            job['userId'], job['offset'])
+                return job
+
+            rows = list(itertools.islice(reader, IMPORT_SEGMENT_ROWS))
+            if not rows and lines.offset == job['offset']:
+                break
+            imported, skipped, rejected = process_segment(job, rows, columns, job['rowsRead'] + 1, executor)
+            job['offset'] = lines.offset
+            job['rowsRead'] += len(rows)
+            job['imported'] += imported
+            job['skipped'] += skipped
+            job['rejected'] += rejected
+            job['segments'] += 1
+            save_job(storage, job)
+            logger.info("Import %s: segment %d, %d imported, %d rejected",
+                        job['userId'], job['segments'], imported, rejected)
+
+    job.update(jobStatus='completed', completedAt=datetime.datetime.utcnow().isoformat())
+    save_job(storage, job)
+    get_s3().put_object(
+        Bucket=bucket, Key=f"{IMPORT_REPORT_PREFIX}{key}/{etag}/summary.json",
+        Body=json.dumps({'status': job['jobStatus'], **{name: job[name] for name in (
+            'objectKey', 'etag', 'rowsRead', 'imported', 'skipped', 'rejected',
+            'segments', 'invocations', 'createdAt', 'completedAt'
+        )}}, default=str).encode('utf-8'),
+        ContentType='application/json'
+    )
+    logger.info("Import %s completed: %d rows, %d imported, %d rejected",
+                job['userId'], job['rowsRead'], job['imported'], job['rejected'])
+    return job
+
+# Handler Lambda: notifica S3 (ObjectCreated) oppure ripresa di un'importazione
+def handler(event, context):
+    if 'importJob' in event:
+        jobs = [event['importJob']]
+    else:
+        jobs = []
+        for record in event.get('Records', []):
+            key = unquote_plus(record['s3']['object']['key'])
+            if not key.startswith(IMPORT_PREFIX) or not key.lower().endswith('.csv'):
+                logger.info("Ignoring object %s", key)
+                continue
+            jobs.append({
+                'bucket': record['s3']['bucket']['name'],
+                'key': key,
+                'etag': record['s3']['object'].get('eTag')
+            })
+
+    results = []
+    for job in jobs:
+        etag = job.get('etag') or get_s3().head_object(Bucket=job['bucket'], Key=job['key'])['ETag']
+        try:
+            result = run_import(job['bucket'], job['key'], etag.strip('"'), context)
+        except ConditionFailed:
+            # Un'altra invocazione ha aggiornato il checkpoint: prosegue quella
+            logger.info("Import of %s is being processed by another invocation", job['key'])
+            continue
+        results.append({
+            'objectKey': result['objectKey'],
+            'status': result['jobStatus'],
+            'imported': result['imported'],
+            'rejected': result['rejected']
+        })
+    return {'imports': results}
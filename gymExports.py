@@ -0,0 +1,277 @@
+"""
+Esportazione completa dei membri su S3 in NDJSON o CSV
+Le righe arrivano da un generatore (le pagine della scansione) e vengono caricate con un
+upload multipart a parti di EXPORT_PART_SIZE byte: la memoria usata è quella di una parte,
+qualunque sia il numero di membri. Lo stato del job è un elemento di servizio della tabella
+(EXPORT#<id>, recordType EXPORT) e a fine job si scarica il file con un URL prefirmato.
+S3_ENDPOINT_URL permette di usare MinIO o un altro S3 locale.
+"""
+
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from decimal import Decimal
+
+import awsClients
+import gymStorage
+from gymStorage import IF_NOT_EXISTS
+
+logger = logging.getLogger()
+
+TABLE_NAME = "gymcloudUsers"
+EXPORT_KEY_PREFIX = "EXPORT#"
+EXPORT_BUCKET = os.environ.get('EXPORT_BUCKET', 'gymcloud-exports')
+EXPORT_PREFIX = os.environ.get('EXPORT_PREFIX', 'exports/')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+
+# async: il job gira in una invocazione asincrona della stessa Lambda; inline: nella
+# richiesta (test e S3 locale). Fuori da Lambda il job gira sempre inline
+EXPORT_MODE = os.environ.get('EXPORT_MODE', 'async')
+
+# S3 accetta parti di almeno 5 MB (tranne l'ultima)
+MIN_PART_SIZE = 5 * 1024 * 1024
+EXPORT_PART_SIZE = max(int(os.environ.get('EXPORT_PART_SIZE', str(8 * 1024 * 1024))), MIN_PART_SIZE)
+EXPORT_SCAN_PAGE_SIZE = int(os.environ.get('EXPORT_SCAN_PAGE_SIZE', '1000'))
+EXPORT_URL_EXPIRES_SECONDS = int(os.environ.get('EXPORT_URL_EXPIRES_SECONDS', '3600'))
+
+# I job restano consultabili per una settimana, poi li elimina il TTL della tabella
+EXPORT_JOB_TTL_SECONDS = 7 * 24 * 3600
+
+# Formato -> (Content-Type, estensione)
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv')
+}
+
+def get_storage():
+    return gymStorage.get_backend(TABLE_NAME, 'userId')
+
+def get_s3():
+    return awsClients.get_client('s3', endpoint_url=S3_ENDPOINT_URL)
+
+# I numeri letti da DynamoDB sono Decimal: interi se possibile, altrimenti float
+def json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+def ndjson_chunks(rows, fields):
+    for row in rows:
+        record = {field: row[field] for field in fields if field in row}
+        yield (json.dumps(record, default=json_default, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+# Caratteri iniziali che un foglio di calcolo interpreta come formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+LINE_BREAKS_REGEX = re.compile(r'\s*[\r\n]+\s*')
+
+# Valore di una cella CSV: gli oggetti annidati (indirizzo, contatti) diventano JSON. I testi
+# scritti dai membri finiscono in fogli di calcolo: un valore che inizia come una formula è
+# preceduto da un apostrofo, che lo fa leggere come testo, e gli a capo diventano spazi
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list, set)):
+        return json.dumps(value, default=json_default, ensure_ascii=False, separators=(',', ':'))
+    if isinstance(value, Decimal):
+        return json_default(value)
+    if isinstance(value, str):
+        text = LINE_BREAKS_REGEX.sub(' ', value)
+        return "'" + text if value.startswith(FORMULA_PREFIXES) else text
+    return value
+
+def csv_chunks(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([csv_value(row.get(field)) for field in fields])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+ENCODERS = {'ndjson': ndjson_chunks, 'csv': csv_chunks}
+
+class MultipartUpload:
+    """
+    Upload multipart verso S3 alimentato a blocchi: una parte viene inviata appena il
+    buffer raggiunge part_size, quindi in memoria c'è al massimo una parte. Usato come
+    context manager: se il blocco solleva un'eccezione l'upload viene annullato
+
+    Args:
+        s3: client S3
+        bucket (str): bucket di destinazione
+        key (str): chiave dell'oggetto
+        content_type (str): Content-Type dell'oggetto
+        part_size (int): dimensione delle parti in byte
+    """
+    def __init__(self, s3, bucket, key, content_type, part_size=EXPORT_PART_SIZE):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size
+        self.upload_id = None
+        self.parts = []
+        self.buffer = bytearray()
+        self.bytes_written = 0
+
+    def __enter__(self):
+        self.upload_id = self.s3.create_multipart_upload(
+            Bucket=self.bucket, Key=self.key, ContentType=self.content_type
+        )['UploadId']
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+            return False
+        self.complete()
+        return False
+
+    def write(self, data):
+        self.buffer += data
+        self.bytes_written += len(data)
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+
+    def _upload_part(self):
+        part_number = len(self.parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=bytes(self.buffer)
+        )
+        self.parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+        self.buffer = bytearray()
+
+    def complete(self):
+        # L'ultima parte può essere più piccola del minimo (anche vuota se non ci sono righe)
+        if self.buffer or not self.parts:
+            self._upload_part()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            MultipartUpload={'Parts': self.parts}
+        )
+
+    def abort(self):
+        try:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        except Exception as e:
+            logger.error("Abort of multipart upload %s failed: %s", self.key, e)
+
+def job_key(export_id):
+    return {'userId': EXPORT_KEY_PREFIX + export_id}
+
+# Crea l'elemento del job in stato queued. Lo stato è in jobStatus e non in status: status e
+# createdAt sono le chiavi di status-createdAt-index, e il job finirebbe tra i membri di GET /users?status=
+def create_job(export_format, fields):
+    export_id = uuid.uuid4().hex
+    now = datetime.datetime.utcnow().isoformat()
+    job = {
+        **job_key(export_id),
+        'recordType': 'EXPORT',
+        'exportId': export_id,
+        'jobStatus': 'queued',
+        'format': export_format,
+        'fields': list(fields),
+        's3Key': f"{EXPORT_PREFIX}{now[:10]}/members-{export_id}.{FORMATS[export_format][1]}",
+        'createdAt': now,
+        'expiresAt': int(time.time()) + EXPORT_JOB_TTL_SECONDS
+    }
+    get_storage().put(job, IF_NOT_EXISTS)
+    return job
+
+def get_job(export_id):
+    job = get_storage().get(job_key(export_id))
+    if job is None or job.get('recordType') != 'EXPORT':
+        return None
+    return job
+
+def update_job(export_id, **values):
+    get_storage().update(job_key(export_id), values)
+
+# Avvia il job in una invocazione asincrona della Lambda corrente
+def start_job(export_id):
+    awsClients.get_client('lambda').invoke(
+        FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+        InvocationType='Event',
+        Payload=json.dumps({'exportJob': export_id}).encode()
+    )
+
+def runs_inline():
+    return EXPORT_MODE == 'inline' or not os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
+
+# Conta le righe mentre passano al codificatore
+def counting(rows, counter):
+    for row in rows:
+        counter[0] += 1
+        yield row
+
+# Esegue il job: scan_members(fields) restituisce il generatore delle righe. Un job già
+# completato non viene rieseguito (le invocazioni asincrone possono essere ripetute);
+# un errore chiude il job in stato failed senza rilanciare, così Lambda non lo ripete
+def run_job(export_id, scan_members):
+    job = get_job(export_id)
+    if job is None:
+        logger.error("Export job %s not found", export_id)
+        return None
+    if job['jobStatus'] == 'completed':
+        return job
+
+    started_at = datetime.datetime.utcnow().isoformat()
+    update_job(export_id, jobStatus='running', startedAt=started_at)
+    counter = [0]
+    try:
+        upload = MultipartUpload(get_s3(), EXPORT_BUCKET, job['s3Key'], FORMATS[job['format']][0])
+        with upload:
+            rows = counting(scan_members(job['fields']), counter)
+            for chunk in ENCODERS[job['format']](rows, job['fields']):
+                upload.write(chunk)
+        values = {
+            'jobStatus': 'completed',
+            'rows': counter[0],
+            'bytes': upload.bytes_written,
+            'parts': len(upload.parts),
+            'completedAt': datetime.datetime.utcnow().isoformat()
+        }
+    except Exception as e:
+        logger.error("Export job %s failed: %s", export_id, e, exc_info=True)
+        values = {'jobStatus': 'failed', 'error': str(e), 'completedAt': datetime.datetime.utcnow().isoformat()}
+    update_job(export_id, **values)
+    return {**job, 'startedAt': started_at, **values}
+
+# URL prefirmato per scaricare il file di un job completato
+def download_url(job):
+    filename = job['s3Key'].rsplit('/', 1)[-1]
+    return get_s3().generate_presigned_url('get_object', Params={
+        'Bucket': EXPORT_BUCKET,
+        'Key': job['s3Key'],
+        'ResponseContentDisposition': f'attachment; filename="{filename}"'
+    }, ExpiresIn=EXPORT_URL_EXPIRES_SECONDS)
+
+# Job nel formato di risposta di POST /exports e GET /exports/{id}; l'URL viene firmato a
+# ogni lettura, quindi resta valido EXPORT_URL_EXPIRES_SECONDS dalla richiesta
+def format_job(job):
+    formatted = {
+        'exportId': job['exportId'],
+        'status': job['jobStatus'],
+        'format': job['format'],
+        'fields': job['fields'],
+        'createdAt': job['createdAt']
+    }
+    for name in ('startedAt', 'completedAt', 'rows', 'bytes', 'error'):
+        if name in job:
+            formatted[name] = json_default(job[name]) if isinstance(job[name], Decimal) else job[name]
+    if job['jobStatus'] == 'completed':
+        formatted['downloadUrl'] = download_url(job)
+        formatted['downloadUrlExpiresIn'] = EXPORT_URL_EXPIRES_SECONDS
+    return formatted
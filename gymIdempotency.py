@@ -0,0 +1,128 @@
+"""
+Chiavi di idempotenza (header Idempotency-Key) per le richieste di creazione
+La prima risposta per una chiave viene salvata nella tabella gymcloudIdempotency, con TTL
+su expiresAt: una richiesta ripetuta dal client o da API Gateway dopo un timeout riceve la
+risposta salvata con una sola GetItem, senza validazione né scritture sulla tabella dei membri.
+La chiave è legata all'impronta della richiesta (metodo, route e corpo): riusarla con un
+corpo diverso è un errore del client. Mentre la prima richiesta è in corso la chiave resta
+bloccata per IDEMPOTENCY_LOCK_SECONDS; se l'invocazione si interrompe, scaduto il blocco
+la richiesta può essere rieseguita.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+import gymStorage
+from gymStorage import ConditionFailed, IF_NOT_EXISTS, if_absent_or_equals
+
+logger = logging.getLogger()
+
+IDEMPOTENCY_TABLE = os.environ.get('IDEMPOTENCY_TABLE', 'gymcloudIdempotency')
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+
+# Deve superare la durata massima di una richiesta (29 s con API Gateway)
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', '60'))
+
+# Caratteri ASCII stampabili senza spazi (UUID, ULID, token casuali)
+KEY_REGEX = re.compile(r'^[\x21-\x7e]{1,255}$')
+
+REPLAY_HEADER = 'Idempotent-Replayed'
+
+# Esiti di claim
+ACQUIRED = 'acquired'
+REPLAY = 'replay'
+IN_PROGRESS = 'in_progress'
+MISMATCH = 'mismatch'
+
+def get_storage():
+    return gymStorage.get_backend(IDEMPOTENCY_TABLE, 'idempotencyKey')
+
+def is_valid_key(key):
+    return bool(KEY_REGEX.match(key))
+
+def record_key(key):
+    return {'idempotencyKey': key}
+
+# Impronta della richiesta: il corpo è serializzato con chiavi ordinate, quindi spazi e
+# ordine dei campi non contano
+def fingerprint(method, route, body):
+    canonical = json.dumps([method, route, body], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+# Il TTL di DynamoDB elimina gli elementi con ritardo: un record scaduto o un blocco
+# abbandonato valgono come chiave libera
+def is_stale(record, now):
+    if int(record['expiresAt']) <= now:
+        return True
+    return record['status'] == IN_PROGRESS and int(record['lockedUntil']) <= now
+
+def classify(record, request_fingerprint):
+    if record['fingerprint'] != request_fingerprint:
+        return MISMATCH
+    return REPLAY if record['status'] == 'completed' else IN_PROGRESS
+
+# Prenota la chiave per la richiesta: restituisce (esito, record). Con ACQUIRED il
+# chiamante esegue la richiesta e poi chiama complete o release con il record ricevuto
+def claim(key, request_fingerprint):
+    storage = get_storage()
+    now = int(time.time())
+    current = storage.get(record_key(key))
+    if current is not None and not is_stale(current, now):
+        return classify(current, request_fingerprint), current
+
+    record = {
+        **record_key(key),
+        'status': IN_PROGRESS,
+        'fingerprint': request_fingerprint,
+        'lockedUntil': now + IDEMPOTENCY_LOCK_SECONDS,
+        'createdAt': datetime.datetime.utcnow().isoformat(),
+        'expiresAt': now + IDEMPOTENCY_TTL_SECONDS
+    }
+    # Un record scaduto si sostituisce solo se nessun'altra richiesta lo ha già fatto
+    condition = IF_NOT_EXISTS if current is None else if_absent_or_equals('lockedUntil', current['lockedUntil'])
+    try:
+        storage.put(record, condition)
+    except ConditionFailed:
+        # Un'altra richiesta con la stessa chiave è arrivata prima
+        current = storage.get(record_key(key))
+        if current is None:
+            return IN_PROGRESS, None
+        return classify(current, request_fingerprint), current
+    return ACQUIRED, record
+
+# Salva la risposta; se nel frattempo il blocco è scaduto e un'altra richiesta ha
+# preso la chiave, la sua risposta ha la precedenza
+def complete(record, response):
+    completed = {**record, 'status': 'completed', 'response': json.dumps(response, separators=(',', ':'))}
+    try:
+        get_storage().put(completed, if_absent_or_equals('lockedUntil', record['lockedUntil']))
+    except ConditionFailed:
+        logger.warning("Idempotency key %s was taken over before completion", record['idempotencyKey'])
+
+# Libera la chiave dopo un errore del server, così la richiesta ripetuta viene rieseguita
+def release(record):
+    try:
+        get_storage().delete(record_key(record['idempotencyKey']),
+                             if_absent_or_equals('lockedUntil', record['lockedUntil']))
+    except ConditionFailed:
+        pass
+    except Exception as e:
+        logger.error("Release of idempotency key %s failed: %s", record['idempotencyKey'], e)
+
+# Risposta salvata, con l'header che segnala la ripetizione
+def replay(record):
+    response = json.loads(record['response'])
+    response['headers'] = {**response.get('headers', {}), REPLAY_HEADER: 'true'}
+    return response
+
+# Secondi che il client dovrebbe attendere prima di riprovare una richiesta in corso
+def retry_after(record, now=None):
+    if record is None:
+        return 1
+    now = int(time.time()) if now is None else now
+    return max(1, min(int(record['lockedUntil']) - now, IDEMPOTENCY_LOCK_SECONDS))
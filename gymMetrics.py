@@ -0,0 +1,149 @@
+"""
+Metriche per richiesta di gymUsersHandler in CloudWatch Embedded Metric Format (EMF)
+Tempi delle fasi (routing, validazione, storage, serializzazione), numero di chiamate allo
+storage e capacità DynamoDB consumata, scritti come una riga JSON su stdout a fine richiesta:
+CloudWatch Logs li estrae come metriche senza chiamate API aggiuntive.
+METRICS_MODE: emf (default in Lambda), off (nessun costo per richiesta, default fuori da Lambda)
+oppure local (documenti in memoria).
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Fuori da Lambda (test, benchmark, script) le righe EMF finirebbero solo su stdout
+METRICS_MODE = os.environ.get('METRICS_MODE', 'emf' if os.environ.get('AWS_LAMBDA_FUNCTION_NAME') else 'off')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'GymUsersApp')
+PHASES = ('routing', 'validation', 'storage', 'serialization')
+
+class RequestMetrics:
+    """
+    Misure di una singola invocazione. Lo storage può essere chiamato dai thread di
+    parallel_scan, quindi gli accumulatori sono protetti da un lock
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self.storage_calls = 0
+        self.storage_operations = {}
+        self.consumed_capacity = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.phase_seconds[name] += elapsed
+
+    def record_storage_call(self, operation, seconds, capacity):
+        with self._lock:
+            self.phase_seconds['storage'] += seconds
+            self.storage_calls += 1
+            self.storage_operations[operation] = self.storage_operations.get(operation, 0) + 1
+            self.consumed_capacity += capacity
+
+    # Documento EMF: le metriche hanno la route come dimensione, il resto sono proprietà
+    # ricercabili con Logs Insights (non diventano metriche, quindi non costano)
+    def to_emf(self, route, status_code, request_id=None):
+        total_ms = (time.perf_counter() - self.started) * 1000
+        values = {
+            'TotalMs': round(total_ms, 3),
+            **{f'{name.capitalize()}Ms': round(seconds * 1000, 3) for name, seconds in self.phase_seconds.items()},
+            'StorageCalls': self.storage_calls,
+            'ConsumedCapacity': round(self.consumed_capacity, 2)
+        }
+        units = {name: 'Count' if name in ('StorageCalls', 'ConsumedCapacity') else 'Milliseconds'
+                 for name in values}
+        return {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['Route']],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, unit in units.items()]
+                }]
+            },
+            'Route': route or 'unknown',
+            **values,
+            'StatusCode': status_code,
+            'StorageOperations': self.storage_operations,
+            'requestId': request_id
+        }
+
+class EmfEmitter:
+    """Scrive il documento su stdout: in Lambda ogni riga finisce in CloudWatch Logs"""
+    enabled = True
+
+    def emit(self, document):
+        print(json.dumps(document, separators=(',', ':'), default=str), flush=True)
+
+class NullEmitter:
+    """Nessuna misura e nessun output"""
+    enabled = False
+
+    def emit(self, document):
+        pass
+
+class LocalSink:
+    """Conserva i documenti in memoria (test e benchmark)"""
+    enabled = True
+
+    def __init__(self):
+        self.documents = []
+
+    def emit(self, document):
+        self.documents.append(document)
+
+    def clear(self):
+        self.documents.clear()
+
+def create_emitter(mode):
+    if mode == 'emf':
+        return EmfEmitter()
+    if mode == 'off':
+        return NullEmitter()
+    if mode == 'local':
+        return LocalSink()
+    raise ValueError(f"METRICS_MODE non valido: {mode} (valori ammessi: emf, off, local)")
+
+_emitter = create_emitter(METRICS_MODE)
+_current = None
+
+def get_emitter():
+    return _emitter
+
+def set_emitter(emitter):
+    global _emitter
+    _emitter = emitter
+
+# Inizia le misure di una invocazione (None se le metriche sono disattivate). Una Lambda
+# gestisce una richiesta alla volta per container, quindi basta una richiesta corrente
+def start_request():
+    global _current
+    _current = RequestMetrics() if _emitter.enabled else None
+    return _current
+
+# Chiude le misure della richiesta corrente e le emette
+def finish_request(route, status_code, request_id=None):
+    global _current
+    metrics, _current = _current, None
+    if metrics is not None:
+        _emitter.emit(metrics.to_emf(route, status_code, request_id))
+
+_disabled_phase = nullcontext()
+
+def phase(name):
+    metrics = _current
+    return metrics.phase(name) if metrics is not None else _disabled_phase
+
+# Osservatore per gymStorage.set_observer
+def record_storage_call(operation, seconds, capacity):
+    metrics = _current
+    if metrics is not None:
+        metrics.record_storage_call(operation, seconds, capacity)
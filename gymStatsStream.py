@@ -0,0 +1,185 @@
+"""
+Consumer dello stream DynamoDB della tabella gymcloudUsers
+Mantiene i rollup per giorno, settimana ISO e mese di iscrizioni, cancellazioni e tipi di
+abbonamento, così GET /stats/timeseries legge pochi elementi invece dei membri. I rollup
+sono elementi di servizio della stessa tabella (recordType ROLLUP).
+
+Lo stream consegna ogni record almeno una volta: il marcatore EVENT#<eventID> viene scritto
+con condizione nella stessa transazione degli incrementi, quindi un record ripetuto non
+viene contato due volte. I marcatori scadono con il TTL della tabella (attributo expiresAt).
+"""
+
+import datetime
+import logging
+import os
+import time
+
+import gymStorage
+from gymStorage import ConditionFailed, IF_NOT_EXISTS
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+TABLE_NAME = "gymcloudUsers"
+ROLLUP_KEY_PREFIX = "ROLLUP#"
+EVENT_KEY_PREFIX = "EVENT#"
+GRANULARITIES = ('day', 'week', 'month')
+
+# Tipi di abbonamento contati per nome: gli altri valori (elementi precedenti alla validazione)
+# finiscono in type_other, così un valore arbitrario non aggiunge attributi agli elementi aggregati
+MEMBERSHIP_TYPES = ('monthly', 'quarterly', 'yearly', 'basic', 'premium')
+OTHER_MEMBERSHIP_TYPE = 'other'
+
+# Lo stream conserva i record per 24 ore: i marcatori devono sopravvivere almeno altrettanto
+EVENT_MARKER_TTL_SECONDS = int(os.environ.get('EVENT_MARKER_TTL_SECONDS', str(2 * 24 * 3600)))
+
+# Una transazione accetta 100 operazioni: per ogni record un marcatore e al massimo tre rollup
+RECORDS_PER_TRANSACTION = 25
+
+def get_storage():
+    return gymStorage.get_backend(TABLE_NAME, 'userId')
+
+# Periodo (etichetta e data di inizio) che contiene la data per la granularità richiesta
+def period_of(date, granularity):
+    if granularity == 'day':
+        return date.isoformat(), date
+    if granularity == 'week':
+        iso_year, iso_week, _ = date.isocalendar()
+        return f"{iso_year}-W{iso_week:02d}", date - datetime.timedelta(days=date.weekday())
+    if granularity == 'month':
+        return date.strftime('%Y-%m'), date.replace(day=1)
+    raise ValueError(f"Granularità non valida: {granularity}")
+
+# Periodi consecutivi dal periodo che contiene start a quello che contiene end
+def periods_between(start, end, granularity):
+    periods = []
+    period, period_start = period_of(start, granularity)
+    while period_start <= end:
+        periods.append((period, period_start))
+        if granularity == 'day':
+            next_start = period_start + datetime.timedelta(days=1)
+        elif granularity == 'week':
+            next_start = period_start + datetime.timedelta(weeks=1)
+        else:
+            next_start = (period_start + datetime.timedelta(days=32)).replace(day=1)
+        period, period_start = period_of(next_start, granularity)
+    return periods
+
+def counted_membership_type(membership_type):
+    return membership_type if membership_type in MEMBERSHIP_TYPES else OTHER_MEMBERSHIP_TYPE
+
+def rollup_key(granularity, period):
+    return {'userId': f"{ROLLUP_KEY_PREFIX}{granularity.upper()}#{period}"}
+
+# Valore stringa di un attributo di un'immagine dello stream (formato DynamoDB JSON)
+def image_string(image, name):
+    return (image.get(name) or {}).get('S')
+
+# Data del record: createdAt per le iscrizioni, ora della modifica per le cancellazioni
+def record_date(record, image):
+    if record['eventName'] == 'INSERT':
+        created_at = image_string(image, 'createdAt')
+        if created_at:
+            try:
+                return datetime.date.fromisoformat(created_at[:10])
+            except ValueError:
+                pass
+    approximate = record['dynamodb'].get('ApproximateCreationDateTime', time.time())
+    return datetime.datetime.fromtimestamp(float(approximate), datetime.timezone.utc).date()
+
+# Variazioni dei rollup causate da un record: (data, variazioni) oppure None per i record
+# da ignorare (elementi di servizio, compresi rollup e marcatori scritti da questo consumer,
+# e modifiche, che non cambiano iscrizioni né tipo di abbonamento). Le immagini sono nel
+# formato compatto di gymCodec: membershipType e createdAt sono chiavi degli indici e non
+# vengono mai omessi né rinominati, quindi si leggono senza decodifica
+def record_deltas(record):
+    if record.get('eventName') == 'INSERT':
+        image = record['dynamodb'].get('NewImage') or {}
+        prefix, counter = 'type_', 'signups'
+    elif record.get('eventName') == 'REMOVE':
+        image = record['dynamodb'].get('OldImage') or {}
+        prefix, counter = 'deletedType_', 'deletions'
+    else:
+        return None
+    if not image or 'recordType' in image:
+        return None
+    membership_type = counted_membership_type(image_string(image, 'membershipType') or 'basic')
+    return record_date(record, image), {counter: 1, prefix + membership_type: 1}
+
+# Aggiornamenti dei rollup per più record: le variazioni sono sommate per periodo, perché
+# una transazione non può contenere due operazioni sullo stesso elemento
+def rollup_operations(dated_deltas):
+    rollups = {}
+    for date, deltas in dated_deltas:
+        for granularity in GRANULARITIES:
+            period, period_start = period_of(date, granularity)
+            rollup = rollups.setdefault((granularity, period), {
+                'update': rollup_key(granularity, period),
+                'set': {
+                    'recordType': 'ROLLUP',
+                    'granularity': granularity,
+                    'period': period,
+                    'periodStart': period_start.isoformat()
+                },
+                'add': {}
+            })
+            for name, delta in deltas.items():
+                rollup['add'][name] = rollup['add'].get(name, 0) + delta
+    return list(rollups.values())
+
+def event_marker(event_id):
+    return {
+        'put': {
+            'userId': EVENT_KEY_PREFIX + event_id,
+            'recordType': 'EVENT',
+            'expiresAt': int(time.time()) + EVENT_MARKER_TTL_SECONDS
+        },
+        'condition': IF_NOT_EXISTS
+    }
+
+# Applica i record in una transazione: solleva ConditionFailed se uno è già stato applicato
+def apply_records(storage, entries):
+    operations = [event_marker(record['eventID']) for record, _ in entries]
+    operations.extend(rollup_operations([dated_deltas for _, dated_deltas in entries]))
+    storage.transact(operations)
+
+# Applica un blocco di record con una sola transazione; se contiene record già applicati
+# (consegna ripetuta) li riapplica uno alla volta saltando i duplicati. Restituisce il
+# record da cui riprendere in caso di errore, altrimenti None
+def process_chunk(storage, entries):
+    try:
+        apply_records(storage, entries)
+        return None
+    except ConditionFailed:
+        pass
+    except Exception as e:
+        logger.error("Stream chunk failed: %s", e)
+        return entries[0][0]
+
+    for record, dated_deltas in entries:
+        try:
+            apply_records(storage, [(record, dated_deltas)])
+        except ConditionFailed:
+            logger.info("Skipping already applied stream record %s", record['eventID'])
+        except Exception as e:
+            logger.error("Stream record %s failed: %s", record['eventID'], e)
+            return record
+    return None
+
+# Handler Lambda per l'event source mapping con ReportBatchItemFailures: in caso di errore
+# restituisce il primo record non applicato e Lambda riprende lo shard da quel record
+def handler(event, context):
+    entries = []
+    for record in event.get('Records', []):
+        dated_deltas = record_deltas(record)
+        if dated_deltas is not None:
+            entries.append((record, dated_deltas))
+
+    storage = get_storage()
+    for start in range(0, len(entries), RECORDS_PER_TRANSACTION):
+        failed = process_chunk(storage, entries[start:start + RECORDS_PER_TRANSACTION])
+        if failed is not None:
+            return {'batchItemFailures': [{'itemIdentifier': failed['dynamodb']['SequenceNumber']}]}
+
+    logger.info("Applied %d of %d stream records", len(entries), len(event.get('Records', [])))
+    return {'batchItemFailures': []}
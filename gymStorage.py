@@ -0,0 +1,819 @@
+"""
+Backend di archiviazione per gymUsersHandler
+Interfaccia comune (get, put, delete, update, query, scan, batch, transazioni) con tre
+implementazioni: DynamoDB, in memoria (thread-safe) e SQLite, con la stessa semantica
+di indici, condizioni e paginazione. Il backend si sceglie con STORAGE_BACKEND.
+"""
+
+import bisect
+import copy
+import functools
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from decimal import Decimal
+
+import awsClients
+
+# Indici secondari globali: nome -> (chiave di partizione, chiave di ordinamento).
+# Un elemento è nell'indice solo se ha entrambi gli attributi come stringhe (indici sparsi)
+INDEXES = {
+    'status-createdAt-index': ('status', 'createdAt'),
+    'membershipType-createdAt-index': ('membershipType', 'createdAt'),
+    'listPartition-createdAt-index': ('listPartition', 'createdAt'),
+}
+
+# Tentativi di una scrittura DynamoDB annullata per conflitto con una transazione
+CONFLICT_MAX_ATTEMPTS = int(os.environ.get('CONFLICT_MAX_ATTEMPTS', '6'))
+
+# Valore dei filtri per "attributo assente" (attribute_not_exists)
+MISSING = object()
+
+# Condizioni di scrittura
+IF_NOT_EXISTS = ('not_exists',)
+IF_EXISTS = ('exists',)
+
+def if_absent_or_equals(attribute, value):
+    """Condizione: l'elemento non esiste oppure attribute == value"""
+    return ('absent_or_equals', attribute, value)
+
+class ConditionFailed(Exception):
+    """
+    Condizione di scrittura non soddisfatta
+
+    Args:
+        index (int): posizione dell'operazione fallita in una transazione (None fuori transazione)
+    """
+    def __init__(self, index=None):
+        super().__init__(f"Condizione non soddisfatta (operazione {index})")
+        self.index = index
+
+def matches_filters(item, filters):
+    for attribute, expected in (filters or {}).items():
+        if expected is MISSING:
+            if attribute in item:
+                return False
+        elif item.get(attribute, MISSING) != expected:
+            return False
+    return True
+
+def project(item, fields):
+    if not fields:
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+def condition_holds(condition, current):
+    if condition is None:
+        return True
+    kind = condition[0]
+    if kind == 'not_exists':
+        return current is None
+    if kind == 'exists':
+        return current is not None
+    if kind == 'absent_or_equals':
+        return current is None or current.get(condition[1]) == condition[2]
+    raise ValueError(f"Condizione sconosciuta: {kind}")
+
+def apply_update(item, set_values, add_values):
+    for attribute, value in (set_values or {}).items():
+        item[attribute] = value
+    for attribute, delta in (add_values or {}).items():
+        item[attribute] = item.get(attribute, 0) + delta
+    return item
+
+def scan_segment_of(key_value, total_segments):
+    return zlib.crc32(str(key_value).encode()) % total_segments
+
+# Osservatore delle chiamate allo storage (metriche): riceve nome dell'operazione, durata in
+# secondi e capacità consumata (solo DynamoDB). Le chiamate avvengono anche dai thread di scan
+_observer = None
+
+def set_observer(observer):
+    global _observer
+    _observer = observer
+
+def notify_call(operation, started, capacity=0.0):
+    if _observer is not None:
+        _observer(operation, time.perf_counter() - started, capacity)
+
+# Decoratore per i backend locali: ogni chiamata viene notificata all'osservatore
+def observed(operation):
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                notify_call(operation, started)
+        return wrapper
+    return decorator
+
+# Unità di capacità consumate da una risposta DynamoDB (ConsumedCapacity è una lista per
+# le operazioni batch e transazionali)
+def consumed_capacity(response):
+    consumed = (response or {}).get('ConsumedCapacity')
+    if consumed is None:
+        return 0.0
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return float(sum(entry.get('CapacityUnits', 0) for entry in consumed))
+
+class StorageBackend:
+    """
+    Interfaccia dei backend. Le chiavi sono dizionari {key_name: valore}; le pagine
+    restituiscono (elementi, last_key) dove last_key va ripassato come start_key.
+    Come in DynamoDB, limit conta gli elementi letti prima dei filtri.
+    """
+    name = 'base'
+
+    def __init__(self, key_name='userId'):
+        self.key_name = key_name
+
+    def warm_up(self):
+        """Prepara connessioni e client in anticipo (fase di init della Lambda)"""
+
+    def get(self, key, fields=None):
+        """Restituisce l'elemento o None"""
+        raise NotImplementedError
+
+    def put(self, item, condition=None):
+        """Scrive l'elemento; solleva ConditionFailed se la condizione non è soddisfatta"""
+        raise NotImplementedError
+
+    def delete(self, key, condition=None):
+        raise NotImplementedError
+
+    def update(self, key, set_values=None, add_values=None, condition=None):
+        """SET e ADD atomici; crea l'elemento se non esiste (come UpdateItem)"""
+        raise NotImplementedError
+
+    def query(self, index, key_value, filters=None, fields=None, limit=None, start_key=None, forward=True):
+        """Pagina di un indice, ordinata per chiave di ordinamento"""
+        raise NotImplementedError
+
+    def scan(self, filters=None, fields=None, limit=None, start_key=None, segment=None, total_segments=None):
+        """Pagina della tabella, opzionalmente di un solo segmento"""
+        raise NotImplementedError
+
+    def batch_get(self, keys, fields=None):
+        """Restituisce (elementi trovati, chiavi non elaborate da ripetere)"""
+        raise NotImplementedError
+
+    def batch_write(self, puts=(), deletes=()):
+        """Scritture non condizionali; restituisce (put, delete) non elaborati da ripetere"""
+        raise NotImplementedError
+
+    def transact(self, operations):
+        """
+        Esegue atomicamente una lista di operazioni:
+        {'put': item}, {'delete': key} o {'update': key, 'set': {...}, 'add': {...}},
+        ognuna con 'condition' opzionale. Solleva ConditionFailed(index) senza scrivere nulla.
+        """
+        raise NotImplementedError
+
+# =====================
+# DYNAMODB
+# =====================
+
+class DynamoDBBackend(StorageBackend):
+    name = 'dynamodb'
+
+    def __init__(self, table_name, key_name='userId', region=None, endpoint_url=None):
+        super().__init__(key_name)
+        self.table_name = table_name
+        self.region = region or awsClients.DYNAMODB_REGION
+        self.endpoint_url = endpoint_url or os.environ.get('DYNAMODB_ENDPOINT_URL') or None
+        self._table = None
+        self._lock = threading.Lock()
+
+    # Import di boto3 e creazione della resource alla prima operazione (cold start)
+    @property
+    def table(self):
+        if self._table is None:
+            with self._lock:
+                if self._table is None:
+                    resource = awsClients.get_resource('dynamodb', self.region, self.endpoint_url)
+                    self._table = resource.Table(self.table_name)
+        return self._table
+
+    def warm_up(self):
+        self.table
+
+    # Il client della resource è thread-safe e accetta i tipi Python come la Table
+    @property
+    def client(self):
+        return self.table.meta.client
+
+    @staticmethod
+    def _client_error_code(error):
+        return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+    def _condition(self, condition, names, values):
+        if condition is None:
+            return None
+        names['#key'] = self.key_name
+        kind = condition[0]
+        if kind == 'not_exists':
+            return "attribute_not_exists(#key)"
+        if kind == 'exists':
+            return "attribute_exists(#key)"
+        if kind == 'absent_or_equals':
+            names['#condition'] = condition[1]
+            values[':condition'] = condition[2]
+            return "attribute_not_exists(#key) OR #condition = :condition"
+        raise ValueError(f"Condizione sconosciuta: {kind}")
+
+    @staticmethod
+    def _filters(filters, names, values):
+        clauses = []
+        for index, (attribute, expected) in enumerate((filters or {}).items()):
+            names[f'#f{index}'] = attribute
+            if expected is MISSING:
+                clauses.append(f"attribute_not_exists(#f{index})")
+            else:
+                values[f':f{index}'] = expected
+                clauses.append(f"#f{index} = :f{index}")
+        return ' AND '.join(clauses) or None
+
+    @staticmethod
+    def _projection(fields, names):
+        if not fields:
+            return None
+        placeholders = []
+        for index, field in enumerate(fields):
+            names[f'#p{index}'] = field
+            placeholders.append(f'#p{index}')
+        return ', '.join(placeholders)
+
+    @staticmethod
+    def _expression_params(params, names, values, **expressions):
+        for name, expression in expressions.items():
+            if expression:
+                params[name] = expression
+        if names:
+            params['ExpressionAttributeNames'] = names
+        if values:
+            params['ExpressionAttributeValues'] = values
+        return params
+
+    def _write_params(self, condition):
+        names, values = {}, {}
+        expression = self._condition(condition, names, values)
+        return self._expression_params({}, names, values, ConditionExpression=expression)
+
+    def _update_params(self, key, set_values, add_values, condition):
+        names, values = {}, {}
+        set_parts, add_parts = [], []
+        for index, (attribute, value) in enumerate(sorted((set_values or {}).items())):
+            names[f'#s{index}'] = attribute
+            values[f':s{index}'] = value
+            set_parts.append(f'#s{index} = :s{index}')
+        for index, (attribute, delta) in enumerate(sorted((add_values or {}).items())):
+            names[f'#a{index}'] = attribute
+            values[f':a{index}'] = delta
+            add_parts.append(f'#a{index} :a{index}')
+        expression = ' '.join(part for part in (
+            'SET ' + ', '.join(set_parts) if set_parts else '',
+            'ADD ' + ', '.join(add_parts) if add_parts else ''
+        ) if part)
+        condition_expression = self._condition(condition, names, values)
+        return self._expression_params({'Key': key, 'UpdateExpression': expression}, names, values,
+                                       ConditionExpression=condition_expression)
+
+    # Chiamata DynamoDB con capacità consumata richiesta e notificata all'osservatore
+    def _call(self, name, operation, **params):
+        started = time.perf_counter()
+        response = None
+        try:
+            response = operation(ReturnConsumedCapacity='TOTAL', **params)
+            return response
+        finally:
+            notify_call(name, started, consumed_capacity(response))
+
+    @staticmethod
+    def _cancellation_codes(error):
+        return [reason.get('Code', 'None') for reason in error.response.get('CancellationReasons', [])]
+
+    # Ogni scrittura di un membro aggiorna anche STATS#GLOBAL: un'operazione su un elemento
+    # coinvolto in un'altra transazione viene annullata (TransactionConflict) e botocore non
+    # la ripete. L'operazione annullata non ha scritto nulla, quindi si ripete con backoff
+    def _retry_conflicts(self, operation):
+        from botocore.exceptions import ClientError
+        for attempt in range(CONFLICT_MAX_ATTEMPTS):
+            if attempt:
+                time.sleep(random.uniform(0, min(1.0, 0.025 * (2 ** attempt))))
+            try:
+                return operation()
+            except ClientError as e:
+                code = self._client_error_code(e)
+                if code == 'TransactionCanceledException':
+                    codes = self._cancellation_codes(e)
+                    conflict = 'TransactionConflict' in codes and 'ConditionalCheckFailed' not in codes
+                else:
+                    conflict = code == 'TransactionConflictException'
+                if not conflict or attempt == CONFLICT_MAX_ATTEMPTS - 1:
+                    raise
+
+    def _conditional(self, name, operation, **params):
+        from botocore.exceptions import ClientError
+        try:
+            return self._retry_conflicts(lambda: self._call(name, operation, **params))
+        except ClientError as e:
+            if self._client_error_code(e) == 'ConditionalCheckFailedException':
+                raise ConditionFailed()
+            raise
+
+    def get(self, key, fields=None):
+        names = {}
+        params = self._expression_params({'Key': key}, names, {},
+                                         ProjectionExpression=self._projection(fields, names))
+        return self._call('GetItem', self.table.get_item, **params).get('Item')
+
+    def put(self, item, condition=None):
+        self._conditional('PutItem', self.table.put_item, Item=item, **self._write_params(condition))
+
+    def delete(self, key, condition=None):
+        self._conditional('DeleteItem', self.table.delete_item, Key=key, **self._write_params(condition))
+
+    def update(self, key, set_values=None, add_values=None, condition=None):
+        self._conditional('UpdateItem', self.table.update_item,
+                          **self._update_params(key, set_values, add_values, condition))
+
+    def query(self, index, key_value, filters=None, fields=None, limit=None, start_key=None, forward=True):
+        names = {'#hash': INDEXES[index][0]}
+        values = {':hash': key_value}
+        params = {'TableName': self.table_name, 'IndexName': index, 'ScanIndexForward': forward}
+        if limit:
+            params['Limit'] = limit
+        if start_key:
+            params['ExclusiveStartKey'] = start_key
+        self._expression_params(params, names, values,
+                                KeyConditionExpression="#hash = :hash",
+                                FilterExpression=self._filters(filters, names, values),
+                                ProjectionExpression=self._projection(fields, names))
+        response = self._call('Query', self.client.query, **params)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+
+    def scan(self, filters=None, fields=None, limit=None, start_key=None, segment=None, total_segments=None):
+        names, values = {}, {}
+        params = {'TableName': self.table_name}
+        if limit:
+            params['Limit'] = limit
+        if start_key:
+            params['ExclusiveStartKey'] = start_key
+        if total_segments:
+            params['Segment'] = segment
+            params['TotalSegments'] = total_segments
+        self._expression_params(params, names, values,
+                                FilterExpression=self._filters(filters, names, values),
+                                ProjectionExpression=self._projection(fields, names))
+        response = self._call('Scan', self.client.scan, **params)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+
+    def batch_get(self, keys, fields=None):
+        if not keys:
+            return [], []
+        names = {}
+        request = {'Keys': list(keys)}
+        projection = self._projection(fields, names)
+        if projection:
+            request['ProjectionExpression'] = projection
+            request['ExpressionAttributeNames'] = names
+        response = self._call('BatchGetItem', self.client.batch_get_item, RequestItems={self.table_name: request})
+        items = response.get('Responses', {}).get(self.table_name, [])
+        unprocessed = response.get('UnprocessedKeys', {}).get(self.table_name, {}).get('Keys', [])
+        return items, unprocessed
+
+    def batch_write(self, puts=(), deletes=()):
+        requests = [{'PutRequest': {'Item': item}} for item in puts]
+        requests += [{'DeleteRequest': {'Key': key}} for key in deletes]
+        if not requests:
+            return [], []
+        response = self._call('BatchWriteItem', self.client.batch_write_item,
+                              RequestItems={self.table_name: requests})
+        unprocessed = response.get('UnprocessedItems', {}).get(self.table_name, [])
+        return ([request['PutRequest']['Item'] for request in unprocessed if 'PutRequest' in request],
+                [request['DeleteRequest']['Key'] for request in unprocessed if 'DeleteRequest' in request])
+
+    def transact(self, operations):
+        from botocore.exceptions import ClientError
+        transact_items = []
+        for operation in operations:
+            condition = operation.get('condition')
+            if 'put' in operation:
+                transact_items.append({'Put': {'TableName': self.table_name, 'Item': operation['put'],
+                                               **self._write_params(condition)}})
+            elif 'delete' in operation:
+                transact_items.append({'Delete': {'TableName': self.table_name, 'Key': operation['delete'],
+                                                  **self._write_params(condition)}})
+            else:
+                transact_items.append({'Update': {'TableName': self.table_name, **self._update_params(
+                    operation['update'], operation.get('set'), operation.get('add'), condition)}})
+        try:
+            self._retry_conflicts(lambda: self._call('TransactWriteItems', self.client.transact_write_items,
+                                                     TransactItems=transact_items))
+        except ClientError as e:
+            if self._client_error_code(e) != 'TransactionCanceledException':
+                raise
+            codes = self._cancellation_codes(e)
+            if 'ConditionalCheckFailed' in codes:
+                raise ConditionFailed(codes.index('ConditionalCheckFailed'))
+            raise
+
+# =====================
+# IN MEMORIA
+# =====================
+
+class MemoryBackend(StorageBackend):
+    """
+    Backend in memoria thread-safe, per benchmark e test offline. Le chiavi ordinate e le
+    partizioni degli indici sono liste ordinate aggiornate a ogni scrittura
+    """
+    name = 'memory'
+
+    def __init__(self, key_name='userId'):
+        super().__init__(key_name)
+        self._items = {}
+        self._lock = threading.RLock()
+        self._sorted_keys = None
+        self._index_entries = {}
+
+    def _index_membership(self, item):
+        for index, (hash_attribute, range_attribute) in INDEXES.items():
+            hash_value, range_value = item.get(hash_attribute), item.get(range_attribute)
+            if isinstance(hash_value, str) and isinstance(range_value, str):
+                yield (index, hash_value), (range_value, item[self.key_name])
+
+    # Aggiorna elementi, chiavi ordinate e partizioni degli indici già costruite
+    # (le altre vengono costruite alla prima query)
+    def _store(self, key_value, item):
+        previous = self._items.get(key_value)
+        if previous is not None:
+            for partition, entry in self._index_membership(previous):
+                entries = self._index_entries.get(partition)
+                if entries is not None:
+                    position = bisect.bisect_left(entries, entry)
+                    if position < len(entries) and entries[position] == entry:
+                        del entries[position]
+        if item is None:
+            self._items.pop(key_value, None)
+            if previous is not None and self._sorted_keys is not None:
+                del self._sorted_keys[bisect.bisect_left(self._sorted_keys, key_value)]
+            return
+        self._items[key_value] = item
+        if previous is None and self._sorted_keys is not None:
+            bisect.insort(self._sorted_keys, key_value)
+        for partition, entry in self._index_membership(item):
+            entries = self._index_entries.get(partition)
+            if entries is not None:
+                bisect.insort(entries, entry)
+
+    def _keys(self):
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self._items)
+        return self._sorted_keys
+
+    def _entries(self, index, hash_value):
+        partition = (index, hash_value)
+        entries = self._index_entries.get(partition)
+        if entries is None:
+            hash_attribute, range_attribute = INDEXES[index]
+            entries = sorted(
+                (item[range_attribute], key_value) for key_value, item in self._items.items()
+                if item.get(hash_attribute) == hash_value and isinstance(item.get(range_attribute), str)
+            )
+            self._index_entries[partition] = entries
+        return entries
+
+    def _current(self, key):
+        return self._items.get(key[self.key_name])
+
+    @observed('GetItem')
+    def get(self, key, fields=None):
+        with self._lock:
+            item = self._current(key)
+            return copy.deepcopy(project(item, fields)) if item is not None else None
+
+    @observed('PutItem')
+    def put(self, item, condition=None):
+        with self._lock:
+            if not condition_holds(condition, self._current(item)):
+                raise ConditionFailed()
+            self._store(item[self.key_name], copy.deepcopy(item))
+
+    @observed('DeleteItem')
+    def delete(self, key, condition=None):
+        with self._lock:
+            if not condition_holds(condition, self._current(key)):
+                raise ConditionFailed()
+            if key[self.key_name] in self._items:
+                self._store(key[self.key_name], None)
+
+    @observed('UpdateItem')
+    def update(self, key, set_values=None, add_values=None, condition=None):
+        with self._lock:
+            current = self._current(key)
+            if not condition_holds(condition, current):
+                raise ConditionFailed()
+            item = copy.deepcopy(current) if current is not None else dict(key)
+            self._store(key[self.key_name], apply_update(item, set_values, add_values))
+
+    def _page(self, candidates, filters, fields, limit, last_key_of):
+        items, evaluated, last_key = [], 0, None
+        for key_value in candidates:
+            item = self._items[key_value]
+            evaluated += 1
+            if matches_filters(item, filters):
+                items.append(copy.deepcopy(project(item, fields)))
+            if limit and evaluated >= limit:
+                last_key = last_key_of(key_value)
+                break
+        else:
+            return items, None
+        return items, last_key
+
+    # Le pagine scorrono le liste ordinate per posizione, senza copiarle
+    @observed('Query')
+    def query(self, index, key_value, filters=None, fields=None, limit=None, start_key=None, forward=True):
+        hash_attribute, range_attribute = INDEXES[index]
+        with self._lock:
+            entries = self._entries(index, key_value)
+            start = (start_key[range_attribute], start_key[self.key_name]) if start_key else None
+            if forward:
+                positions = range(bisect.bisect_right(entries, start) if start else 0, len(entries))
+                final = entries[-1] if entries else None
+            else:
+                positions = range((bisect.bisect_left(entries, start) if start else len(entries)) - 1, -1, -1)
+                final = entries[0] if entries else None
+            items, last_key = self._page(
+                (entries[position][1] for position in positions), filters, fields, limit,
+                lambda last: {self.key_name: last, hash_attribute: key_value,
+                              range_attribute: self._items[last][range_attribute]}
+            )
+            # Come DynamoDB non restituisce last_key quando la pagina arriva alla fine
+            if last_key and final[1] == last_key[self.key_name]:
+                last_key = None
+            return items, last_key
+
+    @observed('Scan')
+    def scan(self, filters=None, fields=None, limit=None, start_key=None, segment=None, total_segments=None):
+        with self._lock:
+            keys = self._keys()
+            positions = range(bisect.bisect_right(keys, start_key[self.key_name]) if start_key else 0, len(keys))
+            candidates = (keys[position] for position in positions
+                          if not total_segments or scan_segment_of(keys[position], total_segments) == segment)
+            items, last_key = self._page(candidates, filters, fields, limit,
+                                         lambda last: {self.key_name: last})
+            if last_key and keys[-1] == last_key[self.key_name]:
+                last_key = None
+            return items, last_key
+
+    @observed('BatchGetItem')
+    def batch_get(self, keys, fields=None):
+        with self._lock:
+            items = [copy.deepcopy(project(self._current(key), fields)) for key in keys
+                     if self._current(key) is not None]
+            return items, []
+
+    @observed('BatchWriteItem')
+    def batch_write(self, puts=(), deletes=()):
+        with self._lock:
+            for item in puts:
+                self._store(item[self.key_name], copy.deepcopy(item))
+            for key in deletes:
+                if key[self.key_name] in self._items:
+                    self._store(key[self.key_name], None)
+            return [], []
+
+    @observed('TransactWriteItems')
+    def transact(self, operations):
+        with self._lock:
+            for index, operation in enumerate(operations):
+                key = operation.get('put') or operation.get('delete') or operation.get('update')
+                if not condition_holds(operation.get('condition'), self._current(key)):
+                    raise ConditionFailed(index)
+            for operation in operations:
+                if 'put' in operation:
+                    self._store(operation['put'][self.key_name], copy.deepcopy(operation['put']))
+                elif 'delete' in operation:
+                    if self._current(operation['delete']) is not None:
+                        self._store(operation['delete'][self.key_name], None)
+                else:
+                    current = self._current(operation['update'])
+                    item = copy.deepcopy(current) if current is not None else dict(operation['update'])
+                    self._store(operation['update'][self.key_name],
+                                apply_update(item, operation.get('set'), operation.get('add')))
+
+# =====================
+# SQLITE
+# =====================
+
+def _encode_json(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Tipo non serializzabile: {type(value).__name__}")
+
+class SQLiteBackend(StorageBackend):
+    """
+    Backend SQLite: una riga per elemento (JSON) con una colonna per ogni attributo
+    usato come chiave di indice, valorizzata solo per le stringhe (indici sparsi)
+    """
+    name = 'sqlite'
+
+    def __init__(self, table_name, key_name='userId', path=None):
+        super().__init__(key_name)
+        self.table_name = table_name
+        self.path = path or os.environ.get('SQLITE_PATH', 'gym_storage.sqlite3')
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.create_function('scan_segment', 2, scan_segment_of, deterministic=True)
+        self._index_columns = sorted({attribute for pair in INDEXES.values() for attribute in pair})
+        self._table_sql = '"' + table_name.replace('"', '') + '"'
+        columns = ''.join(f', "a_{attribute}" TEXT' for attribute in self._index_columns)
+        with self._lock:
+            self._connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {self._table_sql} (pk TEXT PRIMARY KEY, data TEXT NOT NULL{columns})')
+            for index, (hash_attribute, range_attribute) in INDEXES.items():
+                self._connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{table_name}_{index}" ON {self._table_sql} '
+                    f'("a_{hash_attribute}", "a_{range_attribute}", pk)')
+
+    def _row_values(self, item):
+        values = [str(item[self.key_name]), json.dumps(item, default=_encode_json)]
+        for attribute in self._index_columns:
+            value = item.get(attribute)
+            values.append(value if isinstance(value, str) else None)
+        return values
+
+    def _load(self, data):
+        return json.loads(data)
+
+    def _current(self, key):
+        row = self._connection.execute(
+            f'SELECT data FROM {self._table_sql} WHERE pk = ?', (str(key[self.key_name]),)).fetchone()
+        return self._load(row[0]) if row else None
+
+    def _write(self, item):
+        placeholders = ', '.join('?' * (2 + len(self._index_columns)))
+        self._connection.execute(f'INSERT OR REPLACE INTO {self._table_sql} VALUES ({placeholders})',
+                                 self._row_values(item))
+
+    def _remove(self, key):
+        self._connection.execute(f'DELETE FROM {self._table_sql} WHERE pk = ?', (str(key[self.key_name]),))
+
+    def _transaction(self, apply):
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                result = apply()
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+            return result
+
+    @observed('GetItem')
+    def get(self, key, fields=None):
+        with self._lock:
+            item = self._current(key)
+            return project(item, fields) if item is not None else None
+
+    @observed('PutItem')
+    def put(self, item, condition=None):
+        def apply():
+            if not condition_holds(condition, self._current(item)):
+                raise ConditionFailed()
+            self._write(item)
+        self._transaction(apply)
+
+    @observed('DeleteItem')
+    def delete(self, key, condition=None):
+        def apply():
+            if not condition_holds(condition, self._current(key)):
+                raise ConditionFailed()
+            self._remove(key)
+        self._transaction(apply)
+
+    @observed('UpdateItem')
+    def update(self, key, set_values=None, add_values=None, condition=None):
+        def apply():
+            current = self._current(key)
+            if not condition_holds(condition, current):
+                raise ConditionFailed()
+            self._write(apply_update(current if current is not None else dict(key), set_values, add_values))
+        self._transaction(apply)
+
+    def _page(self, sql, params, filters, fields, limit, last_key_of):
+        if limit:
+            sql += ' LIMIT ?'
+            params = list(params) + [limit + 1]
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        more = bool(limit) and len(rows) > limit
+        rows = rows[:limit] if limit else rows
+        items = []
+        for row in rows:
+            item = self._load(row[-1])
+            if matches_filters(item, filters):
+                items.append(project(item, fields))
+        return items, last_key_of(rows[-1]) if more else None
+
+    @observed('Query')
+    def query(self, index, key_value, filters=None, fields=None, limit=None, start_key=None, forward=True):
+        hash_attribute, range_attribute = INDEXES[index]
+        range_column = f'"a_{range_attribute}"'
+        sql = (f'SELECT pk, {range_column}, data FROM {self._table_sql} '
+               f'WHERE "a_{hash_attribute}" = ? AND {range_column} IS NOT NULL')
+        params = [key_value]
+        if start_key:
+            sql += f' AND ({range_column}, pk) {">" if forward else "<"} (?, ?)'
+            params += [start_key[range_attribute], str(start_key[self.key_name])]
+        direction = 'ASC' if forward else 'DESC'
+        sql += f' ORDER BY {range_column} {direction}, pk {direction}'
+        return self._page(sql, params, filters, fields, limit,
+                          lambda row: {self.key_name: row[0], hash_attribute: key_value, range_attribute: row[1]})
+
+    @observed('Scan')
+    def scan(self, filters=None, fields=None, limit=None, start_key=None, segment=None, total_segments=None):
+        sql = f'SELECT pk, data FROM {self._table_sql} WHERE 1 = 1'
+        params = []
+        if start_key:
+            sql += ' AND pk > ?'
+            params.append(str(start_key[self.key_name]))
+        if total_segments:
+            sql += ' AND scan_segment(pk, ?) = ?'
+            params += [total_segments, segment]
+        sql += ' ORDER BY pk'
+        return self._page(sql, params, filters, fields, limit, lambda row: {self.key_name: row[0]})
+
+    @observed('BatchGetItem')
+    def batch_get(self, keys, fields=None):
+        with self._lock:
+            items = [self._current(key) for key in keys]
+        return [project(item, fields) for item in items if item is not None], []
+
+    @observed('BatchWriteItem')
+    def batch_write(self, puts=(), deletes=()):
+        def apply():
+            for item in puts:
+                self._write(item)
+            for key in deletes:
+                self._remove(key)
+        self._transaction(apply)
+        return [], []
+
+    @observed('TransactWriteItems')
+    def transact(self, operations):
+        def apply():
+            for index, operation in enumerate(operations):
+                key = operation.get('put') or operation.get('delete') or operation.get('update')
+                if not condition_holds(operation.get('condition'), self._current(key)):
+                    raise ConditionFailed(index)
+            for operation in operations:
+                if 'put' in operation:
+                    self._write(operation['put'])
+                elif 'delete' in operation:
+                    self._remove(operation['delete'])
+                else:
+                    current = self._current(operation['update'])
+                    self._write(apply_update(current if current is not None else dict(operation['update']),
+                                             operation.get('set'), operation.get('add')))
+        self._transaction(apply)
+
+# =====================
+# CONFIGURAZIONE
+# =====================
+
+BACKENDS = ('dynamodb', 'memory', 'sqlite')
+_backends = {}
+_backends_lock = threading.Lock()
+
+def create_backend(kind, table_name, key_name='userId'):
+    if kind == 'dynamodb':
+        return DynamoDBBackend(table_name, key_name)
+    if kind == 'memory':
+        return MemoryBackend(key_name)
+    if kind == 'sqlite':
+        return SQLiteBackend(table_name, key_name)
+    raise ValueError(f"STORAGE_BACKEND non valido: {kind} (valori ammessi: {', '.join(BACKENDS)})")
+
+def get_backend(table_name, key_name='userId'):
+    """Backend condiviso per la tabella, del tipo indicato da STORAGE_BACKEND (default dynamodb)"""
+    kind = os.environ.get('STORAGE_BACKEND', 'dynamodb')
+    with _backends_lock:
+        backend = _backends.get((kind, table_name))
+        if backend is None:
+            backend = _backends[(kind, table_name)] = create_backend(kind, table_name, key_name)
+        return backend
+
+def reset_backends():
+    """Dimentica i backend creati (per ripartire da dati vuoti nei benchmark)"""
+    with _backends_lock:
+        _backends.clear()
@@ -2,31 +2,321 @@ import json
 import os
 import re
 import uuid
+import base64
+import gzip
+import hashlib
+import hmac
 import datetime
 import logging
-import boto3
-from botocore.exceptions import ClientError
+import random
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import gymCodec
+import gymExports
+import gymIdempotency
+import gymMetrics
+import gymStatsStream
+import gymStorage
+from gymStorage import ConditionFailed, IF_EXISTS, IF_NOT_EXISTS, MISSING, if_absent_or_equals
 
-# Configura il logger
+# Configura il logger: una riga JSON compatta per richiesta; i payload completi
+# (con i dati personali oscurati) solo per una frazione campionata delle richieste
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0'))
+REDACTED_FIELDS = {'name', 'fullname', 'firstname', 'lastname', 'email', 'phone', 'birthdate', 'address',
+                   'emergencycontact', 'medicalinfo', 'authorization', 'x-admin-token', 'cookie'}
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(LOG_LEVEL)
 
-# Configura il client DynamoDB
+# Archiviazione dei membri (gymStorage): DynamoDB in produzione, in memoria o SQLite per
+# benchmark e test offline (STORAGE_BACKEND), con i client AWS condivisi di awsClients.
+# Import di boto3 e creazione della resource sono la parte più lenta del cold start, quindi
+# avvengono alla prima richiesta che usa la tabella; con EAGER_INIT=1 vengono invece
+# eseguiti durante la fase di init della Lambda
 TABLE_NAME = "gymcloudUsers"
-dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
-table = dynamodb.Table(TABLE_NAME)
+
+# Espressioni regolari compilate una sola volta al caricamento del modulo
+EMAIL_REGEX = re.compile(r'^[^\s@]+@[^\s@]+\.[^\s@]+$')
+PHONE_REGEX = re.compile(r'^(\+39)?[0-9]{10}$')
+WHITESPACE_REGEX = re.compile(r'\s+')
+SLASHES_REGEX = re.compile(r'/+')
+GROUP_SEPARATORS_REGEX = re.compile(r'[\s,\[\]]+')
+
+# Elementi di servizio salvati nella stessa tabella dei membri: hanno sempre
+# l'attributo recordType, che i membri non hanno
+EMAIL_KEY_PREFIX = "EMAIL#"
+MEMBER_FILTERS = {'recordType': MISSING}
+
+# Contatori aggregati per GET /stats, aggiornati da ogni scrittura
+STATS_KEY = {'userId': "STATS#GLOBAL"}
+# Nuovi iscritti del giorno (newMembersToday): un elemento per giorno UTC, eliminato dal TTL
+# della tabella, così STATS#GLOBAL resta di dimensione fissa
+STATS_DAY_KEY_PREFIX = "STATS#DAY#"
+STATS_DAY_TTL_SECONDS = 3 * 24 * 3600
+MEMBERSHIP_TYPES = list(gymStatsStream.MEMBERSHIP_TYPES)
+
+# Serie storiche di GET /stats/timeseries dai rollup mantenuti da gymStatsStream;
+# senza from si restituiscono gli ultimi TIMESERIES_DEFAULT_PERIODS periodi
+TIMESERIES_DEFAULT_PERIODS = {'day': 30, 'week': 12, 'month': 12}
+TIMESERIES_PERIOD_DAYS = {'day': 1, 'week': 7, 'month': 31}
+TIMESERIES_MAX_POINTS = 400
+
+# Proiezione dei campi nelle liste (GET /users?fields=...): solo i campi ammessi;
+# senza fields si restituiscono i campi della vista elenco, senza dati medici e di contatto
+MEMBER_FIELDS = [
+    'userId', 'firstName', 'lastName', 'fullName', 'email', 'phone', 'membershipType',
+    'membershipStartDate', 'membershipEndDate', 'status', 'isActive', 'createdAt', 'updatedAt',
+    'birthDate', 'goal', 'address', 'emergencyContact', 'medicalInfo'
+]
+DEFAULT_LIST_FIELDS = [
+    field for field in MEMBER_FIELDS if field not in ('address', 'emergencyContact', 'medicalInfo')
+]
+# GET /users/{id}: senza include=details mancano i campi dell'elemento DETAILS (gymCodec)
+MEMBER_INCLUDES = ('details',)
+HOT_MEMBER_FIELDS = [field for field in MEMBER_FIELDS if field not in gymCodec.DETAIL_FIELDS]
+
+# Indici secondari globali (definiti in testDynamoDB.create_dynamodb_table) per i filtri
+# di GET /users: chiave di partizione sul campo filtrato, ordinamento per createdAt
+STATUS_INDEX = "status-createdAt-index"
+MEMBERSHIP_TYPE_INDEX = "membershipType-createdAt-index"
+MAX_FILTER_VALUE_LENGTH = 64
+
+# Indice sparso per l'elenco non filtrato e l'ordinamento per data di iscrizione (GET /users,
+# GET /users?sort=-createdAt): solo i membri hanno listPartition, con un valore costante,
+# quindi l'indice contiene tutti e soli i membri ordinati per createdAt
+CREATED_AT_INDEX = "listPartition-createdAt-index"
+MEMBER_LIST_PARTITION = "MEMBERS"
+SORT_OPTIONS = {'createdAt': True, '-createdAt': False}
+
+# Parallelismo delle scansioni complete (segmenti DynamoDB e thread)
+SCAN_SEGMENTS = int(os.environ.get('SCAN_SEGMENTS', '4'))
+
+# Import massivo (POST /users/batch)
+MAX_BATCH_IMPORT = int(os.environ.get('MAX_BATCH_IMPORT', '500'))
+BATCH_WRITE_SIZE = 25
+BATCH_GET_SIZE = 100
+BATCH_MAX_ATTEMPTS = 6
+
+# Cache delle risposte in lettura nei container caldi. Ogni container ha la sua copia:
+# le scritture svuotano subito quella del container che le esegue; negli altri le chiavi
+# includono dataVersion, quindi una scrittura rende inutilizzabili le voci precedenti
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '10'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '64'))
+_response_cache = OrderedDict()
+_cache_lock = threading.Lock()
+cache_counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+# Compressione delle risposte negoziata con Accept-Encoding (brotli solo se il modulo è
+# presente nel pacchetto). Con API REST (v1) serve binaryMediaTypes "*/*" sull'API
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+_brotli = None
+
+# Token per le operazioni amministrative (header X-Admin-Token)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# Paginazione di GET /users
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '100'))
+
+# Chiave per firmare i cursori di paginazione: va configurata uguale su tutti i container,
+# altrimenti un cursore emesso da un container non è valido sugli altri. In Lambda è
+# obbligatoria (la imposta testApiGatway.create_lambda_function); gli script locali che
+# importano il modulo senza servire l'API usano una chiave casuale
+CURSOR_SECRET = os.environ.get('CURSOR_SECRET', '').encode()
+if not CURSOR_SECRET:
+    if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+        raise RuntimeError("CURSOR_SECRET non configurato")
+    logger.warning("CURSOR_SECRET non configurato: uso una chiave casuale per questo processo")
+    CURSOR_SECRET = os.urandom(32)
+
+# Valore serializzato in JSON solo quando il record di log viene effettivamente scritto;
+# accetta anche una funzione, per rimandare pure la costruzione del valore
+class LazyJson:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        value = self.value() if callable(self.value) else self.value
+        return json.dumps(value, default=str, separators=(',', ':'), ensure_ascii=False)
+
+# Copia del valore con i campi personali oscurati (il corpo JSON della richiesta viene decodificato)
+def redact(value, key=None):
+    if key is not None and key.lower() in REDACTED_FIELDS:
+        return '***'
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    if key == 'body' and isinstance(value, str):
+        try:
+            return redact(json.loads(value))
+        except ValueError:
+            return '<%d bytes>' % len(value)
+    return value
+
+# Backend della tabella dei membri, condiviso tra le richieste del container
+def get_storage():
+    return gymStorage.get_backend(TABLE_NAME, 'userId')
+
+# Ogni chiamata allo storage entra nelle metriche EMF della richiesta corrente (gymMetrics)
+gymStorage.set_observer(gymMetrics.record_storage_call)
+
+if os.environ.get('EAGER_INIT') == '1':
+    get_storage().warm_up()
 
 # Funzione helper per risposte CORS
-def create_response(status_code, body):
+def create_response(status_code, body, headers=None):
+    with gymMetrics.phase('serialization'):
+        body = json.dumps(body, default=str)  # default=str gestisce oggetti come datetime
     return {
         'statusCode': status_code,
         'headers': {
             "Content-Type": "application/json",
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Methods": "GET,POST,PUT,DELETE,OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type,Authorization,X-Amz-Date,X-Api-Key,X-Amz-Security-Token",
+            "Access-Control-Allow-Headers": "Content-Type,Authorization,X-Amz-Date,X-Api-Key,X-Amz-Security-Token,X-Admin-Token,If-None-Match,Idempotency-Key",
+            "Access-Control-Expose-Headers": "ETag,X-Cache,Idempotent-Replayed",
+            **(headers or {}),
         },
-        'body': json.dumps(body, default=str),  # default=str gestisce oggetti come datetime
+        'body': body,
+    }
+
+# Legge un header della richiesta senza distinzione tra maiuscole e minuscole
+def get_header(event, name):
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+# Richiesta amministrativa: token condiviso oppure gruppo Cognito "admin". I claim sono in
+# authorizer.claims (REST API v1) o in authorizer.jwt.claims (HTTP API v2); authorizer è
+# null se la route non ha autorizzazione
+def is_admin_request(event):
+    token = get_header(event, 'X-Admin-Token')
+    if ADMIN_TOKEN and token and hmac.compare_digest(token, ADMIN_TOKEN):
+        return True
+    authorizer = (event.get('requestContext') or {}).get('authorizer') or {}
+    claims = authorizer.get('claims') or (authorizer.get('jwt') or {}).get('claims') or {}
+    groups = claims.get('cognito:groups', '')
+    # Nei JWT di HTTP API i gruppi arrivano come "[admin staff]" invece che "admin,staff"
+    if isinstance(groups, (list, tuple)):
+        groups = ','.join(groups)
+    return 'admin' in GROUP_SEPARATORS_REGEX.split(str(groups))
+
+# Restituisce la risposta in cache per la chiave oppure la produce e la memorizza
+# (solo le risposte 200), con scadenza TTL ed eliminazione LRU oltre CACHE_MAX_ENTRIES
+def cached_response(key, produce):
+    if CACHE_TTL_SECONDS <= 0:
+        return produce()
+
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _response_cache.get(key)
+        if entry is not None:
+            expires, response = entry
+            if now < expires:
+                _response_cache.move_to_end(key)
+                cache_counters['hits'] += 1
+                return {**response, 'headers': {**response['headers'], 'X-Cache': 'HIT'}}
+            del _response_cache[key]
+            cache_counters['expirations'] += 1
+        cache_counters['misses'] += 1
+
+    response = produce()
+    if response['statusCode'] != 200:
+        return response
+
+    with _cache_lock:
+        _response_cache[key] = (time.monotonic() + CACHE_TTL_SECONDS, response)
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > CACHE_MAX_ENTRIES:
+            _response_cache.popitem(last=False)
+            cache_counters['evictions'] += 1
+    return {**response, 'headers': {**response['headers'], 'X-Cache': 'MISS'}}
+
+# Svuota la cache dopo una scrittura
+def invalidate_cache():
+    with _cache_lock:
+        _response_cache.clear()
+        cache_counters['invalidations'] += 1
+
+# GET /cache/stats - Contatori della cache del container che risponde
+def get_cache_stats():
+    with _cache_lock:
+        entries = len(_response_cache)
+        counters = dict(cache_counters)
+    lookups = counters['hits'] + counters['misses']
+    return create_response(200, {
+        "success": True,
+        "cache": {
+            **counters,
+            "entries": entries,
+            "maxEntries": CACHE_MAX_ENTRIES,
+            "ttlSeconds": CACHE_TTL_SECONDS,
+            "hitRate": round(counters['hits'] / lookups, 4) if lookups else None
+        }
+    })
+
+# Modulo brotli, importato alla prima richiesta che lo accetta (False se non disponibile)
+def get_brotli():
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli
+
+# Sceglie la codifica da Accept-Encoding in base ai valori q (None = nessuna compressione)
+def choose_encoding(accept_encoding):
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[token.strip().lower()] = weight
+    wildcard = weights.get('*', 0.0)
+    candidates = (['br'] if get_brotli() else []) + ['gzip']
+    best = max(candidates, key=lambda encoding: weights.get(encoding, wildcard))
+    return best if weights.get(best, wildcard) > 0 else None
+
+# Comprime il corpo della risposta se il client lo accetta e supera la soglia;
+# il corpo compresso viene restituito in base64 con isBase64Encoded (v1 e v2)
+def compress_response(response, accept_encoding):
+    body = response.get('body')
+    if not COMPRESSION_ENABLED or not body or response.get('isBase64Encoded'):
+        return response
+    headers = {**response['headers'], 'Vary': 'Accept-Encoding'}
+    raw = body.encode('utf-8')
+    encoding = choose_encoding(accept_encoding) if len(raw) >= COMPRESSION_MIN_BYTES else None
+    if encoding is None:
+        return {**response, 'headers': headers}
+    if encoding == 'br':
+        compressed = get_brotli().compress(raw, quality=5)
+    else:
+        compressed = gzip.compress(raw, compresslevel=6)
+    if 'ETag' in headers:
+        headers['ETag'] = headers['ETag'][:-1] + '-' + encoding + '"'
+    return {
+        **response,
+        'headers': {**headers, 'Content-Encoding': encoding},
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
     }
 
 # Funzione per generare UUID
@@ -35,13 +325,11 @@ def generate_uuid():
 
 # Validazione email
 def is_valid_email(email):
-    email_regex = r'^[^\s@]+@[^\s@]+\.[^\s@]+$'
-    return re.match(email_regex, email)
+    return EMAIL_REGEX.match(email)
 
 # Validazione telefono italiano
 def is_valid_phone(phone):
-    phone_regex = r'^(\+39)?[0-9]{10}$'
-    return re.match(phone_regex, re.sub(r'\s+', '', phone))
+    return PHONE_REGEX.match(WHITESPACE_REGEX.sub('', phone))
 
 # Funzione helper per calcolare data fine abbonamento
 def calculate_membership_end_date(subscription_type):
@@ -59,22 +347,360 @@ def calculate_membership_end_date(subscription_type):
 
     return end_date.isoformat()
 
-# GET /users - Recupera tutti gli utenti
-def get_users():
+# Chiave dell'elemento sentinella che riserva un indirizzo email
+def email_key(email):
+    return {'userId': EMAIL_KEY_PREFIX + email.lower()}
+
+# Elemento sentinella che riserva un indirizzo email per un membro
+def email_sentinel(email, owner_id):
+    return {**email_key(email), 'recordType': 'EMAIL', 'ownerId': owner_id}
+
+# Variazioni dei contatori aggregati causate da un membro (sign = 1 creazione, -1 eliminazione)
+def stats_deltas(user, sign=1):
+    deltas = {'totalMembers': sign}
+    if user.get('isActive'):
+        deltas['activeMembers'] = sign
+    if user.get('membershipType') and user.get('membershipType') != 'inactive':
+        deltas['activeSubscriptions'] = sign
+    deltas['type_' + gymStatsStream.counted_membership_type(user.get('membershipType', 'basic'))] = sign
+    return deltas
+
+def stats_day_key(day):
+    return {'userId': STATS_DAY_KEY_PREFIX + day}
+
+def utc_today():
+    return datetime.datetime.utcnow().date().isoformat()
+
+# Somma più insiemi di variazioni in uno solo
+def merge_stats_deltas(*deltas_list):
+    merged = {}
+    for deltas in deltas_list:
+        for name, delta in deltas.items():
+            merged[name] = merged.get(name, 0) + delta
+    return merged
+
+# Operazione di transazione con ADD atomici sull'elemento statistiche. Ogni aggiornamento
+# incrementa anche dataVersion, il marcatore di modifica da cui derivano gli ETag di /users e /stats
+def stats_update(deltas):
+    return {'update': STATS_KEY, 'set': {'recordType': 'STATS'}, 'add': {**deltas, 'dataVersion': 1}}
+
+# Operazioni sui contatori per membri creati (sign = 1) o eliminati (sign = -1): ADD su
+# STATS#GLOBAL e, per i soli membri con createdAt di oggi, sull'elemento del giorno. I
+# membri importati con una data di iscrizione storica non toccano i contatori giornalieri
+def stats_operations(users, sign=1):
+    operations = [stats_update(merge_stats_deltas(*(stats_deltas(user, sign) for user in users)))]
+    today = utc_today()
+    signups = sum(sign for user in users if (user.get('createdAt') or '')[:10] == today)
+    if signups:
+        operations.append({
+            'update': stats_day_key(today),
+            'set': {'recordType': 'STATS', 'expiresAt': int(time.time()) + STATS_DAY_TTL_SECONDS},
+            'add': {'signups': signups}
+        })
+    return operations
+
+# Applica le operazioni sui contatori fuori da una transazione
+def apply_stats_operations(operations):
+    for operation in operations:
+        get_storage().update(operation['update'], operation['set'], operation['add'])
+
+# Contatori aggregati e nuovi iscritti di oggi, letti con una sola BatchGetItem
+def read_stats_items():
+    day_key = stats_day_key(utc_today())
+    found = {item['userId']: item for item in batch_get_with_retry([STATS_KEY, day_key])}
+    return found.get(STATS_KEY['userId']), found.get(day_key['userId'])
+
+# Scansione completa parallela: ogni segmento (segment/total_segments) viene letto da un
+# thread che segue la propria paginazione, e gli elementi arrivano come un unico flusso.
+# La coda limitata tiene bassa la memoria se il consumatore è più lento della lettura;
+# se il consumatore si ferma prima della fine i thread terminano alla pagina successiva
+def parallel_scan(total_segments=None, max_workers=None, **scan_kwargs):
+    total_segments = total_segments or SCAN_SEGMENTS
+    max_workers = max_workers or total_segments
+    storage = get_storage()
+    pages = queue.Queue(maxsize=max_workers * 2)
+    stop = threading.Event()
+    segment_done = object()
+
+    def publish(value):
+        while not stop.is_set():
+            try:
+                pages.put(value, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def scan_segment(segment):
+        try:
+            start_key = None
+            while not stop.is_set():
+                items, start_key = storage.scan(start_key=start_key, segment=segment,
+                                                total_segments=total_segments, **scan_kwargs)
+                publish(items)
+                if start_key is None:
+                    break
+        except Exception as e:
+            publish(e)
+        finally:
+            publish(segment_done)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
     try:
-        logger.info("Getting all users from table: %s", TABLE_NAME)
+        for segment in range(total_segments):
+            executor.submit(scan_segment, segment)
+        remaining = total_segments
+        while remaining:
+            page = pages.get()
+            if page is segment_done:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield from page
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+# Nuova versione dei dati dopo una modifica fuori dal percorso delle richieste (backfill):
+# cambia gli ETag e svuota la cache delle risposte di questo processo
+def bump_data_version():
+    update = stats_update({})
+    get_storage().update(update['update'], update['set'], update['add'])
+    invalidate_cache()
+
+# Aggiunge listPartition ai membri salvati prima dell'indice per data di iscrizione: fino ad
+# allora non compaiono in GET /users senza filtri. Da eseguire una volta dopo il deploy
+# (python gymUsersHandler.py backfill-list-partition): restituisce il numero di membri aggiornati
+def backfill_list_partition():
+    updated = 0
+    for user in parallel_scan(filters={**MEMBER_FILTERS, 'listPartition': MISSING}, fields=['userId']):
+        try:
+            get_storage().update({'userId': user['userId']}, {'listPartition': MEMBER_LIST_PARTITION},
+                                 condition=IF_EXISTS)
+            updated += 1
+        except ConditionFailed:
+            # Membro eliminato durante la scansione
+            pass
+    if updated:
+        bump_data_version()
+    return updated
+
+# Crea le sentinelle email per i membri salvati prima del controllo transazionale. Da
+# eseguire una volta dopo il deploy (python gymUsersHandler.py backfill-email-sentinels):
+# restituisce le email già duplicate
+def backfill_email_sentinels():
+    duplicates = []
+    for item in parallel_scan(filters=MEMBER_FILTERS, fields=gymCodec.storage_fields(['userId', 'email'])):
+        user = gymCodec.decode(item, ['userId', 'email'])
+        if not user.get('email'):
+            continue
+        try:
+            get_storage().put(email_sentinel(user['email'], user['userId']),
+                              condition=if_absent_or_equals('ownerId', user['userId']))
+        except ConditionFailed:
+            duplicates.append(user['email'])
+    bump_data_version()
+    return duplicates
+
+# Cursore opaco: ultima chiave letta serializzata e firmato con HMAC insieme allo scope
+# (scansione o indice interrogato), così non può essere riusato su un'altra lettura
+def encode_cursor(last_key, scope='scan'):
+    data = json.dumps({'k': last_key, 's': scope}, default=str, separators=(',', ':'))
+    payload = base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+    signature = hmac.new(CURSOR_SECRET, payload.encode(), hashlib.sha256).hexdigest()[:32]
+    return f"{payload}.{signature}"
+
+def decode_cursor(cursor, scope='scan'):
+    try:
+        payload, signature = cursor.split('.', 1)
+    except ValueError:
+        raise ValueError("Cursore non valido")
+    expected = hmac.new(CURSOR_SECRET, payload.encode(), hashlib.sha256).hexdigest()[:32]
+    if not hmac.compare_digest(signature, expected):
+        raise ValueError("Cursore non valido")
+    try:
+        padding = '=' * (-len(payload) % 4)
+        data = json.loads(base64.urlsafe_b64decode(payload + padding))
+    except (ValueError, TypeError):
+        raise ValueError("Cursore non valido")
+    if not isinstance(data, dict) or not isinstance(data.get('k'), dict) or data.get('s') != scope:
+        raise ValueError("Cursore non valido")
+    return data['k']
+
+# Legge e limita la dimensione di pagina richiesta
+def parse_page_size(value):
+    if value in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("Parametro limit non valido")
+    if limit < 1:
+        raise ValueError("Parametro limit non valido")
+    return min(limit, MAX_PAGE_SIZE)
+
+# Versione corrente dei dati dei membri (0 se i contatori non sono ancora inizializzati)
+def get_data_version():
+    item = get_storage().get(STATS_KEY, ['dataVersion']) or {}
+    return int(item.get('dataVersion', 0))
+
+# ETag forte calcolato dalla versione dei dati e dai parametri che definiscono la risposta
+def make_etag(*parts):
+    digest = hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()[:24]
+    return f'"{digest}"'
+
+# Confronto debole di If-None-Match: ignora W/ e il suffisso di codifica aggiunto
+# da compress_response, perché il contenuto non compresso è lo stesso
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    expected = etag.strip('"')
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        for suffix in ('-gzip', '-br'):
+            if candidate.endswith(suffix):
+                candidate = candidate[:-len(suffix)]
+        if candidate == expected:
+            return True
+    return False
+
+# GET condizionale: 304 senza corpo se If-None-Match corrisponde, altrimenti la risposta
+# prodotta con ETag e Cache-Control no-cache (il browser rivalida a ogni richiesta)
+def conditional_response(request, etag, produce):
+    if etag_matches(get_header(request['event'], 'If-None-Match'), etag):
+        response = create_response(304, None, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+        response['body'] = ''
+        return response
+    response = produce()
+    if response['statusCode'] != 200:
+        return response
+    return {**response, 'headers': {**response['headers'], 'ETag': etag, 'Cache-Control': 'no-cache'}}
+
+# Campi richiesti con fields=a,b,c (validati sulla lista ammessa); userId è sempre incluso
+def parse_fields(value):
+    if not value:
+        return DEFAULT_LIST_FIELDS
+    fields = ['userId']
+    for field in value.split(','):
+        field = field.strip()
+        if not field:
+            continue
+        if field not in MEMBER_FIELDS:
+            raise ValueError(f"Campo non consentito: {field}")
+        if field not in fields:
+            fields.append(field)
+    return fields
+
+# Numero di membri dal contatore aggregato (None se i contatori non sono ancora inizializzati)
+def get_member_count():
+    item = get_storage().get(STATS_KEY, ['totalMembers'])
+    if item is None:
+        return None
+    return int(item.get('totalMembers', 0))
+
+# Valore di un filtro indicizzato (None se il parametro non è presente)
+def parse_filter_value(query_params, name):
+    value = query_params.get(name)
+    if value in (None, ''):
+        return None
+    if len(value) > MAX_FILTER_VALUE_LENGTH:
+        raise ValueError(f"Parametro {name} non valido")
+    return value
+
+# Parametri di lettura per GET /users: query sull'indice di status o membershipType se è
+# richiesto un filtro (con entrambi il secondo diventa un filtro), altrimenti sull'indice
+# sparso dei membri. Una scansione della tabella conterebbe nel limit anche gli elementi di
+# servizio (email, contatori, DETAILS, ...) e restituirebbe pagine incomplete con hasMore
+# vero. Tutti gli indici hanno createdAt come chiave di ordinamento, quindi sort=-createdAt
+# diventa forward=False e la paginazione resta per chiave
+def build_list_request(query_params):
+    limit = parse_page_size(query_params.get('limit'))
+    fields = parse_fields(query_params.get('fields'))
+    status = parse_filter_value(query_params, 'status')
+    membership_type = parse_filter_value(query_params, 'membershipType')
+    sort = query_params.get('sort') or None
+    if sort is not None and sort not in SORT_OPTIONS:
+        raise ValueError("Parametro sort non valido (createdAt o -createdAt)")
+
+    if status is not None:
+        index_name, key_value = STATUS_INDEX, status
+    elif membership_type is not None:
+        index_name, key_value = MEMBERSHIP_TYPE_INDEX, membership_type
+    else:
+        index_name, key_value = CREATED_AT_INDEX, MEMBER_LIST_PARTITION
+    # Gli indici di status e membershipType possono contenere elementi di servizio con
+    # quegli attributi: MEMBER_FILTERS li esclude
+    request = {
+        'index': index_name,
+        'key_value': key_value,
+        'limit': limit,
+        'forward': SORT_OPTIONS.get(sort, True),
+        'filters': MEMBER_FILTERS,
+        'fields': fields
+    }
+    if status is not None and membership_type is not None:
+        request['filters'] = {**MEMBER_FILTERS, 'membershipType': membership_type}
+    scope = index_name if sort is None else f"{index_name}:{sort}"
+
+    if query_params.get('cursor'):
+        request['start_key'] = decode_cursor(query_params['cursor'], scope)
+    filtered = status is not None or membership_type is not None
+    return request, scope, filtered
+
+# Decodifica i membri letti nel formato dell'API. Se i campi richiesti sono nell'elemento
+# DETAILS, gli elementi DETAILS vengono letti con BatchGetItem per l'intero blocco
+def decode_members(items, fields):
+    details_fields = gymCodec.detail_fields(fields)
+    if not details_fields or not items:
+        return [gymCodec.decode(item, fields) for item in items]
+    found = batch_get_with_retry([gymCodec.details_key(item['userId']) for item in items],
+                                 gymCodec.storage_fields(['userId', *details_fields]))
+    details = {item['userId']: item for item in found}
+    return [
+        gymCodec.decode(item, fields, details.get(gymCodec.details_key(item['userId'])['userId']))
+        for item in items
+    ]
+
+# Legge una pagina di membri da un indice e la decodifica nel formato dell'API
+def read_members_page(storage, read_request):
+    fields = read_request['fields']
+    items, last_key = storage.query(**{**read_request, 'fields': gymCodec.storage_fields(fields)})
+    return decode_members(items, fields), last_key
+
+# GET /users?limit=N&cursor=...&fields=...&status=...&membershipType=... - Recupera una pagina di utenti
+def get_users(query_params=None):
+    query_params = query_params or {}
+    try:
+        with gymMetrics.phase('validation'):
+            read_request, scope, filtered = build_list_request(query_params)
+    except ValueError as e:
+        return create_response(400, {
+            "success": False,
+            "error": str(e)
+        })
+
+    try:
+        logger.debug("Getting users page from %s (limit %d)", scope, read_request['limit'])
         
-        response = table.scan()
-        users = response.get('Items', [])
+        users, last_key = read_members_page(get_storage(), read_request)
         
-        logger.info("Found %d users", len(users))
+        logger.debug("Found %d users", len(users))
         
         return create_response(200, {
             "success": True,
             "members": users,
-            "total": len(users)
+            "count": len(users),
+            # Il totale è disponibile solo per l'elenco non filtrato
+            "total": None if filtered else get_member_count(),
+            "nextCursor": encode_cursor(last_key, scope) if last_key else None,
+            "hasMore": last_key is not None
         })
-    except ClientError as e:
+    except Exception as e:
         logger.error("Error getting users: %s", e)
         return create_response(500, {
             "success": False,
@@ -82,85 +708,144 @@ def get_users():
             "details": str(e)
         })
 
-# POST /users - Crea nuovo utente con dati dal frontend
-def create_user(user_data):
+# GET /users/{id}?include=details - Un membro. I dati medici e il contatto di emergenza
+# (elemento DETAILS) si leggono solo con include=details, nella stessa BatchGetItem
+def get_user(user_id, query_params=None):
+    includes = [name.strip() for name in ((query_params or {}).get('include') or '').split(',') if name.strip()]
+    if any(name not in MEMBER_INCLUDES for name in includes):
+        return create_response(400, {
+            "success": False,
+            "error": f"Parametro include non valido (valori ammessi: {', '.join(MEMBER_INCLUDES)})"
+        })
+
     try:
-        logger.info("Creating user with data: %s", json.dumps(user_data, indent=2))
-        
-        # Validazione dati obbligatori
-        if not user_data.get('name') or not user_data.get('email'):
-            return create_response(400, {
-                "success": False,
-                "error": "Nome e email sono obbligatori"
-            })
-            
-        # Validazione email
-        if not is_valid_email(user_data['email']):
-            return create_response(400, {
+        key = {'userId': user_id}
+        details = None
+        if 'details' in includes:
+            found = {item['userId']: item for item in batch_get_with_retry([key, gymCodec.details_key(user_id)])}
+            user = found.get(user_id)
+            details = found.get(gymCodec.details_key(user_id)['userId'])
+        else:
+            user = get_storage().get(key)
+        if user is None or user.get('recordType'):
+            return create_response(404, {
                 "success": False,
-                "error": "Formato email non valido"
+                "error": "Utente non trovato"
             })
 
-        # Validazione telefono (se fornito)
-        if user_data.get('phone') and not is_valid_phone(user_data['phone']):
-            return create_response(400, {
-                "success": False,
-                "error": "Formato telefono non valido"
-            })
+        fields = MEMBER_FIELDS if 'details' in includes else HOT_MEMBER_FIELDS
+        return create_response(200, {
+            "success": True,
+            "member": gymCodec.decode(user, fields, details)
+        })
+    except Exception as e:
+        logger.error("Error getting user: %s", e)
+        return create_response(500, {
+            "success": False,
+            "error": "Errore nel recupero dell'utente",
+            "details": str(e)
+        })
+
+# Validazione dei dati di un nuovo membro: restituisce il messaggio di errore o None
+def validate_user_data(user_data):
+    if not isinstance(user_data, dict):
+        return "Dati membro non validi"
+
+    # Validazione dati obbligatori
+    if not isinstance(user_data.get('name'), str) or not isinstance(user_data.get('email'), str) \
+            or not user_data['name'].strip() or not user_data['email']:
+        return "Nome e email sono obbligatori"
+
+    # Validazione email
+    if not is_valid_email(user_data['email']):
+        return "Formato email non valido"
+
+    # Tipo di abbonamento (se fornito): ogni tipo è un contatore dell'elemento statistiche
+    if user_data.get('subscriptionType') not in (None, '', *MEMBERSHIP_TYPES):
+        return f"Tipo di abbonamento non valido (valori ammessi: {', '.join(MEMBERSHIP_TYPES)})"
+
+    # Stato (se fornito): è la chiave di partizione di status-createdAt-index, che DynamoDB
+    # accetta solo come stringa non vuota; la lunghezza è quella ammessa dal filtro ?status=
+    if 'status' in user_data:
+        status = user_data['status']
+        if not isinstance(status, str) or not status.strip() or len(status.strip()) > MAX_FILTER_VALUE_LENGTH:
+            return f"Stato non valido (testo da 1 a {MAX_FILTER_VALUE_LENGTH} caratteri)"
+
+    # Validazione telefono (se fornito)
+    if user_data.get('phone') and (not isinstance(user_data['phone'], str) or not is_valid_phone(user_data['phone'])):
+        return "Formato telefono non valido"
 
-        # Verifica se email già esistente
-        response = table.scan(
-            FilterExpression="email = :email",
-            ExpressionAttributeValues={
-                ":email": user_data['email'].lower()
-            }
-        )
-        if response.get('Items') and len(response['Items']) > 0:
-            return create_response(409, {
+    return None
+
+# Crea l'elemento di un nuovo membro a partire da dati già validati
+def build_user_item(user_data):
+    # Dividi nome completo in nome e cognome
+    name_parts = user_data['name'].strip().split(' ', 1)
+    first_name = name_parts[0]
+    last_name = name_parts[1] if len(name_parts) > 1 else ''
+
+    # Crea oggetto utente nel formato dell'API (gymCodec.encode lo compatta prima della scrittura)
+    now = datetime.datetime.utcnow().isoformat()
+    new_user = {
+        'userId': generate_uuid(),
+        'firstName': first_name,
+        'lastName': last_name,
+        'fullName': user_data['name'].strip(),
+        'email': user_data['email'].lower(),
+        'phone': WHITESPACE_REGEX.sub('', user_data.get('phone', '')),
+        'membershipType': user_data.get('subscriptionType') or 'basic',
+        'membershipStartDate': datetime.date.today().isoformat(),
+        'membershipEndDate': calculate_membership_end_date(user_data.get('subscriptionType')),
+        'status': user_data.get('status', 'active').strip(),
+        'isActive': True,
+        'listPartition': MEMBER_LIST_PARTITION,
+        'createdAt': now,
+        'updatedAt': now,
+        
+        # Campi opzionali
+        'birthDate': user_data.get('birthDate', gymCodec.default_value('birthDate')),
+        'goal': user_data.get('goal', gymCodec.default_value('goal')),
+        'address': user_data.get('address', gymCodec.default_value('address')),
+        'emergencyContact': user_data.get('emergencyContact', gymCodec.default_value('emergencyContact')),
+        'medicalInfo': user_data.get('medicalInfo', gymCodec.default_value('medicalInfo'))
+    }
+    return new_user
+
+# POST /users - Crea nuovo utente con dati dal frontend
+def create_user(user_data):
+    try:
+        logger.debug("Creating user")
+        
+        with gymMetrics.phase('validation'):
+            error = validate_user_data(user_data)
+        if error:
+            return create_response(400, {
                 "success": False,
-                "error": "Un utente con questa email esiste già"
+                "error": error
             })
 
-        # Dividi nome completo in nome e cognome
-        name_parts = user_data['name'].strip().split(' ', 1)
-        first_name = name_parts[0]
-        last_name = name_parts[1] if len(name_parts) > 1 else ''
-
-        # Crea oggetto utente per DynamoDB
-        new_user = {
-            'userId': generate_uuid(),
-            'firstName': first_name,
-            'lastName': last_name,
-            'fullName': user_data['name'].strip(),
-            'email': user_data['email'].lower(),
-            'phone': re.sub(r'\s+', '', user_data.get('phone', '')),
-            'membershipType': user_data.get('subscriptionType', 'basic'),
-            'membershipStartDate': datetime.date.today().isoformat(),
-            'membershipEndDate': calculate_membership_end_date(user_data.get('subscriptionType')),
-            'status': user_data.get('status', 'active'),
-            'isActive': True,
-            'createdAt': datetime.datetime.utcnow().isoformat(),
-            'updatedAt': datetime.datetime.utcnow().isoformat(),
-            
-            # Campi opzionali
-            'birthDate': user_data.get('birthDate', ''),
-            'goal': user_data.get('goal', 'Mantenersi in forma'),
-            
-            'address': user_data.get('address', {
-                'street': '', 'city': '', 'zipCode': ''
-            }),
-            
-            'emergencyContact': user_data.get('emergencyContact', {
-                'name': '', 'phone': '', 'relationship': ''
-            }),
-            
-            'medicalInfo': user_data.get('medicalInfo', {
-                'allergies': 'Nessuna', 'conditions': 'Nessuna'
-            })
-        }
+        new_user = build_user_item(user_data)
+        item, details = gymCodec.encode_member(new_user)
         
-        # Salva nel database
-        table.put_item(Item=new_user)
+        # Salva utente, dati DETAILS e sentinella email in un'unica transazione: se l'email
+        # è già riservata la sentinella fallisce la condizione e nulla viene scritto
+        operations = [
+            {'put': item, 'condition': IF_NOT_EXISTS},
+            {'put': email_sentinel(new_user['email'], new_user['userId']), 'condition': IF_NOT_EXISTS},
+            *stats_operations([new_user])
+        ]
+        if details is not None:
+            operations.append({'put': details, 'condition': IF_NOT_EXISTS})
+        try:
+            get_storage().transact(operations)
+        except ConditionFailed as e:
+            if e.index == 1:
+                return create_response(409, {
+                    "success": False,
+                    "error": "Un utente con questa email esiste già"
+                })
+            raise
+        invalidate_cache()
         logger.info("User created successfully: %s", new_user['userId'])
 
         return create_response(201, {
@@ -178,21 +863,185 @@ def create_user(user_data):
             "details": str(e)
         })
 
+# Attesa con backoff esponenziale e jitter tra i tentativi di una operazione batch
+def batch_backoff(attempt):
+    time.sleep(random.uniform(0, min(2.0, 0.05 * (2 ** attempt))))
+
+# Scrittura batch con ripetizione degli elementi non elaborati; restituisce gli
+# elementi e le chiavi ancora non elaborati dopo l'ultimo tentativo
+def batch_write_with_retry(puts=(), deletes=()):
+    pending_puts, pending_deletes = list(puts), list(deletes)
+    for attempt in range(BATCH_MAX_ATTEMPTS):
+        if attempt:
+            batch_backoff(attempt)
+        pending_puts, pending_deletes = get_storage().batch_write(pending_puts, pending_deletes)
+        if not pending_puts and not pending_deletes:
+            return [], []
+    return pending_puts, pending_deletes
+
+# Lettura batch a blocchi di 100 chiavi con ripetizione delle chiavi non elaborate
+def batch_get_with_retry(keys, fields=None):
+    items = []
+    for start in range(0, len(keys), BATCH_GET_SIZE):
+        pending = keys[start:start + BATCH_GET_SIZE]
+        for attempt in range(BATCH_MAX_ATTEMPTS):
+            if attempt:
+                batch_backoff(attempt)
+            found, pending = get_storage().batch_get(pending, fields)
+            items.extend(found)
+            if not pending:
+                break
+        else:
+            raise RuntimeError("Lettura batch: chiavi non elaborate dopo %d tentativi" % BATCH_MAX_ATTEMPTS)
+    return items
+
+# Scrive membri già validati insieme alle sentinelle email e agli elementi DETAILS, a blocchi
+# di BATCH_WRITE_SIZE elementi (gli elementi di un membro restano nello stesso blocco), e aggiorna i
+# contatori una sola volta. Restituisce gli userId che non è stato possibile scrivere.
+# A differenza di POST /users il controllo email non è atomico rispetto a iscrizioni
+# concorrenti: le email già presenti vanno escluse prima con batch_get_with_retry
+def write_members_batch(users):
+    failed_ids = set()
+    members_per_chunk = BATCH_WRITE_SIZE // 3
+    for start in range(0, len(users), members_per_chunk):
+        chunk = users[start:start + members_per_chunk]
+        puts = []
+        written_keys = {}
+        for user in chunk:
+            item, details = gymCodec.encode_member(user)
+            puts.append(item)
+            puts.append(email_sentinel(user['email'], user['userId']))
+            written_keys[user['userId']] = [user['userId'], email_key(user['email'])['userId']]
+            if details is not None:
+                puts.append(details)
+                written_keys[user['userId']].append(details['userId'])
+        unprocessed, _ = batch_write_with_retry(puts)
+        if not unprocessed:
+            continue
+
+        # Un membro è fallito se manca uno dei suoi elementi: gli altri vanno rimossi per
+        # non lasciare un membro senza sentinella o dati, o una email riservata a vuoto
+        unprocessed_keys = {item['userId'] for item in unprocessed}
+        cleanup = []
+        for user in chunk:
+            keys = written_keys[user['userId']]
+            if any(key in unprocessed_keys for key in keys):
+                failed_ids.add(user['userId'])
+                cleanup.extend({'userId': key} for key in keys if key not in unprocessed_keys)
+        if cleanup and any(batch_write_with_retry(deletes=cleanup)):
+            logger.error("Cleanup incompleto dopo import batch fallito")
+
+    invalidate_cache()
+    written = [user for user in users if user['userId'] not in failed_ids]
+    if written:
+        apply_stats_operations(stats_operations(written))
+    return failed_ids
+
+# POST /users/batch - Importa più membri in una sola richiesta con risultati per riga
+def create_users_batch(rows):
+    try:
+        if not isinstance(rows, list) or not rows:
+            return create_response(400, {
+                "success": False,
+                "error": "Il corpo deve contenere una lista di membri"
+            })
+        if len(rows) > MAX_BATCH_IMPORT:
+            return create_response(400, {
+                "success": False,
+                "error": f"Massimo {MAX_BATCH_IMPORT} membri per richiesta"
+            })
+
+        logger.info("Batch import of %d rows", len(rows))
+
+        # Validazione di tutto il payload in un solo passaggio
+        results = [None] * len(rows)
+        candidates = {}
+        with gymMetrics.phase('validation'):
+            for index, row in enumerate(rows):
+                error = validate_user_data(row)
+                if not error and row['email'].lower() in candidates:
+                    error = "Email duplicata nella richiesta"
+                if error:
+                    results[index] = {"row": index, "success": False, "error": error}
+                else:
+                    candidates[row['email'].lower()] = index
+
+        # Email già registrate
+        existing = batch_get_with_retry([email_key(email) for email in candidates], fields=['userId'])
+        for item in existing:
+            index = candidates.pop(item['userId'][len(EMAIL_KEY_PREFIX):])
+            results[index] = {"row": index, "success": False, "error": "Un utente con questa email esiste già"}
+
+        users = {index: build_user_item(rows[index]) for index in candidates.values()}
+        failed_ids = write_members_batch(list(users.values()))
+        for index, user in users.items():
+            if user['userId'] in failed_ids:
+                results[index] = {"row": index, "success": False, "error": "Scrittura non completata, riprovare"}
+            else:
+                results[index] = {"row": index, "success": True, "id": user['userId']}
+
+        created = sum(1 for result in results if result['success'])
+        logger.info("Batch import completed: %d created, %d failed", created, len(rows) - created)
+
+        status_code = 201 if created == len(rows) else (207 if created else 400)
+        return create_response(status_code, {
+            "success": created == len(rows),
+            "created": created,
+            "failed": len(rows) - created,
+            "results": results
+        })
+
+    except Exception as e:
+        logger.error("Error in batch import: %s", e)
+        return create_response(500, {
+            "success": False,
+            "error": "Errore nell'importazione dei membri",
+            "details": str(e)
+        })
+
 # DELETE /users/{id} - Elimina utente
 def delete_user(user_id):
     try:
-        logger.info("Deleting user: %s", user_id)
+        logger.debug("Deleting user: %s", user_id)
         
         # Verifica se l'utente esiste
-        response = table.get_item(Key={'userId': user_id})
-        if 'Item' not in response:
+        user = get_storage().get({'userId': user_id})
+        if user is None or user.get('recordType'):
             return create_response(404, {
                 "success": False,
                 "error": "Utente non trovato"
             })
+        user = gymCodec.decode(user)
             
-        # Elimina l'utente
-        table.delete_item(Key={'userId': user_id})
+        # Elimina utente, elemento DETAILS e sentinella email insieme; DETAILS manca per i
+        # membri con dati predefiniti e la sentinella per quelli creati prima del controllo transazionale
+        operations = [
+            {'delete': {'userId': user_id}, 'condition': IF_EXISTS},
+            {'delete': gymCodec.details_key(user_id)},
+            *stats_operations([user], -1)
+        ]
+        sentinel_index = None
+        if user.get('email'):
+            sentinel_index = len(operations)
+            operations.append({'delete': email_key(user['email']),
+                               'condition': if_absent_or_equals('ownerId', user_id)})
+        while True:
+            try:
+                get_storage().transact(operations)
+                break
+            except ConditionFailed as e:
+                if e.index == 0:
+                    return create_response(404, {
+                        "success": False,
+                        "error": "Utente non trovato"
+                    })
+                if e.index != sentinel_index:
+                    raise
+                # La sentinella appartiene a un altro membro con la stessa email (membri creati
+                # prima del controllo transazionale): resta al suo proprietario
+                operations.pop(sentinel_index)
+                sentinel_index = None
+        invalidate_cache()
         logger.info("User deleted successfully: %s", user_id)
 
         return create_response(200, {
@@ -201,7 +1050,7 @@ def delete_user(user_id):
             "deletedUserId": user_id
         })
         
-    except ClientError as e:
+    except Exception as e:
         logger.error("Error deleting user: %s", e)
         return create_response(500, {
             "success": False,
@@ -209,38 +1058,30 @@ def delete_user(user_id):
             "details": str(e)
         })
 
-# GET /stats - Statistiche palestra
+# Converte l'elemento contatori e quello del giorno nel formato di risposta di GET /stats
+def format_stats(item, day_item=None):
+    membership_types = {membership_type: 0 for membership_type in MEMBERSHIP_TYPES}
+    for name, value in item.items():
+        if name.startswith('type_') and (value or name[5:] in membership_types):
+            membership_types[name[5:]] = int(value)
+    return {
+        'totalMembers': int(item.get('totalMembers', 0)),
+        'newMembersToday': int((day_item or {}).get('signups', 0)),
+        'activeMembers': int(item.get('activeMembers', 0)),
+        'activeSubscriptions': int(item.get('activeSubscriptions', 0)),
+        'membershipTypes': membership_types
+    }
+
+# GET /stats - Statistiche palestra (lettura dei contatori aggregati)
 def get_stats():
     try:
-        logger.info("Getting gym statistics")
-        
-        response = table.scan()
-        users = response.get('Items', [])
-        
-        today = datetime.date.today().isoformat()
-        new_members_today = len([user for user in users if user.get('createdAt', '').startswith(today)])
-        active_members = len([user for user in users if user.get('isActive')])
-        
-        # Raggruppa per tipo di abbonamento
-        membership_types = {
-            'monthly': 0, 'quarterly': 0, 'yearly': 0, 'basic': 0, 'premium': 0
-        }
-        for user in users:
-            membership_type = user.get('membershipType', 'basic')
-            if membership_type in membership_types:
-                membership_types[membership_type] += 1
+        logger.debug("Getting gym statistics")
         
-        stats = {
-            'totalMembers': len(users),
-            'newMembersToday': new_members_today,
-            'activeMembers': active_members,
-            'activeSubscriptions': len([u for u in users if u.get('membershipType') and u.get('membershipType') != 'inactive']),
-            'membershipTypes': membership_types
-        }
+        item, day_item = read_stats_items()
 
         return create_response(200, {
             "success": True,
-            "stats": stats
+            "stats": format_stats(item or {}, day_item)
         })
     except Exception as e:
         logger.error("Error getting stats: %s", e)
@@ -250,84 +1091,576 @@ def get_stats():
             "details": str(e)
         })
 
+# GET /dashboard?limit=N&fields=...&status=...&membershipType=...&sort=... - Prima pagina di
+# membri, statistiche e ora del server in una sola risposta. L'elemento contatori viene letto
+# in un thread mentre il thread della richiesta legge la pagina, quindi la latenza è quella
+# della lettura più lenta e non la somma delle due
+def get_dashboard(query_params=None):
+    query_params = {name: value for name, value in (query_params or {}).items() if name != 'cursor'}
+    try:
+        with gymMetrics.phase('validation'):
+            read_request, scope, filtered = build_list_request(query_params)
+    except ValueError as e:
+        return create_response(400, {
+            "success": False,
+            "error": str(e)
+        })
+
+    try:
+        logger.debug("Getting dashboard from %s (limit %d)", scope, read_request['limit'])
+
+        storage = get_storage()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            stats_future = executor.submit(read_stats_items)
+            users, last_key = read_members_page(storage, read_request)
+            stats_item, day_item = stats_future.result()
+
+        stats = format_stats(stats_item or {}, day_item)
+        return create_response(200, {
+            "success": True,
+            "members": users,
+            "count": len(users),
+            # Il totale è disponibile solo per l'elenco non filtrato
+            "total": None if filtered or stats_item is None else stats['totalMembers'],
+            "nextCursor": encode_cursor(last_key, scope) if last_key else None,
+            "hasMore": last_key is not None,
+            "stats": stats,
+            "serverTime": datetime.datetime.now(datetime.timezone.utc).isoformat()
+        })
+    except Exception as e:
+        logger.error("Error getting dashboard: %s", e)
+        return create_response(500, {
+            "success": False,
+            "error": "Errore nel caricamento della dashboard",
+            "details": str(e)
+        })
+
+# Legge from, to (date YYYY-MM-DD) e granularity e restituisce granularità e periodi richiesti
+def parse_timeseries_range(query_params):
+    granularity = query_params.get('granularity') or 'day'
+    if granularity not in gymStatsStream.GRANULARITIES:
+        raise ValueError("Parametro granularity non valido (day, week o month)")
+    dates = {}
+    for name in ('from', 'to'):
+        try:
+            dates[name] = datetime.date.fromisoformat(query_params[name]) if query_params.get(name) else None
+        except ValueError:
+            raise ValueError(f"Parametro {name} non valido (formato YYYY-MM-DD)")
+    end = dates['to'] or datetime.datetime.utcnow().date()
+    if dates['from'] is None:
+        count = TIMESERIES_DEFAULT_PERIODS[granularity]
+        start = end - datetime.timedelta(days=count * TIMESERIES_PERIOD_DAYS[granularity])
+        return granularity, gymStatsStream.periods_between(start, end, granularity)[-count:]
+    if dates['from'] > end:
+        raise ValueError("Il parametro from deve precedere to")
+    periods = gymStatsStream.periods_between(dates['from'], end, granularity)
+    if len(periods) > TIMESERIES_MAX_POINTS:
+        raise ValueError(f"Intervallo troppo ampio: al massimo {TIMESERIES_MAX_POINTS} periodi")
+    return granularity, periods
+
+# Converte un rollup (anche assente) in un punto della serie
+def format_rollup(period, period_start, item):
+    signups_by_type = {membership_type: 0 for membership_type in MEMBERSHIP_TYPES}
+    deletions_by_type = {membership_type: 0 for membership_type in MEMBERSHIP_TYPES}
+    for name, value in item.items():
+        if name.startswith('type_'):
+            signups_by_type[name[5:]] = int(value)
+        elif name.startswith('deletedType_'):
+            deletions_by_type[name[12:]] = int(value)
+    signups = int(item.get('signups', 0))
+    deletions = int(item.get('deletions', 0))
+    return {
+        'period': period,
+        'periodStart': period_start.isoformat(),
+        'signups': signups,
+        'deletions': deletions,
+        'net': signups - deletions,
+        'signupsByType': signups_by_type,
+        'deletionsByType': deletions_by_type
+    }
+
+# GET /stats/timeseries?from=&to=&granularity=day|week|month - Iscrizioni e cancellazioni per
+# periodo: una lettura batch dei rollup, i periodi senza rollup valgono zero
+def get_stats_timeseries(query_params=None):
+    query_params = query_params or {}
+    try:
+        with gymMetrics.phase('validation'):
+            granularity, periods = parse_timeseries_range(query_params)
+    except ValueError as e:
+        return create_response(400, {
+            "success": False,
+            "error": str(e)
+        })
+
+    try:
+        logger.debug("Getting %d %s rollups", len(periods), granularity)
+
+        keys = [gymStatsStream.rollup_key(granularity, period) for period, _ in periods]
+        rollups = {item['period']: item for item in batch_get_with_retry(keys)}
+
+        return create_response(200, {
+            "success": True,
+            "granularity": granularity,
+            "from": periods[0][1].isoformat(),
+            "to": periods[-1][1].isoformat(),
+            "points": [format_rollup(period, period_start, rollups.get(period, {}))
+                       for period, period_start in periods]
+        })
+    except Exception as e:
+        logger.error("Error getting stats timeseries: %s", e)
+        return create_response(500, {
+            "success": False,
+            "error": "Errore nel recupero delle serie storiche",
+            "details": str(e)
+        })
+
+# POST /stats/recompute - Ricostruisce i contatori con una scansione completa (solo admin).
+# Le scritture concorrenti alla scansione possono non essere conteggiate: va eseguito
+# in un momento di basso traffico
+def recompute_stats():
+    try:
+        logger.info("Recomputing gym statistics from a full scan")
+
+        deltas = {}
+        today = utc_today()
+        signups = 0
+        for item in parallel_scan(filters=MEMBER_FILTERS):
+            user = gymCodec.decode(item)
+            for name, delta in stats_deltas(user).items():
+                deltas[name] = deltas.get(name, 0) + delta
+            signups += (user.get('createdAt') or '')[:10] == today
+
+        # put sostituisce l'elemento: spariscono anche i contatori day_<data> delle versioni precedenti
+        stats_item = {**STATS_KEY, 'recordType': 'STATS', **deltas, 'dataVersion': get_data_version() + 1}
+        day_item = {**stats_day_key(today), 'recordType': 'STATS', 'signups': signups,
+                    'expiresAt': int(time.time()) + STATS_DAY_TTL_SECONDS}
+        get_storage().put(day_item)
+        get_storage().put(stats_item)
+        invalidate_cache()
+
+        return create_response(200, {
+            "success": True,
+            "stats": format_stats(stats_item, day_item)
+        })
+    except Exception as e:
+        logger.error("Error recomputing stats: %s", e)
+        return create_response(500, {
+            "success": False,
+            "error": "Errore nel ricalcolo delle statistiche",
+            "details": str(e)
+        })
+
+# Righe di un'esportazione: scansione parallela dei soli membri con i campi richiesti.
+# Le pagine sono limitate anche sui backend locali, che senza limit leggono un segmento intero
+def scan_members_for_export(fields):
+    items = parallel_scan(filters=MEMBER_FILTERS, fields=gymCodec.storage_fields(fields),
+                          limit=gymExports.EXPORT_SCAN_PAGE_SIZE)
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= BATCH_GET_SIZE:
+            yield from decode_members(chunk, fields)
+            chunk = []
+    yield from decode_members(chunk, fields)
+
+# POST /exports - Avvia l'esportazione completa dei membri su S3 (solo admin).
+# Corpo: {"format": "ndjson" | "csv", "fields": "a,b,c" o ["a", "b"]}; senza fields si
+# esportano tutti i campi. Il job gira in una invocazione asincrona (202, da seguire con
+# GET /exports/{id}) oppure nella richiesta con EXPORT_MODE=inline (201, con l'URL)
+def create_export(payload):
+    payload = payload if isinstance(payload, dict) else {}
+    export_format = payload.get('format') or 'ndjson'
+    if export_format not in gymExports.FORMATS:
+        return create_response(400, {
+            "success": False,
+            "error": f"Formato non valido: {export_format} (valori ammessi: {', '.join(gymExports.FORMATS)})"
+        })
+    fields = payload.get('fields')
+    if isinstance(fields, list):
+        fields = ','.join(str(field) for field in fields)
+    try:
+        fields = parse_fields(fields) if fields else MEMBER_FIELDS
+    except ValueError as e:
+        return create_response(400, {"success": False, "error": str(e)})
+
+    try:
+        job = gymExports.create_job(export_format, fields)
+        logger.info("Export job %s created (%s)", job['exportId'], export_format)
+        if gymExports.runs_inline():
+            job = gymExports.run_job(job['exportId'], scan_members_for_export)
+            return create_response(201 if job['jobStatus'] == 'completed' else 500, {
+                "success": job['jobStatus'] == 'completed',
+                "export": gymExports.format_job(job)
+            })
+        gymExports.start_job(job['exportId'])
+        return create_response(202, {
+            "success": True,
+            "export": gymExports.format_job(job)
+        }, headers={'Location': f"/exports/{job['exportId']}"})
+    except Exception as e:
+        logger.error("Error creating export: %s", e)
+        return create_response(500, {
+            "success": False,
+            "error": "Errore nell'avvio dell'esportazione",
+            "details": str(e)
+        })
+
+# GET /exports/{id} - Stato di un'esportazione e URL di download quando è completata
+def get_export(export_id):
+    try:
+        job = gymExports.get_job(export_id)
+        if job is None:
+            return create_response(404, {
+                "success": False,
+                "error": "Esportazione non trovata"
+            })
+        return create_response(200, {
+            "success": True,
+            "export": gymExports.format_job(job)
+        })
+    except Exception as e:
+        logger.error("Error getting export: %s", e)
+        return create_response(500, {
+            "success": False,
+            "error": "Errore nel recupero dell'esportazione",
+            "details": str(e)
+        })
+
+# =====================
+# ROUTER
+# =====================
+
+class RouteNotFound(Exception):
+    pass
+
+class MethodNotAllowed(Exception):
+    def __init__(self, allowed_methods):
+        super().__init__(', '.join(allowed_methods))
+        self.allowed_methods = allowed_methods
+
+# Router compilato all'import: i template (es. /users/{id}) diventano un albero di segmenti,
+# quindi la risoluzione costa quanto la profondità del path e non il numero di route.
+# Le middleware di ogni route vengono composte una sola volta alla registrazione
+class Router:
+    def __init__(self):
+        self.root = self._new_node()
+        self.endpoints = []
+
+    @staticmethod
+    def _new_node():
+        return {'static': {}, 'param': None, 'param_name': None, 'methods': {}}
+
+    def add(self, method, template, view, middleware=(), description=''):
+        node = self.root
+        for segment in template.strip('/').split('/') if template != '/' else []:
+            if segment.startswith('{') and segment.endswith('}'):
+                name = segment[1:-1]
+                if node['param'] is None:
+                    node['param'] = self._new_node()
+                    node['param_name'] = name
+                elif node['param_name'] != name:
+                    raise ValueError(f"Parametro in conflitto in {template}: {name} / {node['param_name']}")
+                node = node['param']
+            else:
+                node = node['static'].setdefault(segment, self._new_node())
+        if method in node['methods']:
+            raise ValueError(f"Route duplicata: {method} {template}")
+
+        chained = view
+        for hook in reversed(middleware):
+            chained = (lambda hook, next_handler: lambda request: hook(request, next_handler))(hook, chained)
+        node['methods'][method] = (chained, template)
+        self.endpoints.append(f"{method} {template}" + (f" - {description}" if description else ''))
+
+    # Decoratore: registra la stessa view per il template principale e gli alias
+    def route(self, method, *templates, middleware=(), description=''):
+        def register(view):
+            for index, template in enumerate(templates):
+                self.add(method, template, view, middleware, description if index == 0 else '')
+            return view
+        return register
+
+    # Restituisce (view, parametri, template) oppure solleva RouteNotFound / MethodNotAllowed
+    def resolve(self, method, path):
+        segments = path.strip('/').split('/') if path != '/' else []
+        node, params = self._match(self.root, segments, 0, {})
+        if node is None or not node['methods']:
+            raise RouteNotFound(path)
+        if method not in node['methods']:
+            raise MethodNotAllowed(sorted(node['methods']))
+        view, template = node['methods'][method]
+        return view, params, template
+
+    def _match(self, node, segments, index, params):
+        if index == len(segments):
+            return node, params
+        segment = segments[index]
+        static_child = node['static'].get(segment)
+        if static_child is not None:
+            found, found_params = self._match(static_child, segments, index + 1, params)
+            if found is not None and found['methods']:
+                return found, found_params
+        if node['param'] is not None and segment:
+            return self._match(node['param'], segments, index + 1, {**params, node['param_name']: segment})
+        return None, params
+
+router = Router()
+
+# Middleware: richiede un token o un gruppo amministratore
+def require_admin(request, next_handler):
+    if not is_admin_request(request['event']):
+        return create_response(403, {"success": False, "error": "Operazione riservata agli amministratori"})
+    return next_handler(request)
+
+# Middleware: decodifica il corpo JSON in request['json'] (None se il corpo è vuoto)
+def parse_json_body(request, next_handler):
+    body = request['event'].get('body')
+    request['json'] = None
+    if body:
+        try:
+            with gymMetrics.phase('validation'):
+                if request['event'].get('isBase64Encoded'):
+                    body = base64.b64decode(body).decode('utf-8')
+                request['json'] = json.loads(body)
+        except (ValueError, UnicodeDecodeError):
+            return create_response(400, {"success": False, "error": "Invalid JSON in request body"})
+    return next_handler(request)
+
+# Middleware (dopo parse_json_body): con l'header Idempotency-Key la prima risposta viene
+# salvata e le richieste ripetute con la stessa chiave la ricevono senza eseguire la view.
+# Le risposte 5xx non vengono salvate: la richiesta ripetuta viene rieseguita
+def idempotent(request, next_handler):
+    key = get_header(request['event'], 'Idempotency-Key')
+    if key is None:
+        return next_handler(request)
+    if not gymIdempotency.is_valid_key(key):
+        return create_response(400, {
+            "success": False,
+            "error": "Idempotency-Key non valida (da 1 a 255 caratteri ASCII stampabili, senza spazi)"
+        })
+
+    fingerprint = gymIdempotency.fingerprint(request['method'], request['route'], request['json'])
+    outcome, record = gymIdempotency.claim(key, fingerprint)
+    if outcome == gymIdempotency.REPLAY:
+        return gymIdempotency.replay(record)
+    if outcome == gymIdempotency.MISMATCH:
+        return create_response(422, {
+            "success": False,
+            "error": "Idempotency-Key già usata per una richiesta diversa"
+        })
+    if outcome == gymIdempotency.IN_PROGRESS:
+        return create_response(409, {
+            "success": False,
+            "error": "Una richiesta con la stessa Idempotency-Key è ancora in corso"
+        }, headers={"Retry-After": str(gymIdempotency.retry_after(record))})
+
+    try:
+        response = next_handler(request)
+    except Exception:
+        gymIdempotency.release(record)
+        raise
+    if response['statusCode'] >= 500:
+        gymIdempotency.release(record)
+    else:
+        gymIdempotency.complete(record, response)
+    return response
+
+@router.route('GET', '/users', '/members', description="Lista membri (paginata: limit, cursor, fields, status, membershipType, sort)")
+def route_get_users(request):
+    query_params = request['query']
+    version = get_data_version()
+    params_key = tuple(sorted(query_params.items()))
+    return conditional_response(request, make_etag('users', version, params_key),
+                                lambda: cached_response(('users', version, params_key),
+                                                        lambda: get_users(query_params)))
+
+@router.route('POST', '/users', '/members', middleware=(parse_json_body, idempotent),
+              description="Crea membro (header Idempotency-Key opzionale)")
+def route_create_user(request):
+    return create_user(request['json'] if request['json'] is not None else {})
+
+@router.route('POST', '/users/batch', '/members/batch', middleware=(parse_json_body,),
+              description="Importa più membri")
+def route_create_users_batch(request):
+    payload = request['json']
+    if isinstance(payload, dict):
+        payload = payload.get('members')
+    return create_users_batch(payload)
+
+@router.route('GET', '/users/{id}', '/members/{id}',
+              description="Dettaglio membro (include=details per dati medici e contatto di emergenza)")
+def route_get_user(request):
+    user_id = request['params']['id']
+    version = get_data_version()
+    include = request['query'].get('include') or ''
+    return conditional_response(request, make_etag('user', version, user_id, include),
+                                lambda: cached_response(('user', version, user_id, include),
+                                                        lambda: get_user(user_id, request['query'])))
+
+@router.route('DELETE', '/users/{id}', '/members/{id}', description="Elimina membro")
+def route_delete_user(request):
+    return delete_user(request['params']['id'])
+
+@router.route('GET', '/stats', description="Statistiche")
+def route_get_stats(request):
+    # newMembersToday cambia a mezzanotte anche senza scritture
+    version = get_data_version()
+    today = utc_today()
+    return conditional_response(request, make_etag('stats', version, today),
+                                lambda: cached_response(('stats', version, today), get_stats))
+
+# I rollup sono aggiornati dallo stream e non cambiano dataVersion: la cache scade solo per
+# TTL, e la chiave include la data perché l'intervallo predefinito termina oggi
+@router.route('GET', '/stats/timeseries', description="Serie storiche (from, to, granularity)")
+def route_get_stats_timeseries(request):
+    query_params = request['query']
+    today = datetime.datetime.utcnow().date().isoformat()
+    params_key = tuple(sorted(query_params.items()))
+    return cached_response(('timeseries', today, params_key),
+                           lambda: get_stats_timeseries(query_params))
+
+# ETag come /users e /stats (versione dei dati, data per newMembersToday e parametri): il
+# polling della dashboard riceve 304 finché nulla cambia. serverTime è l'ora della risposta
+# completa; niente cache delle risposte, perché la riporterebbe ferma
+@router.route('GET', '/dashboard', description="Dashboard: prima pagina di membri, statistiche e ora del server")
+def route_get_dashboard(request):
+    query_params = request['query']
+    version = get_data_version()
+    today = utc_today()
+    params_key = tuple(sorted(query_params.items()))
+    return conditional_response(request, make_etag('dashboard', version, today, params_key),
+                                lambda: get_dashboard(query_params))
+
+@router.route('POST', '/stats/recompute', middleware=(require_admin,), description="Ricalcolo statistiche (admin)")
+def route_recompute_stats(request):
+    return recompute_stats()
+
+@router.route('POST', '/exports', middleware=(require_admin, parse_json_body),
+              description="Esportazione completa dei membri su S3 (admin)")
+def route_create_export(request):
+    return create_export(request['json'])
+
+@router.route('GET', '/exports/{id}', middleware=(require_admin,), description="Stato esportazione (admin)")
+def route_get_export(request):
+    return get_export(request['params']['id'])
+
+@router.route('GET', '/cache/stats', middleware=(require_admin,), description="Contatori cache (admin)")
+def route_get_cache_stats(request):
+    return get_cache_stats()
+
 # Handler principale
 def handler(event, context):
+    # Invocazione asincrona di un job avviato da POST /exports (non è una richiesta HTTP)
+    if 'exportJob' in event:
+        job = gymExports.run_job(event['exportJob'], scan_members_for_export)
+        return {'exportId': event['exportJob'], 'status': job['jobStatus'] if job else None}
+
+    started = time.perf_counter()
+    gymMetrics.start_request()
+    request_log = {
+        'requestId': getattr(context, 'aws_request_id', None)
+                     or event.get('requestContext', {}).get('requestId'),
+        'method': None,
+        'route': None,
+        'status': None
+    }
+    response = None
     try:
-        logger.info("=== LAMBDA EXECUTION START ===")
-        logger.info("Full event received: %s", json.dumps(event, indent=2))
-        
         http_method = event.get('httpMethod') or event.get('requestContext', {}).get('http', {}).get('method')
         path = event.get('path') or event.get('requestContext', {}).get('http', {}).get('path')
-        
+        request_log['method'] = http_method
+
         if not http_method or not path:
-            return create_response(400, {"success": False, "error": "Invalid request"})
+            response = create_response(400, {"success": False, "error": "Invalid request"})
+            return response
 
         # Pulisci il path
-        path = re.sub(r'/+', '/', path)
+        path = SLASHES_REGEX.sub('/', path)
         if path.endswith('/') and len(path) > 1:
             path = path[:-1]
 
-        logger.info("Processing: %s %s", http_method, path)
-
         # Gestisci richieste CORS preflight
         if http_method == "OPTIONS":
-            logger.info("CORS preflight request")
-            return create_response(200, {"message": "CORS preflight successful"})
-            
-        # =====================
-        # GESTIONE DEI ROUTE
-        # =====================
-
-        # GET /users
-        if http_method == "GET" and (path == "/users" or path == "/members"):
-            logger.info("Route: GET users")
-            return get_users()
-
-        # GET /stats
-        if http_method == "GET" and path == "/stats":
-            logger.info("Route: GET stats")
-            return get_stats()
-
-        # POST /users
-        if http_method == "POST" and (path == "/users" or path == "/members"):
-            logger.info("Route: POST users")
-            user_data = {}
-            if event.get('body'):
-                try:
-                    user_data = json.loads(event['body'])
-                except json.JSONDecodeError:
-                    return create_response(400, {"success": False, "error": "Invalid JSON in request body"})
-            return create_user(user_data)
-
-        # DELETE /users/{id}
-        if http_method == "DELETE" and path.startswith("/users/"):
-            user_id = path.split('/')[2]
-            logger.info("Route: DELETE user %s", user_id)
-            if not user_id:
-                return create_response(400, {"success": False, "error": "User ID is required"})
-            return delete_user(user_id)
-
-        # Route non trovata
-        logger.info("Route not found: %s %s", http_method, path)
-        return create_response(404, {
-            "success": False,
-            "error": "Endpoint not found",
-            "availableEndpoints": [
-                "GET /users - Lista membri",
-                "POST /users - Crea membro",
-                "DELETE /users/{id} - Elimina membro",
-                "GET /stats - Statistiche"
-            ]
+            request_log['route'] = 'preflight'
+            response = create_response(200, {"message": "CORS preflight successful"})
+            return response
+
+        try:
+            with gymMetrics.phase('routing'):
+                view, params, template = router.resolve(http_method, path)
+        except RouteNotFound:
+            request_log['route'] = 'not-found'
+            response = create_response(404, {
+                "success": False,
+                "error": "Endpoint not found",
+                "availableEndpoints": router.endpoints
+            })
+            return response
+        except MethodNotAllowed as e:
+            request_log['route'] = 'method-not-allowed'
+            response = create_response(405, {
+                "success": False,
+                "error": "Method not allowed",
+                "allowedMethods": e.allowed_methods
+            }, headers={"Allow": ', '.join(e.allowed_methods + ['OPTIONS'])})
+            return response
+
+        request_log['route'] = template
+        response = view({
+            'method': http_method,
+            'path': path,
+            'route': template,
+            'params': params,
+            'query': event.get('queryStringParameters') or {},
+            'event': event
         })
+        with gymMetrics.phase('serialization'):
+            response = compress_response(response, get_header(event, 'Accept-Encoding'))
+        return response
 
     except Exception as e:
-        logger.error("=== LAMBDA EXECUTION ERROR ===")
-        logger.error("Error: %s", e)
-        logger.error("Stack:", exc_info=True)
-        return create_response(500, {
+        logger.error("Error: %s", e, exc_info=True)
+        response = create_response(500, {
             "success": False,
             "error": "Internal server error",
             "message": str(e)
         })
+        return response
     finally:
-        logger.info("=== LAMBDA EXECUTION END ===")
\ No newline at end of file
+        request_log['status'] = response['statusCode'] if response else None
+        request_log['durationMs'] = round((time.perf_counter() - started) * 1000, 2)
+        logger.info("%s", LazyJson(request_log))
+        gymMetrics.finish_request(f"{request_log['method']} {request_log['route']}",
+                                  request_log['status'], request_log['requestId'])
+        if LOG_SAMPLE_RATE and random.random() < LOG_SAMPLE_RATE:
+            logger.info("%s", LazyJson(lambda: {
+                'requestId': request_log['requestId'],
+                'sampled': True,
+                'event': redact(event),
+                'response': redact(response)
+            }))
+
+# Operazioni di manutenzione da eseguire dopo il deploy (vedi README), sulla tabella indicata
+# da STORAGE_BACKEND e DYNAMODB_REGION
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manutenzione della tabella gymcloudUsers")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('backfill-list-partition',
+                          help="aggiunge listPartition ai membri creati prima dell'indice per data di iscrizione")
+    subparsers.add_parser('backfill-email-sentinels',
+                          help="crea le sentinelle email dei membri creati prima del controllo transazionale")
+    args = parser.parse_args()
+
+    if args.command == 'backfill-list-partition':
+        print(f"Membri aggiornati: {backfill_list_partition()}")
+    else:
+        duplicates = backfill_email_sentinels()
+        print(f"Email duplicate: {len(duplicates)}")
+        for email in duplicates:
+            print(f"  {email}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+# Benchmark di gymUsersHandler.handler con un corpus di eventi API Gateway (v1 e v2) in
+# formato JSONL: ogni riga è {"name": ..., "weight": N, "event": {...}}. Gli eventi vengono
+# rieseguiti nello stesso processo contro un backend locale (gymStorage in memoria o SQLite)
+# popolato con il numero di membri richiesto, quindi si misura il costo CPU dell'handler
+# senza la latenza di rete di DynamoDB.
+#
+# Ogni dimensione dei dati gira in un processo separato, così il picco di RSS è per dimensione.
+# Segnaposto negli eventi: {{uuid}} (valore nuovo a ogni richiesta), {{userId}} (un membro
+# esistente, diverso a ogni richiesta) ed {{etag}} (ultimo ETag restituito per lo stesso path).
+#
+# Esempi:
+#   python replayBenchmark.py --members 1000 10000 100000
+#   python replayBenchmark.py --members 10000 --save-baseline benchmarks/baseline.json
+#   python replayBenchmark.py --members 10000 --baseline benchmarks/baseline.json --threshold 20
+
+HANDLER_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(HANDLER_DIR, 'benchmarks', 'events.jsonl')
+MEMBERSHIP_TYPES = ['monthly', 'quarterly', 'yearly', 'basic', 'premium']
+STATUSES = ['active', 'active', 'active', 'suspended', 'expired']
+
+def load_corpus(path):
+    corpus = []
+    with open(path, encoding='utf-8') as corpus_file:
+        for line_number, line in enumerate(corpus_file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if 'name' not in entry or 'event' not in entry:
+                raise ValueError(f"{path}:{line_number}: servono i campi name ed event")
+            corpus.append(entry)
+    return corpus
+
+# Percentile con interpolazione lineare sui campioni ordinati
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return None
+    position = (len(sorted_samples) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_samples) - 1)
+    return sorted_samples[lower] + (sorted_samples[upper] - sorted_samples[lower]) * (position - lower)
+
+# Popola il backend con membri sintetici, distribuiti su date, stati e tipi di abbonamento
+def seed_members(handler_module, members, rng):
+    users = []
+    for index in range(members):
+        membership_type = rng.choice(MEMBERSHIP_TYPES)
+        user = handler_module.build_user_item({
+            'name': f"Membro {index} Benchmark",
+            'email': f"member{index}@bench.example.com",
+            'phone': f"333{index:07d}",
+            'subscriptionType': membership_type
+        })
+        user['status'] = rng.choice(STATUSES)
+        user['createdAt'] = f"202{rng.randrange(0, 6)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}" \
+                            f"T{rng.randrange(24):02d}:{rng.randrange(60):02d}:00.{index:06d}"
+        users.append(user)
+    failed = handler_module.write_members_batch(users)
+    if failed:
+        raise RuntimeError(f"{len(failed)} membri non scritti durante il popolamento")
+    return [user['userId'] for user in users]
+
+# Evento pronto per l'invocazione, con i segnaposto sostituiti
+def render_event(entry, member_ids, etags):
+    text = json.dumps(entry['event'])
+    if '{{uuid}}' in text:
+        text = text.replace('{{uuid}}', uuid.uuid4().hex[:12])
+    if '{{userId}}' in text:
+        text = text.replace('{{userId}}', member_ids.pop() if member_ids else 'missing-member')
+    event = json.loads(text)
+    path = event.get('path') or event.get('rawPath')
+    if '{{etag}}' in text:
+        event = json.loads(text.replace('{{etag}}', etags.get(path, '').replace('"', '\\"')))
+    return event, path
+
+def run_worker(args):
+    import logging
+    logging.disable(logging.CRITICAL)
+    os.environ['STORAGE_BACKEND'] = args.backend
+    if args.backend == 'sqlite':
+        os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='gym-bench-'), 'bench.sqlite3')
+    if args.no_cache:
+        os.environ['CACHE_TTL_SECONDS'] = '0'
+    os.environ.setdefault('CURSOR_SECRET', 'benchmark')
+    os.environ.setdefault('METRICS_MODE', 'off')
+    sys.path.insert(0, HANDLER_DIR)
+    import gymUsersHandler
+
+    rng = random.Random(args.seed)
+    corpus = load_corpus(args.corpus)
+    seed_started = time.perf_counter()
+    member_ids = seed_members(gymUsersHandler, args.members, rng)
+    seed_seconds = time.perf_counter() - seed_started
+    rng.shuffle(member_ids)
+
+    schedule = [entry for entry in corpus for _ in range(max(1, int(entry.get('weight', 1))))]
+    etags = {}
+    timings = {entry['name']: [] for entry in corpus}
+    allocations = {entry['name']: [] for entry in corpus}
+    statuses = {entry['name']: set() for entry in corpus}
+
+    def replay(entry, record, trace):
+        event, path = render_event(entry, member_ids, etags)
+        if trace:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        response = gymUsersHandler.handler(event, None)
+        elapsed = time.perf_counter() - started
+        if trace:
+            allocations[entry['name']].append(tracemalloc.get_traced_memory()[1] - before)
+        if 'ETag' in response.get('headers', {}):
+            etags[path] = response['headers']['ETag']
+        if record:
+            timings[entry['name']].append(elapsed * 1000)
+            statuses[entry['name']].add(response['statusCode'])
+
+    # Riscaldamento, poi misura dei tempi senza tracemalloc (che rallenta le allocazioni)
+    for entry in schedule:
+        replay(entry, False, False)
+    for _ in range(args.rounds):
+        for entry in rng.sample(schedule, len(schedule)):
+            replay(entry, True, False)
+
+    # Passaggio separato per le allocazioni: picco di memoria Python allocata per richiesta
+    tracemalloc.start()
+    for entry in schedule:
+        replay(entry, False, True)
+    tracemalloc.stop()
+
+    import resource
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss_kb //= 1024
+
+    routes = {}
+    for name, samples in timings.items():
+        samples.sort()
+        routes[name] = {
+            'requests': len(samples),
+            'statusCodes': sorted(statuses[name]),
+            'p50Ms': round(percentile(samples, 0.50), 3),
+            'p95Ms': round(percentile(samples, 0.95), 3),
+            'p99Ms': round(percentile(samples, 0.99), 3),
+            'meanMs': round(statistics.fmean(samples), 3),
+            'allocPeakKb': round(max(allocations[name]) / 1024, 1) if allocations[name] else None
+        }
+    return {
+        'members': args.members,
+        'backend': args.backend,
+        'seedSeconds': round(seed_seconds, 2),
+        'peakRssMb': round(peak_rss_kb / 1024, 1),
+        'routes': routes
+    }
+
+def run_size(args, members):
+    command = [sys.executable, os.path.abspath(__file__), '--worker',
+               '--members', str(members), '--backend', args.backend, '--corpus', args.corpus,
+               '--rounds', str(args.rounds), '--seed', str(args.seed)]
+    if args.no_cache:
+        command.append('--no-cache')
+    result = subprocess.run(command, cwd=HANDLER_DIR, capture_output=True, text=True,
+                            env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'})
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or "processo terminato con codice %d" % result.returncode)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+# Route più lente della baseline oltre la soglia (confronto su p95 e p99). Le differenze
+# sotto min_delta_ms sono rumore di misura e vengono ignorate
+def compare_with_baseline(report, baseline, threshold, min_delta_ms):
+    regressions = []
+    for size, result in report.items():
+        if baseline.get(size, {}).get('backend') != result['backend']:
+            continue
+        baseline_routes = baseline[size]['routes']
+        for name, current in result['routes'].items():
+            previous = baseline_routes.get(name)
+            if not previous:
+                continue
+            for metric in ('p95Ms', 'p99Ms'):
+                if previous[metric] and current[metric] > previous[metric] * (1 + threshold / 100) \
+                        and current[metric] - previous[metric] >= min_delta_ms:
+                    regressions.append(
+                        f"{size} membri, {name}: {metric} {previous[metric]} -> {current[metric]} "
+                        f"(+{(current[metric] / previous[metric] - 1) * 100:.0f}%)"
+                    )
+    return regressions
+
+def print_report(report):
+    for size, result in report.items():
+        print(f"\n{size} membri ({result['backend']}): popolamento {result['seedSeconds']} s, "
+              f"picco RSS {result['peakRssMb']} MB")
+        print(f"{'Route':<26} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'alloc KB':>9}  status")
+        for name, route in result['routes'].items():
+            print(f"{name:<26} {route['requests']:>5} {route['p50Ms']:>9} {route['p95Ms']:>9} "
+                  f"{route['p99Ms']:>9} {route['allocPeakKb']:>9}  {route['statusCodes']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay di un corpus di eventi contro gymUsersHandler")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help="file JSONL degli eventi")
+    parser.add_argument('--members', type=int, nargs='+', default=[1000, 10000],
+                        help="dimensioni dei dati da misurare (es. 1000 10000 100000)")
+    parser.add_argument('--backend', choices=['memory', 'sqlite'], default='memory')
+    parser.add_argument('--rounds', type=int, default=20, help="ripetizioni del corpus misurate per dimensione")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-cache', action='store_true', help="disattiva la cache delle risposte")
+    parser.add_argument('--baseline', help="report JSON con cui confrontare i risultati")
+    parser.add_argument('--threshold', type=float, default=20.0, help="regressione ammessa in percentuale")
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help="differenza minima in ms per considerare una regressione")
+    parser.add_argument('--save-baseline', help="salva il report come nuova baseline")
+    parser.add_argument('--json', action='store_true', help="stampa il report in JSON")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.members = args.members[0]
+        print(json.dumps(run_worker(args)))
+        return 0
+
+    try:
+        report = {str(members): run_size(args, members) for members in args.members}
+    except (RuntimeError, ValueError) as e:
+        print(f"Errore durante il benchmark: {e}")
+        return 2
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+        print(f"\nBaseline salvata in {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            regressions = compare_with_baseline(report, json.load(baseline_file), args.threshold,
+                                                args.min_delta_ms)
+        if regressions:
+            print(f"\nRegressioni oltre il {args.threshold}%:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNessuna regressione oltre il {args.threshold}% rispetto alla baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,63 +1,113 @@
-import boto3
 import json
+import secrets
 import time
 import zipfile
 import os
 from botocore.exceptions import ClientError
 
-# Nome del file sorgente della tua Lambda
+import awsClients
+import testS3
+
+# Nome del file sorgente della tua Lambda e moduli da includere nel pacchetto
 LAMBDA_SOURCE_FILE = 'gymUsersHandler.py'
+LAMBDA_MODULES = ['gymStorage.py', 'gymMetrics.py', 'gymStatsStream.py', 'gymExports.py', 'gymCsvImport.py',
+                  'gymIdempotency.py', 'gymCodec.py', 'awsClients.py']
 LAMBDA_FUNCTION_NAME = 'gymUsersHandler'
+# Consumer dello stream della tabella (stesso pacchetto, handler gymStatsStream.handler)
+STREAM_FUNCTION_NAME = 'gymStatsStream'
+STREAM_TABLE_NAME = 'gymcloudUsers'
+# Importazione CSV avviata dalle notifiche S3 (handler gymCsvImport.handler)
+IMPORT_FUNCTION_NAME = 'gymCsvImport'
 LAMBDA_ROLE_NAME = 'gymUsersLambdaRole'
+# API Gateway chiude le richieste dopo 29 s; il limite più alto serve ai job di
+# esportazione, eseguiti in invocazioni asincrone
+LAMBDA_TIMEOUT = 300
+
+REGION = awsClients.DEFAULT_REGION
+
+_cursor_secret = None
+
+# Chiave di firma dei cursori di paginazione, uguale per tutte le funzioni e stabile tra un
+# deploy e l'altro (i cursori già emessi restano validi): CURSOR_SECRET dell'ambiente, poi
+# quella già configurata sulla funzione dell'API, altrimenti una nuova chiave casuale
+def get_cursor_secret(lambda_client):
+    global _cursor_secret
+    if _cursor_secret is None:
+        _cursor_secret = os.environ.get('CURSOR_SECRET')
+    if not _cursor_secret:
+        try:
+            configuration = lambda_client.get_function_configuration(FunctionName=LAMBDA_FUNCTION_NAME)
+            _cursor_secret = configuration.get('Environment', {}).get('Variables', {}).get('CURSOR_SECRET')
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+    if not _cursor_secret:
+        print("CURSOR_SECRET non configurato: generazione di una nuova chiave")
+        _cursor_secret = secrets.token_hex(32)
+    return _cursor_secret
 
-REGION = 'us-east-1'
+# Variabili d'ambiente della funzione: quelle già configurate più quelle gestite dal deploy
+def lambda_environment(lambda_client, current=None):
+    variables = dict(current or {})
+    variables['CURSOR_SECRET'] = get_cursor_secret(lambda_client)
+    variables['DYNAMODB_REGION'] = awsClients.DYNAMODB_REGION
+    return {'Variables': variables}
 
-def create_lambda_function():
+def create_lambda_function(function_name=LAMBDA_FUNCTION_NAME, handler=None):
     """
     Crea un pacchetto .zip dal codice locale, crea un ruolo IAM
     e deploya la funzione Lambda su AWS.
     """
+    handler = handler or f"{os.path.splitext(os.path.basename(LAMBDA_SOURCE_FILE))[0]}.handler"
     print("Creazione pacchetto di deployment...")
     zip_file_name = 'lambda_package.zip'
     with zipfile.ZipFile(zip_file_name, 'w', zipfile.ZIP_DEFLATED) as zipf:
         zipf.write(LAMBDA_SOURCE_FILE, os.path.basename(LAMBDA_SOURCE_FILE))
+        for module in LAMBDA_MODULES:
+            zipf.write(module, os.path.basename(module))
 
-    lambda_client = boto3.client('lambda')
-    iam_client = boto3.client('iam')
-    account_id = boto3.client('sts').get_caller_identity()['Account']
-    region = boto3.Session().region_name
+    lambda_client = awsClients.get_client('lambda', REGION)
+    iam_client = awsClients.get_client('iam', REGION)
 
     try:
         # Crea o ottieni un ruolo IAM per la Lambda
         print("Creazione o recupero ruolo IAM per Lambda...")
         role_arn = create_or_get_iam_role(iam_client, LAMBDA_ROLE_NAME)
+        put_self_invoke_policy(iam_client, LAMBDA_ROLE_NAME)
         
         # Attendi che il ruolo sia propagato
         time.sleep(10)
 
         # Cerca se la funzione Lambda esiste già per aggiornarla
         try:
-            lambda_client.get_function(FunctionName=LAMBDA_FUNCTION_NAME)
-            print(f"Funzione Lambda '{LAMBDA_FUNCTION_NAME}' esistente. Aggiornamento del codice...")
+            current = lambda_client.get_function(FunctionName=function_name)['Configuration']
+            print(f"Funzione Lambda '{function_name}' esistente. Aggiornamento del codice...")
             response = lambda_client.update_function_code(
-                FunctionName=LAMBDA_FUNCTION_NAME,
+                FunctionName=function_name,
                 ZipFile=open(zip_file_name, 'rb').read()
             )
             lambda_arn = response['FunctionArn']
+            lambda_client.get_waiter('function_updated').wait(FunctionName=function_name)
+            lambda_client.update_function_configuration(
+                FunctionName=function_name,
+                Timeout=LAMBDA_TIMEOUT,
+                Environment=lambda_environment(lambda_client, current.get('Environment', {}).get('Variables'))
+            )
 
         except ClientError as e:
             if e.response['Error']['Code'] == 'ResourceNotFoundException':
-                print(f"Creazione della funzione Lambda '{LAMBDA_FUNCTION_NAME}'...")
+                print(f"Creazione della funzione Lambda '{function_name}'...")
                 response = lambda_client.create_function(
-                    FunctionName=LAMBDA_FUNCTION_NAME,
+                    FunctionName=function_name,
                     Runtime='python3.9',
                     Role=role_arn,
-                    Handler=f"{os.path.splitext(os.path.basename(LAMBDA_SOURCE_FILE))[0]}.handler",
+                    Handler=handler,
                     Code={
                         'ZipFile': open(zip_file_name, 'rb').read()
                     },
-                    Timeout=30,
-                    MemorySize=128
+                    Timeout=LAMBDA_TIMEOUT,
+                    MemorySize=128,
+                    Environment=lambda_environment(lambda_client)
                 )
                 lambda_arn = response['FunctionArn']
             else:
@@ -116,13 +166,112 @@ def create_or_get_iam_role(iam_client, role_name):
         else:
             raise e
 
+def create_stream_consumer():
+    """
+    Deploya gymStatsStream e lo collega allo stream della tabella dei membri
+    (da eseguire dopo testDynamoDB, che abilita stream e TTL)
+    """
+    # Lo stream si collega solo a una Lambda nella stessa regione della tabella
+    if REGION != awsClients.DYNAMODB_REGION:
+        print(f"La tabella è in {awsClients.DYNAMODB_REGION} e le Lambda in {REGION}: "
+              f"eseguire con AWS_REGION={awsClients.DYNAMODB_REGION} per collegare lo stream")
+        return None
+
+    lambda_client = awsClients.get_client('lambda', REGION)
+    dynamodb_client = awsClients.get_client('dynamodb', awsClients.DYNAMODB_REGION)
+
+    stream_arn = dynamodb_client.describe_table(TableName=STREAM_TABLE_NAME)['Table'].get('LatestStreamArn')
+    if not stream_arn:
+        print(f"Stream non abilitato su {STREAM_TABLE_NAME}: eseguire prima testDynamoDB.py")
+        return None
+
+    function_arn = create_lambda_function(STREAM_FUNCTION_NAME, 'gymStatsStream.handler')
+    if not function_arn:
+        return None
+
+    try:
+        mappings = lambda_client.list_event_source_mappings(
+            EventSourceArn=stream_arn, FunctionName=STREAM_FUNCTION_NAME
+        )['EventSourceMappings']
+        if mappings:
+            print(f"Event source mapping già presente: {mappings[0]['UUID']}")
+            return mappings[0]['UUID']
+
+        # Con ReportBatchItemFailures un errore ripete lo shard dal primo record non
+        # applicato; i record già applicati sono riconosciuti dai marcatori EVENT#
+        mapping = lambda_client.create_event_source_mapping(
+            EventSourceArn=stream_arn,
+            FunctionName=STREAM_FUNCTION_NAME,
+            StartingPosition='LATEST',
+            BatchSize=100,
+            MaximumBatchingWindowInSeconds=5,
+            MaximumRetryAttempts=10,
+            FunctionResponseTypes=['ReportBatchItemFailures']
+        )
+        print(f"Stream collegato a {STREAM_FUNCTION_NAME}: {mapping['UUID']}")
+        return mapping['UUID']
+    except ClientError as e:
+        print(f"Errore nel collegamento dello stream: {e}")
+        return None
+
+def put_self_invoke_policy(iam_client, role_name):
+    """
+    Permette alle funzioni di invocare se stesse in modo asincrono
+    (job di POST /exports e ripresa delle importazioni CSV)
+    """
+    account_id = awsClients.get_account_id()
+    iam_client.put_role_policy(
+        RoleName=role_name,
+        PolicyName='gymUsersSelfInvoke',
+        PolicyDocument=json.dumps({
+            "Version": "2012-10-17",
+            "Statement": [{
+                "Effect": "Allow",
+                "Action": "lambda:InvokeFunction",
+                "Resource": [
+                    f"arn:aws:lambda:{REGION}:{account_id}:function:{function_name}"
+                    for function_name in (LAMBDA_FUNCTION_NAME, IMPORT_FUNCTION_NAME)
+                ]
+            }]
+        })
+    )
+
+def create_csv_importer():
+    """
+    Deploya gymCsvImport e la collega al bucket privato delle importazioni
+    """
+    lambda_client = awsClients.get_client('lambda', REGION)
+    function_arn = create_lambda_function(IMPORT_FUNCTION_NAME, 'gymCsvImport.handler')
+    if not function_arn:
+        return None
+
+    bucket_name = os.environ.get('IMPORT_BUCKET', 'gymcloud-imports')
+    try:
+        lambda_client.add_permission(
+            FunctionName=IMPORT_FUNCTION_NAME,
+            StatementId=f"s3-import-{bucket_name}",
+            Action='lambda:InvokeFunction',
+            Principal='s3.amazonaws.com',
+            SourceArn=f"arn:aws:s3:::{bucket_name}",
+            SourceAccount=awsClients.get_account_id()
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ResourceConflictException':
+            print(f"Errore nell'aggiunta dei permessi per {IMPORT_FUNCTION_NAME}: {e}")
+            return None
+
+    if not testS3.create_import_bucket(function_arn):
+        return None
+    print(f"Importazione CSV attiva: caricare i file in s3://{bucket_name}/imports/")
+    return function_arn
+
 def create_api_gateway():
     """
     Crea l'API Gateway, le risorse e le integra con la Lambda.
     """
     # Inizializza i client
-    apigateway = boto3.client('apigateway')
-    lambda_client = boto3.client('lambda')
+    apigateway = awsClients.get_client('apigateway', REGION)
+    lambda_client = awsClients.get_client('lambda', REGION)
     
     api_name = 'gym-users-api'
     
@@ -141,7 +290,9 @@ def create_api_gateway():
             description='API per gestione utenti gym - comunicazione tra S3 e DynamoDB',
             endpointConfiguration={
                 'types': ['REGIONAL']
-            }
+            },
+            # Necessario per le risposte compresse (isBase64Encoded) della Lambda
+            binaryMediaTypes=['*/*']
         )
         
         api_id = api_response['id']
@@ -244,7 +395,31 @@ def create_api_gateway():
         
         # Integra DELETE con Lambda
         setup_lambda_integration(apigateway, api_id, user_id_resource_id, 'DELETE', lambda_arn)
-        
+
+        # Crea risorsa proxy /{proxy+} per tutte le altre route: il routing
+        # avviene nella Lambda, quindi i nuovi endpoint non richiedono risorse dedicate
+        print("Creazione risorsa /{proxy+}...")
+        proxy_resource = apigateway.create_resource(
+            restApiId=api_id,
+            parentId=root_resource_id,
+            pathPart='{proxy+}'
+        )
+        proxy_resource_id = proxy_resource['id']
+
+        enable_cors(apigateway, api_id, proxy_resource_id)
+
+        apigateway.put_method(
+            restApiId=api_id,
+            resourceId=proxy_resource_id,
+            httpMethod='ANY',
+            authorizationType='NONE',
+            requestParameters={
+                'method.request.path.proxy': True
+            }
+        )
+
+        setup_lambda_integration(apigateway, api_id, proxy_resource_id, 'ANY', lambda_arn)
+
         # 12. Aggiungi permessi Lambda per API Gateway
         add_lambda_permissions(lambda_client, LAMBDA_FUNCTION_NAME, api_id)
         
@@ -257,8 +432,7 @@ def create_api_gateway():
         )
         
         # 14. URL dell'API
-        region = boto3.Session().region_name or 'us-east-1'
-        api_url = f"https://{api_id}.execute-api.{region}.amazonaws.com/nuovafase"
+        api_url = f"https://{api_id}.execute-api.{REGION}.amazonaws.com/nuovafase"
         
         print(f"\n{'='*60}")
         print("API GATEWAY CREATO CON SUCCESSO!")
@@ -269,6 +443,9 @@ def create_api_gateway():
         print(f"POST User: {api_url}/users") 
         print(f"DELETE User: {api_url}/users/{{id}}")
         print(f"GET Stats: {api_url}/stats")
+        print(f"GET Dashboard: {api_url}/dashboard")
+        print(f"POST Export: {api_url}/exports (admin)")
+        print(f"GET Stats timeseries: {api_url}/stats/timeseries?from=&to=&granularity=day")
         print(f"{'='*60}")
         
         return {
@@ -325,7 +502,7 @@ def enable_cors(apigateway, api_id, resource_id):
             statusCode='200',
             responseParameters={
                 'method.response.header.Access-Control-Allow-Origin': "'*'",
-                'method.response.header.Access-Control-Allow-Headers': "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'",
+                'method.response.header.Access-Control-Allow-Headers': "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,X-Admin-Token,If-None-Match,Idempotency-Key'",
                 'method.response.header.Access-Control-Allow-Methods': "'GET,POST,PUT,DELETE,OPTIONS'"
             }
         )
@@ -337,8 +514,7 @@ def enable_cors(apigateway, api_id, resource_id):
 
 def setup_lambda_integration(apigateway, api_id, resource_id, http_method, lambda_arn):
     try:
-        region = boto3.Session().region_name or 'us-east-1'
-        lambda_uri = f"arn:aws:apigateway:{region}:lambda:path/2015-03-31/functions/{lambda_arn}/invocations"
+        lambda_uri = f"arn:aws:apigateway:{REGION}:lambda:path/2015-03-31/functions/{lambda_arn}/invocations"
         
         # Configura integrazione (non toccare questa parte)
         apigateway.put_integration(
@@ -382,10 +558,7 @@ def add_lambda_permissions(lambda_client, function_name, api_id):
     # Funzione per aggiungere i permessi (non modificata)
     # ...
     try:
-        account_id = boto3.client('sts').get_caller_identity()['Account']
-        region = boto3.Session().region_name or 'us-east-1'
-        
-        source_arn = f"arn:aws:execute-api:{region}:{account_id}:{api_id}/*/*"
+        source_arn = f"arn:aws:execute-api:{REGION}:{awsClients.get_account_id()}:{api_id}/*/*"
         
         lambda_client.add_permission(
             FunctionName=function_name,
@@ -403,6 +576,8 @@ def add_lambda_permissions(lambda_client, function_name, api_id):
 
 if __name__ == "__main__":
     result = create_api_gateway()
+    create_stream_consumer()
+    create_csv_importer()
     
     if result:
         print(f"\n🚀 SETUP COMPLETATO!")
@@ -411,6 +586,7 @@ if __name__ == "__main__":
         print(f"- POST {result['api_url']}/users (per creare un nuovo utente)")
         print(f"- DELETE {result['api_url']}/users/{{id}} (per eliminare un utente)")
         print(f"- GET {result['api_url']}/stats (per ottenere statistiche)")
+        print(f"- GET {result['api_url']}/dashboard (membri e statistiche in una sola richiesta)")
         print(f"\nEsempio POST body:")
         print(json.dumps({
             "name": "Mario Rossi",
@@ -1,10 +1,101 @@
-import boto3
+import os
 import time
 from botocore.exceptions import ClientError
 
+import awsClients
+
+# Indici secondari globali usati da gymUsersHandler per i filtri di GET /users
+GLOBAL_SECONDARY_INDEXES = [
+    {
+        'IndexName': 'status-createdAt-index',
+        'KeySchema': [
+            {'AttributeName': 'status', 'KeyType': 'HASH'},
+            {'AttributeName': 'createdAt', 'KeyType': 'RANGE'}
+        ],
+        'Projection': {'ProjectionType': 'ALL'}
+    },
+    {
+        'IndexName': 'membershipType-createdAt-index',
+        'KeySchema': [
+            {'AttributeName': 'membershipType', 'KeyType': 'HASH'},
+            {'AttributeName': 'createdAt', 'KeyType': 'RANGE'}
+        ],
+        'Projection': {'ProjectionType': 'ALL'}
+    },
+    # Indice sparso: solo i membri hanno listPartition (valore costante "MEMBERS"),
+    # per leggere gli iscritti più recenti con una Query ordinata per createdAt
+    {
+        'IndexName': 'listPartition-createdAt-index',
+        'KeySchema': [
+            {'AttributeName': 'listPartition', 'KeyType': 'HASH'},
+            {'AttributeName': 'createdAt', 'KeyType': 'RANGE'}
+        ],
+        'Projection': {'ProjectionType': 'ALL'}
+    }
+]
+
+# Stream letto da gymStatsStream (rollup delle statistiche) e TTL dei marcatori degli eventi
+STREAM_SPECIFICATION = {'StreamEnabled': True, 'StreamViewType': 'NEW_AND_OLD_IMAGES'}
+TTL_ATTRIBUTE = 'expiresAt'
+
+ATTRIBUTE_DEFINITIONS = [
+    {'AttributeName': 'userId', 'AttributeType': 'S'},  # String
+    {'AttributeName': 'status', 'AttributeType': 'S'},
+    {'AttributeName': 'membershipType', 'AttributeType': 'S'},
+    {'AttributeName': 'createdAt', 'AttributeType': 'S'},
+    {'AttributeName': 'listPartition', 'AttributeType': 'S'}
+]
+
+def ensure_global_secondary_indexes(table):
+    """
+    Aggiunge a una tabella esistente gli indici mancanti (uno alla volta, come richiesto da DynamoDB)
+    """
+    client = table.meta.client
+    description = client.describe_table(TableName=table.name)['Table']
+    existing = {index['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])}
+
+    for index in GLOBAL_SECONDARY_INDEXES:
+        if index['IndexName'] in existing:
+            continue
+        print(f"Creazione indice {index['IndexName']} in corso...")
+        client.update_table(
+            TableName=table.name,
+            AttributeDefinitions=ATTRIBUTE_DEFINITIONS,
+            GlobalSecondaryIndexUpdates=[{'Create': index}]
+        )
+        # Attendi che l'indice sia attivo prima di crearne un altro
+        while True:
+            time.sleep(10)
+            indexes = client.describe_table(TableName=table.name)['Table'].get('GlobalSecondaryIndexes', [])
+            status = next((i['IndexStatus'] for i in indexes if i['IndexName'] == index['IndexName']), None)
+            if status == 'ACTIVE':
+                print(f"Indice {index['IndexName']} attivo")
+                break
+
+def ensure_stream_and_ttl(table):
+    """
+    Abilita lo stream e il TTL su una tabella che non li ha
+    """
+    client = table.meta.client
+    description = client.describe_table(TableName=table.name)['Table']
+    if not description.get('StreamSpecification', {}).get('StreamEnabled'):
+        print(f"Abilitazione stream su {table.name}...")
+        client.update_table(TableName=table.name, StreamSpecification=STREAM_SPECIFICATION)
+        client.get_waiter('table_exists').wait(TableName=table.name)
+
+    ttl = client.describe_time_to_live(TableName=table.name)['TimeToLiveDescription']
+    if ttl.get('TimeToLiveStatus') not in ('ENABLED', 'ENABLING'):
+        print(f"Abilitazione TTL su {table.name} (attributo {TTL_ATTRIBUTE})...")
+        client.update_time_to_live(
+            TableName=table.name,
+            TimeToLiveSpecification={'Enabled': True, 'AttributeName': TTL_ATTRIBUTE}
+        )
+
+    return client.describe_table(TableName=table.name)['Table']['LatestStreamArn']
+
 def create_dynamodb_table():
     # Inizializza il client DynamoDB
-    dynamodb = boto3.resource('dynamodb')
+    dynamodb = awsClients.get_resource('dynamodb', awsClients.DYNAMODB_REGION)
     
     table_name = 'gymcloudUsers'
     
@@ -14,6 +105,8 @@ def create_dynamodb_table():
             table = dynamodb.Table(table_name)
             table.meta.client.describe_table(TableName=table_name)
             print(f"Tabella {table_name} esiste già")
+            ensure_global_secondary_indexes(table)
+            ensure_stream_and_ttl(table)
             return table
         except ClientError as e:
             if e.response['Error']['Code'] != 'ResourceNotFoundException':
@@ -28,12 +121,9 @@ def create_dynamodb_table():
                     'KeyType': 'HASH'  # Chiave di partizione
                 }
             ],
-            AttributeDefinitions=[
-                {
-                    'AttributeName': 'userId',
-                    'AttributeType': 'S'  # String
-                }
-            ],
+            AttributeDefinitions=ATTRIBUTE_DEFINITIONS,
+            GlobalSecondaryIndexes=GLOBAL_SECONDARY_INDEXES,
+            StreamSpecification=STREAM_SPECIFICATION,
             BillingMode='PAY_PER_REQUEST'  # On-demand billing per GET e POST
         )
         
@@ -42,6 +132,7 @@ def create_dynamodb_table():
         # Attendi che la tabella sia attiva
         table.meta.client.get_waiter('table_exists').wait(TableName=table_name)
         print(f"Tabella {table_name} creata con successo!")
+        ensure_stream_and_ttl(table)
         
         # Verifica lo stato della tabella
         response = table.meta.client.describe_table(TableName=table_name)
@@ -63,6 +154,46 @@ def create_dynamodb_table():
         print(f"Errore generico: {e}")
         return None
 
+def create_idempotency_table():
+    """
+    Crea la tabella delle chiavi di idempotenza di POST /users (gymIdempotency), con TTL
+    su expiresAt: le risposte salvate vengono eliminate da DynamoDB dopo la scadenza
+    """
+    dynamodb = awsClients.get_resource('dynamodb', awsClients.DYNAMODB_REGION)
+    table_name = os.environ.get('IDEMPOTENCY_TABLE', 'gymcloudIdempotency')
+
+    try:
+        try:
+            table = dynamodb.Table(table_name)
+            table.meta.client.describe_table(TableName=table_name)
+            print(f"Tabella {table_name} esiste già")
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise e
+            table = dynamodb.create_table(
+                TableName=table_name,
+                KeySchema=[{'AttributeName': 'idempotencyKey', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'idempotencyKey', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+            print(f"Creazione tabella {table_name} in corso...")
+            table.meta.client.get_waiter('table_exists').wait(TableName=table_name)
+            print(f"Tabella {table_name} creata con successo!")
+
+        client = table.meta.client
+        ttl = client.describe_time_to_live(TableName=table_name)['TimeToLiveDescription']
+        if ttl.get('TimeToLiveStatus') not in ('ENABLED', 'ENABLING'):
+            print(f"Abilitazione TTL su {table_name} (attributo {TTL_ATTRIBUTE})...")
+            client.update_time_to_live(
+                TableName=table_name,
+                TimeToLiveSpecification={'Enabled': True, 'AttributeName': TTL_ATTRIBUTE}
+            )
+        return table
+
+    except ClientError as e:
+        print(f"Errore durante la creazione della tabella: {e}")
+        return None
+
 def test_table_operations(table):
     """
     Test di operazioni GET e POST sulla tabella
@@ -79,7 +210,8 @@ def test_table_operations(table):
                 'userId': 'test-user-001',
                 'name': 'Mario Rossi',
                 'email': 'mario.rossi@email.com',
-                'createdAt': int(time.time())
+                # Stringa ISO: createdAt è chiave di ordinamento degli indici
+                'createdAt': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime())
             }
         )
         print("Elemento inserito con successo")
@@ -105,6 +237,7 @@ def test_table_operations(table):
 if __name__ == "__main__":
     # Crea la tabella
     table = create_dynamodb_table()
+    create_idempotency_table()
     
     # Esegui test opzionali
     if table:
@@ -1,10 +1,12 @@
-import boto3
 import json
+import os
 from botocore.exceptions import ClientError
 
+import awsClients
+
 def create_s3_bucket_for_website():
     # Inizializza il client S3
-    s3_client = boto3.client('s3')
+    s3_client = awsClients.get_client('s3')
     
     bucket_name = 'gym-users-fronted'
     
@@ -114,5 +116,104 @@ def create_s3_bucket_for_website():
     
     return True
 
+def create_private_bucket(bucket_name, expiration_days=None):
+    """
+    Crea un bucket privato (accesso pubblico bloccato, cifratura SSE-S3). Gli upload
+    multipart incompleti vengono eliminati dopo un giorno e, con expiration_days,
+    anche gli oggetti dopo il numero di giorni indicato
+    """
+    s3_client = awsClients.get_client('s3')
+    region = s3_client.meta.region_name
+
+    try:
+        try:
+            s3_client.head_bucket(Bucket=bucket_name)
+            print(f"Bucket {bucket_name} esiste già, procedo con la configurazione")
+        except ClientError as e:
+            if e.response['Error']['Code'] != '404':
+                raise e
+            if region == 'us-east-1':
+                s3_client.create_bucket(Bucket=bucket_name)
+            else:
+                s3_client.create_bucket(
+                    Bucket=bucket_name,
+                    CreateBucketConfiguration={'LocationConstraint': region}
+                )
+            print(f"Bucket {bucket_name} creato con successo nella regione {region}")
+
+        s3_client.put_public_access_block(
+            Bucket=bucket_name,
+            PublicAccessBlockConfiguration={
+                'BlockPublicAcls': True,
+                'IgnorePublicAcls': True,
+                'BlockPublicPolicy': True,
+                'RestrictPublicBuckets': True
+            }
+        )
+        s3_client.put_bucket_encryption(
+            Bucket=bucket_name,
+            ServerSideEncryptionConfiguration={
+                'Rules': [{'ApplyServerSideEncryptionByDefault': {'SSEAlgorithm': 'AES256'}}]
+            }
+        )
+
+        rule = {
+            'ID': 'cleanup',
+            'Filter': {'Prefix': ''},
+            'Status': 'Enabled',
+            'AbortIncompleteMultipartUpload': {'DaysAfterInitiation': 1}
+        }
+        if expiration_days:
+            rule['Expiration'] = {'Days': expiration_days}
+        s3_client.put_bucket_lifecycle_configuration(
+            Bucket=bucket_name,
+            LifecycleConfiguration={'Rules': [rule]}
+        )
+        print(f"Bucket {bucket_name} privato configurato")
+
+    except ClientError as e:
+        print(f"Errore durante la creazione del bucket {bucket_name}: {e}")
+        return False
+
+    return True
+
+def create_export_bucket():
+    # Esportazioni dei membri (gymExports): file con dati personali, eliminati dopo 7 giorni
+    return create_private_bucket(os.environ.get('EXPORT_BUCKET', 'gymcloud-exports'), expiration_days=7)
+
+def create_import_bucket(function_arn=None):
+    """
+    Bucket privato per le importazioni CSV (gymCsvImport). Con function_arn i file .csv
+    caricati sotto imports/ avviano la Lambda; i report delle righe scartate sono scritti
+    sotto import-reports/, fuori dal prefisso della notifica. Non si usa il bucket del
+    sito perché è pubblico in lettura e i file contengono dati personali
+    """
+    bucket_name = os.environ.get('IMPORT_BUCKET', 'gymcloud-imports')
+    if not create_private_bucket(bucket_name, expiration_days=30):
+        return False
+    if not function_arn:
+        return True
+
+    try:
+        awsClients.get_client('s3').put_bucket_notification_configuration(
+            Bucket=bucket_name,
+            NotificationConfiguration={
+                'LambdaFunctionConfigurations': [{
+                    'LambdaFunctionArn': function_arn,
+                    'Events': ['s3:ObjectCreated:*'],
+                    'Filter': {'Key': {'FilterRules': [
+                        {'Name': 'prefix', 'Value': os.environ.get('IMPORT_PREFIX', 'imports/')},
+                        {'Name': 'suffix', 'Value': '.csv'}
+                    ]}}
+                }]
+            }
+        )
+        print(f"Notifica S3 di {bucket_name} collegata a {function_arn}")
+    except ClientError as e:
+        print(f"Errore nella configurazione della notifica S3: {e}")
+        return False
+    return True
+
 if __name__ == "__main__":
-    create_s3_bucket_for_website()
\ No newline at end of file
+    create_s3_bucket_for_website()
+    create_export_bucket()
\ No newline at end of file
@@ -1,4 +1,4 @@
-import boto3
+import awsClients
 from botocore.exceptions import ClientError, NoCredentialsError
 
 def test_aws_connection():
@@ -7,7 +7,7 @@ def test_aws_connection():
     
     try:
         # Test connessione base
-        sts = boto3.client('sts')
+        sts = awsClients.get_client('sts')
         identity = sts.get_caller_identity()
         
         print(f"✅ Connesso come: {identity.get('Arn', 'N/A')}")
@@ -27,7 +27,7 @@ def test_aws_connection():
         print("\n🔍 Testando accesso ai servizi...")
         for service_name, display_name in services_to_test:
             try:
-                client = boto3.client(service_name, region_name='eu-west-1')
+                client = awsClients.get_client(service_name)
                 if service_name == 'codecommit':
                     client.list_repositories()
                 elif service_name == 'codepipeline':
@@ -66,7 +66,7 @@ def check_existing_resources():
     
     try:
         # Controlla repository CodeCommit
-        codecommit = boto3.client('codecommit', region_name='eu-west-1')
+        codecommit = awsClients.get_client('codecommit')
         repos = codecommit.list_repositories()
         if repos['repositories']:
             print("📦 Repository CodeCommit esistenti:")
@@ -76,7 +76,7 @@ def check_existing_resources():
             print("📦 Nessun repository CodeCommit trovato")
         
         # Controlla pipeline
-        codepipeline = boto3.client('codepipeline', region_name='eu-west-1')
+        codepipeline = awsClients.get_client('codepipeline')
         pipelines = codepipeline.list_pipelines()
         if pipelines['pipelines']:
             print("🔄 Pipeline esistenti:")
@@ -86,7 +86,7 @@ def check_existing_resources():
             print("🔄 Nessuna pipeline trovata")
             
         # Controlla progetti CodeBuild
-        codebuild = boto3.client('codebuild', region_name='eu-west-1')
+        codebuild = awsClients.get_client('codebuild')
         projects = codebuild.list_projects()
         if projects['projects']:
             print("🔨 Progetti CodeBuild esistenti:")
@@ -0,0 +1,69 @@
+"""
+Fixture comuni dei test: l'handler gira su ciascun backend di gymStorage (in memoria,
+SQLite e DynamoDB simulato con moto), con le tabelle create da testDynamoDB.
+Requisiti: pip install pytest moto boto3; esecuzione: python -m pytest -q
+"""
+
+import json
+import os
+
+# Configurazione letta all'import dei moduli: va impostata prima di importarli
+os.environ.update({
+    'METRICS_MODE': 'off',
+    'CACHE_TTL_SECONDS': '0',
+    'CURSOR_SECRET': 'test-cursor-secret',
+    'ADMIN_TOKEN': 'test-admin-token',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'AWS_DEFAULT_REGION': 'eu-west-1',
+    'DYNAMODB_REGION': 'eu-west-1'
+})
+
+import pytest
+from moto import mock_aws
+
+import gymStorage
+import gymUsersHandler
+import testDynamoDB
+
+BACKENDS = ('memory', 'sqlite', 'dynamodb')
+
+@pytest.fixture(scope='session')
+def aws():
+    with mock_aws():
+        yield
+
+# Backend di STORAGE_BACKEND per il test, con dati vuoti
+@pytest.fixture(params=BACKENDS)
+def backend(request, monkeypatch, tmp_path):
+    kind = request.param
+    monkeypatch.setenv('STORAGE_BACKEND', kind)
+    monkeypatch.setenv('SQLITE_PATH', str(tmp_path / 'gym.sqlite3'))
+    gymStorage.reset_backends()
+    tables = []
+    if kind == 'dynamodb':
+        request.getfixturevalue('aws')
+        tables = [testDynamoDB.create_dynamodb_table(), testDynamoDB.create_idempotency_table()]
+    yield kind
+    gymStorage.reset_backends()
+    for table in tables:
+        table.delete()
+
+@pytest.fixture
+def storage(backend):
+    return gymUsersHandler.get_storage()
+
+# Invoca l'handler con un evento API Gateway v1: restituisce (status, headers, corpo JSON)
+@pytest.fixture
+def api(backend):
+    def call(method, path, body=None, query=None, headers=None):
+        event = {
+            'httpMethod': method,
+            'path': path,
+            'headers': headers or {},
+            'queryStringParameters': query,
+            'body': json.dumps(body) if body is not None else None
+        }
+        response = gymUsersHandler.handler(event, None)
+        return response['statusCode'], response['headers'], json.loads(response['body']) if response['body'] else None
+    return call
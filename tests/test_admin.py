@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import gymUsersHandler
+from gymUsersHandler import is_admin_request
+
+def v1_event(claims):
+    return {'requestContext': {'authorizer': {'claims': claims}}}
+
+def v2_event(claims):
+    return {'requestContext': {'authorizer': {'jwt': {'claims': claims, 'scopes': None}}}}
+
+@pytest.mark.parametrize('event', [
+    {'headers': {'x-admin-token': 'test-admin-token'}},
+    v1_event({'cognito:groups': 'staff,admin'}),
+    v2_event({'cognito:groups': '[staff admin]'}),
+    v2_event({'cognito:groups': '[admin]'}),
+    v2_event({'cognito:groups': ['admin']})
+])
+def test_admin_requests(event):
+    assert is_admin_request(event)
+
+@pytest.mark.parametrize('event', [
+    {},
+    {'headers': None, 'requestContext': None},
+    {'requestContext': {'authorizer': None}},
+    {'requestContext': {'authorizer': {'jwt': None}}},
+    {'headers': {'X-Admin-Token': 'sbagliato'}},
+    v1_event({'cognito:groups': 'administrators'}),
+    v2_event({'cognito:groups': '[staff]'}),
+    v2_event({})
+])
+def test_non_admin_requests(event):
+    assert not is_admin_request(event)
+
+# Evento HTTP API v2 con authorizer JWT, come lo invia API Gateway
+def test_http_api_admin_route(api):
+    event = {
+        'version': '2.0',
+        'rawPath': '/stats/recompute',
+        'headers': {},
+        'requestContext': {
+            'http': {'method': 'POST', 'path': '/stats/recompute'},
+            'authorizer': {'jwt': {'claims': {'sub': 'u1', 'cognito:groups': '[admin]'}, 'scopes': None}}
+        }
+    }
+    assert gymUsersHandler.handler(event, None)['statusCode'] == 200
+    event['requestContext']['authorizer'] = None
+    assert gymUsersHandler.handler(event, None)['statusCode'] == 403
+
+@pytest.mark.parametrize('lambda_name, expected', [(None, 'NullEmitter'), ('gymUsersHandler', 'EmfEmitter')])
+def test_metrics_default_mode(lambda_name, expected):
+    env = {name: value for name, value in os.environ.items()
+           if name not in ('METRICS_MODE', 'AWS_LAMBDA_FUNCTION_NAME')}
+    if lambda_name:
+        env['AWS_LAMBDA_FUNCTION_NAME'] = lambda_name
+    script = "import json, gymMetrics; print(json.dumps(type(gymMetrics._emitter).__name__))"
+    result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True)
+    assert json.loads(result.stdout) == expected
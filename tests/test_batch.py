@@ -0,0 +1,65 @@
+import pytest
+
+import gymUsersHandler
+
+def rows(count, prefix='membro'):
+    return [{'name': f'Membro {index}', 'email': f'{prefix}{index}@example.com', 'subscriptionType': 'basic'}
+            for index in range(count)]
+
+def test_batch_import_spans_write_chunks(api, storage):
+    status, _, body = api('POST', '/users/batch', rows(30))
+    assert status == 201
+    assert body['created'] == 30 and body['failed'] == 0
+    assert [result['row'] for result in body['results']] == list(range(30))
+
+    for result in body['results']:
+        assert storage.get({'userId': result['id']})['email'].startswith('membro')
+    assert storage.get(gymUsersHandler.email_key('membro29@example.com'))['ownerId'] == body['results'][29]['id']
+    assert api('GET', '/stats')[2]['stats']['totalMembers'] == 30
+
+def test_batch_import_reports_each_row(api):
+    assert api('POST', '/users', rows(1, 'esistente')[0])[0] == 201
+    payload = rows(3) + [
+        {'name': 'Doppio', 'email': 'MEMBRO1@example.com'},
+        {'name': 'Già iscritto', 'email': 'esistente0@example.com'},
+        {'name': 'Senza email'}
+    ]
+    status, _, body = api('POST', '/users/batch', payload)
+    assert status == 207
+    assert body['created'] == 3 and body['failed'] == 3
+    errors = {result['row']: result.get('error') for result in body['results'] if not result['success']}
+    assert errors[3] == "Email duplicata nella richiesta"
+    assert errors[4] == "Un utente con questa email esiste già"
+    assert set(errors) == {3, 4, 5}
+    assert api('GET', '/users')[2]['count'] == 4
+
+@pytest.mark.parametrize('payload', [[], {'name': 'Anna'}, None])
+def test_batch_import_rejects_invalid_body(api, payload):
+    assert api('POST', '/users/batch', payload)[0] == 400
+
+def test_batch_import_limit(api, monkeypatch):
+    monkeypatch.setattr(gymUsersHandler, 'MAX_BATCH_IMPORT', 5)
+    status, _, body = api('POST', '/users/batch', rows(6))
+    assert status == 400
+    assert api('GET', '/users')[2]['count'] == 0
+
+# Il primo tentativo di ogni blocco lascia indietro l'ultimo elemento, come un
+# UnprocessedItems di DynamoDB: il retry deve completare la scrittura
+def test_batch_import_retries_unprocessed(api, storage, monkeypatch):
+    monkeypatch.setattr(gymUsersHandler, 'batch_backoff', lambda attempt: None)
+    original = type(storage).batch_write
+    attempts = []
+
+    def flaky_batch_write(self, puts=(), deletes=()):
+        puts = list(puts)
+        attempts.append(len(puts))
+        if len(attempts) % 2 and len(puts) > 1:
+            unprocessed, _ = original(self, puts[:-1], deletes)
+            return unprocessed + puts[-1:], []
+        return original(self, puts, deletes)
+
+    monkeypatch.setattr(type(storage), 'batch_write', flaky_batch_write)
+    status, _, body = api('POST', '/users/batch', rows(10))
+    assert status == 201 and body['created'] == 10
+    assert len(attempts) == 4
+    assert api('GET', '/users')[2]['count'] == 10
@@ -0,0 +1,73 @@
+import pytest
+
+import gymUsersHandler
+
+ADMIN_HEADERS = {'X-Admin-Token': gymUsersHandler.ADMIN_TOKEN}
+
+# La cache è del modulo: ogni test parte vuoto e con un TTL attivo
+@pytest.fixture
+def cache(api, monkeypatch):
+    monkeypatch.setattr(gymUsersHandler, 'CACHE_TTL_SECONDS', 60)
+    gymUsersHandler.invalidate_cache()
+    yield
+    gymUsersHandler.invalidate_cache()
+
+def create_member(api, index):
+    status, _, body = api('POST', '/users', {'name': f'Membro {index}', 'email': f'm{index}@example.com'})
+    assert status == 201
+    return body['id']
+
+def test_repeated_reads_hit_cache(api, cache):
+    create_member(api, 0)
+    status, headers, first = api('GET', '/users')
+    assert status == 200 and headers['X-Cache'] == 'MISS'
+    status, headers, second = api('GET', '/users')
+    assert headers['X-Cache'] == 'HIT'
+    assert second == first
+
+    assert api('GET', '/users', query={'limit': '1'})[1]['X-Cache'] == 'MISS'
+    assert api('GET', '/stats')[1]['X-Cache'] == 'MISS'
+    assert api('GET', '/stats')[1]['X-Cache'] == 'HIT'
+
+def test_writes_invalidate_cache(api, cache):
+    member_id = create_member(api, 0)
+    api('GET', '/users')
+    api('GET', '/stats')
+
+    create_member(api, 1)
+    status, headers, body = api('GET', '/users')
+    assert headers['X-Cache'] == 'MISS' and body['count'] == 2
+    _, headers, body = api('GET', '/stats')
+    assert headers['X-Cache'] == 'MISS' and body['stats']['totalMembers'] == 2
+
+    assert api('DELETE', f'/users/{member_id}')[0] == 200
+    _, headers, body = api('GET', '/users')
+    assert headers['X-Cache'] == 'MISS' and body['count'] == 1
+
+def test_errors_are_not_cached(api, cache):
+    assert api('GET', '/users/inesistente')[0] == 404
+    _, headers, _ = api('GET', '/users/inesistente')
+    assert 'X-Cache' not in headers
+
+def test_cache_disabled_without_ttl(api, monkeypatch):
+    monkeypatch.setattr(gymUsersHandler, 'CACHE_TTL_SECONDS', 0)
+    api('GET', '/users')
+    assert 'X-Cache' not in api('GET', '/users')[1]
+
+def test_lru_eviction(api, cache, monkeypatch):
+    monkeypatch.setattr(gymUsersHandler, 'CACHE_MAX_ENTRIES', 2)
+    for limit in ('1', '2', '3'):
+        api('GET', '/users', query={'limit': limit})
+    assert api('GET', '/users', query={'limit': '3'})[1]['X-Cache'] == 'HIT'
+    assert api('GET', '/users', query={'limit': '1'})[1]['X-Cache'] == 'MISS'
+
+def test_cache_stats_requires_admin(api, cache):
+    assert api('GET', '/cache/stats')[0] == 403
+    assert api('GET', '/cache/stats', headers={'X-Admin-Token': 'sbagliato'})[0] == 403
+
+    api('GET', '/users')
+    api('GET', '/users')
+    status, _, body = api('GET', '/cache/stats', headers=ADMIN_HEADERS)
+    assert status == 200
+    assert body['cache']['entries'] == 1
+    assert body['cache']['ttlSeconds'] == 60
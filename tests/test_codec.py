@@ -0,0 +1,48 @@
+import pytest
+
+import gymCodec
+import gymUsersHandler
+
+def new_member(**user_data):
+    return gymUsersHandler.build_user_item({'name': 'Mario Rossi', 'email': 'mario@example.com', **user_data})
+
+MEMBERS = [
+    new_member(),
+    new_member(name='Cher', subscriptionType='yearly'),
+    new_member(name='  Anna Maria  De Luca ', phone='333 123 4567', goal='Dimagrire',
+               address={'street': 'Via Roma 1', 'city': 'Milano', 'zipCode': ''},
+               emergencyContact={'name': 'Luca', 'phone': '3331112222', 'relationship': 'fratello'},
+               medicalInfo={'allergies': 'polline', 'conditions': 'Nessuna'})
+]
+
+@pytest.mark.parametrize('short_names', [False, True])
+@pytest.mark.parametrize('user', MEMBERS)
+def test_decode_encode_round_trip(user, short_names):
+    assert gymCodec.decode(gymCodec.encode(user, short_names)) == user
+
+@pytest.mark.parametrize('short_names', [False, True])
+@pytest.mark.parametrize('user', MEMBERS)
+def test_decode_encode_member_round_trip(user, short_names):
+    item, details = gymCodec.encode_member(user, short_names)
+    assert not any(gymCodec.stored_name(name, short_names) in item for name in gymCodec.DETAIL_FIELDS)
+    assert gymCodec.decode(item, details=details) == user
+    hot_fields = gymUsersHandler.HOT_MEMBER_FIELDS
+    assert gymCodec.decode(item, hot_fields) == {field: user[field] for field in hot_fields}
+
+def test_defaults_are_not_stored():
+    item, details = gymCodec.encode_member(new_member())
+    assert details is None
+    assert not set(item) & set(gymCodec.DEFAULTS)
+    assert not set(item) & {'firstName', 'lastName', 'updatedAt'}
+
+def test_details_item_is_outside_indexes():
+    _, details = gymCodec.encode_member(MEMBERS[2])
+    assert details['recordType'] == 'DETAILS'
+    assert not set(details) & (gymCodec.KEY_ATTRIBUTES - {'userId', 'recordType'})
+
+@pytest.mark.parametrize('user', MEMBERS)
+def test_storage_fields_projection(user):
+    fields = ['firstName', 'updatedAt', 'email']
+    item = gymCodec.encode(user, True)
+    stored = {name: value for name, value in item.items() if name in gymCodec.storage_fields(fields)}
+    assert gymCodec.decode(stored, fields) == {field: user[field] for field in fields}
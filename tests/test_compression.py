@@ -0,0 +1,69 @@
+import base64
+import gzip
+import json
+
+import pytest
+
+import gymUsersHandler
+
+# Risposta grezza dell'handler: il corpo compresso è in base64 e non passa da json.loads
+def get(path, accept_encoding=None, query=None):
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    return gymUsersHandler.handler({'httpMethod': 'GET', 'path': path, 'headers': headers,
+                                    'queryStringParameters': query, 'body': None}, None)
+
+def decoded_body(response):
+    assert response['isBase64Encoded']
+    return json.loads(gzip.decompress(base64.b64decode(response['body'])))
+
+@pytest.fixture
+def members(api, monkeypatch):
+    monkeypatch.setattr(gymUsersHandler, '_brotli', False)
+    for index in range(20):
+        assert api('POST', '/users', {'name': f'Membro {index}', 'email': f'm{index}@example.com'})[0] == 201
+
+def test_large_response_is_gzipped(api, members):
+    plain = get('/users')
+    assert len(plain['body']) >= gymUsersHandler.COMPRESSION_MIN_BYTES
+    assert 'Content-Encoding' not in plain['headers']
+
+    response = get('/users', 'gzip, deflate')
+    assert response['headers']['Content-Encoding'] == 'gzip'
+    assert response['headers']['Vary'] == 'Accept-Encoding'
+    assert response['headers']['ETag'] == plain['headers']['ETag'][:-1] + '-gzip"'
+    assert decoded_body(response) == json.loads(plain['body'])
+    assert len(response['body']) < len(plain['body'])
+
+def test_small_response_is_not_compressed(api, members):
+    response = get('/users', 'gzip', query={'limit': '1', 'fields': 'fullName'})
+    assert len(response['body']) < gymUsersHandler.COMPRESSION_MIN_BYTES
+    assert 'Content-Encoding' not in response['headers'] and not response.get('isBase64Encoded')
+    assert response['headers']['Vary'] == 'Accept-Encoding'
+
+@pytest.mark.parametrize('accept_encoding', ['identity', 'gzip;q=0', '*;q=0', 'deflate'])
+def test_refused_encodings(api, members, accept_encoding):
+    response = get('/users', accept_encoding)
+    assert 'Content-Encoding' not in response['headers']
+    assert json.loads(response['body'])['count'] == 20
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip', 'gzip'),
+    ('*', 'gzip'),
+    ('br;q=1, gzip;q=0.5', 'gzip'),
+    ('gzip;q=0', None),
+    ('gzip;q=abc', None),
+    ('', None),
+    (None, None)
+])
+def test_choose_encoding_without_brotli(monkeypatch, accept_encoding, expected):
+    monkeypatch.setattr(gymUsersHandler, '_brotli', False)
+    assert gymUsersHandler.choose_encoding(accept_encoding) == expected
+
+def test_prefers_brotli_when_available(monkeypatch):
+    monkeypatch.setattr(gymUsersHandler, '_brotli', object())
+    assert gymUsersHandler.choose_encoding('gzip, br') == 'br'
+    assert gymUsersHandler.choose_encoding('br;q=0.1, gzip') == 'gzip'
+
+def test_compression_disabled(api, members, monkeypatch):
+    monkeypatch.setattr(gymUsersHandler, 'COMPRESSION_ENABLED', False)
+    assert 'Content-Encoding' not in get('/users', 'gzip')['headers']
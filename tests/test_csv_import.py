@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+
+import pytest
+
+import awsClients
+import gymCsvImport
+import gymUsersHandler
+
+BUCKET = 'gymcloud-imports'
+KEY = gymCsvImport.IMPORT_PREFIX + 'soci.csv'
+
+# Intestazioni in italiano, separatore ";", una cella su due righe e tre righe da scartare
+CSV_ROWS = [
+    'Nome;Cognome;E-mail;Telefono;Abbonamento;Data iscrizione',
+    'Anna;Bianchi;anna@example.com;333 123.4567;mensile;05/03/2024',
+    'Bruno;Verdi;bruno@example.com;;annuale;2024-03-06',
+    '"Carla\nMaria";Neri;carla@example.com;;base;',
+    'Dario;Galli;non-valida;;base;',
+    'Elena;Riva;elena@example.com;;settimanale;',
+    'Franco;Neri;ANNA@example.com;;base;',
+    'Giulia;Conti;giulia@example.com;;premium;',
+    ';;;;;'
+]
+
+class LambdaContext:
+    function_name = 'gymCsvImport'
+
+    def __init__(self, remaining_ms):
+        self.remaining_ms = list(remaining_ms)
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms.pop(0) if len(self.remaining_ms) > 1 else self.remaining_ms[0]
+
+# moto non serializza gli UpdateItem concorrenti sullo stesso elemento (su DynamoDB ADD è
+# atomico): con più thread i contatori di STATS#GLOBAL perderebbero incrementi
+@pytest.fixture(autouse=True)
+def single_worker(monkeypatch):
+    monkeypatch.setattr(gymCsvImport, 'IMPORT_WORKERS', 1)
+
+@pytest.fixture
+def s3(aws, api):
+    client = gymCsvImport.get_s3()
+    client.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={'LocationConstraint': awsClients.DEFAULT_REGION})
+    yield client
+    for item in client.list_objects_v2(Bucket=BUCKET).get('Contents', []):
+        client.delete_object(Bucket=BUCKET, Key=item['Key'])
+    client.delete_bucket(Bucket=BUCKET)
+
+@pytest.fixture
+def upload(s3):
+    etag = s3.put_object(Bucket=BUCKET, Key=KEY, Body='\n'.join(CSV_ROWS).encode('utf-8'))['ETag']
+    return etag.strip('"')
+
+def s3_event(etag):
+    return {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': KEY, 'eTag': etag}}}]}
+
+def members(api):
+    return {member['email']: member for member in api('GET', '/users', query={'fields': 'fullName,email,createdAt'})[2]['members']}
+
+def rejected_rows(s3, etag):
+    prefix = f"{gymCsvImport.IMPORT_REPORT_PREFIX}{KEY}/{etag}/rejected-"
+    rows = []
+    for item in s3.list_objects_v2(Bucket=BUCKET, Prefix=prefix).get('Contents', []):
+        body = s3.get_object(Bucket=BUCKET, Key=item['Key'])['Body'].read().decode('utf-8')
+        rows.extend(list(csv.reader(io.StringIO(body)))[1:])
+    return {int(row[0]): row[1] for row in rows}
+
+def test_import_from_s3_notification(api, s3, upload):
+    result = gymCsvImport.handler(s3_event(upload), None)
+    assert result == {'imports': [{'objectKey': KEY, 'status': 'completed', 'imported': 4, 'rejected': 3}]}
+
+    imported = members(api)
+    assert sorted(imported) == ['anna@example.com', 'bruno@example.com', 'carla@example.com', 'giulia@example.com']
+    assert imported['carla@example.com']['fullName'] == 'Carla Maria Neri'
+    assert imported['anna@example.com']['createdAt'] == '2024-03-05T00:00:00'
+
+    rejects = rejected_rows(s3, upload)
+    assert rejects[4] == "Formato email non valido"
+    assert rejects[5].startswith("Tipo di abbonamento non valido")
+    assert rejects[6] == "Email duplicata nel file"
+    assert api('GET', '/stats')[2]['stats']['totalMembers'] == 4
+
+    summary = s3.get_object(Bucket=BUCKET, Key=f"{gymCsvImport.IMPORT_REPORT_PREFIX}{KEY}/{upload}/summary.json")
+    assert json.loads(summary['Body'].read())['rowsRead'] == len(CSV_ROWS) - 1
+
+def test_pause_and_resume_from_checkpoint(api, s3, upload, monkeypatch):
+    monkeypatch.setattr(gymCsvImport, 'IMPORT_SEGMENT_ROWS', 2)
+    reinvocations = []
+    monkeypatch.setattr(gymCsvImport, 'reinvoke', lambda context, job: reinvocations.append(dict(job)))
+
+    # Tempo sufficiente per due segmenti, poi la funzione si ferma e si reinvoca
+    context = LambdaContext([600000, 600000, 1000])
+    result = gymCsvImport.handler(s3_event(upload), context)
+    assert result['imports'][0]['status'] == 'running'
+    assert len(reinvocations) == 1
+    paused = reinvocations[0]
+    assert paused['rowsRead'] == 4 and paused['segments'] == 2 and paused['imported'] == 3
+    assert len(members(api)) == 3
+
+    resume_event = {'importJob': {'bucket': BUCKET, 'key': KEY, 'etag': upload}}
+    result = gymCsvImport.handler(resume_event, LambdaContext([600000]))
+    assert result['imports'][0] == {'objectKey': KEY, 'status': 'completed', 'imported': 4, 'rejected': 3}
+    job = gymUsersHandler.get_storage().get(gymCsvImport.job_key(BUCKET, KEY, upload))
+    assert job['invocations'] == 2 and job['rowsRead'] == len(CSV_ROWS) - 1
+    assert len(members(api)) == 4
+    assert api('GET', '/stats')[2]['stats']['totalMembers'] == 4
+
+    # Notifica consegnata di nuovo dopo il completamento: nessun effetto
+    assert gymCsvImport.handler(resume_event, None)['imports'][0]['status'] == 'completed'
+    assert len(members(api)) == 4
+
+# Invocazione interrotta dopo le scritture ma prima del checkpoint: rieseguire i segmenti
+# ritrova le sentinelle delle stesse righe e non crea duplicati né scarti
+def test_replayed_segments_are_skipped(api, s3, upload):
+    gymCsvImport.handler(s3_event(upload), None)
+    gymUsersHandler.get_storage().delete(gymCsvImport.job_key(BUCKET, KEY, upload))
+
+    gymCsvImport.handler(s3_event(upload), None)
+    job = gymUsersHandler.get_storage().get(gymCsvImport.job_key(BUCKET, KEY, upload))
+    assert job['imported'] == 0 and job['skipped'] == 4 and job['rejected'] == 3
+    assert len(members(api)) == 4
+
+def test_ignores_other_objects(api, s3):
+    event = {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': 'altro/soci.csv', 'eTag': 'x'}}}]}
+    assert gymCsvImport.handler(event, None) == {'imports': []}
+
+def test_header_without_email_fails(api, s3):
+    etag = s3.put_object(Bucket=BUCKET, Key=KEY, Body=b'Nome;Telefono\nAnna;3331234567\n')['ETag'].strip('"')
+    result = gymCsvImport.handler(s3_event(etag), None)
+    assert result['imports'][0]['status'] == 'failed'
+    assert members(api) == {}
@@ -0,0 +1,57 @@
+import base64
+import json
+
+import pytest
+
+import gymUsersHandler
+from gymUsersHandler import decode_cursor, encode_cursor
+
+LAST_KEY = {'userId': 'u1', 'listPartition': 'MEMBERS', 'createdAt': '2024-01-01T10:00:00'}
+SCOPE = gymUsersHandler.CREATED_AT_INDEX
+
+def forged_payload(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+
+def test_round_trip():
+    assert decode_cursor(encode_cursor(LAST_KEY, SCOPE), SCOPE) == LAST_KEY
+
+def test_rejects_modified_payload():
+    cursor = encode_cursor(LAST_KEY, SCOPE)
+    signature = cursor.split('.', 1)[1]
+    forged = forged_payload({'k': {**LAST_KEY, 'userId': 'u2'}, 's': SCOPE})
+    with pytest.raises(ValueError):
+        decode_cursor(f"{forged}.{signature}", SCOPE)
+
+def test_rejects_modified_signature():
+    payload, signature = encode_cursor(LAST_KEY, SCOPE).split('.', 1)
+    tampered = ('0' if signature[0] != '0' else '1') + signature[1:]
+    with pytest.raises(ValueError):
+        decode_cursor(f"{payload}.{tampered}", SCOPE)
+
+def test_rejects_other_scope():
+    cursor = encode_cursor(LAST_KEY, SCOPE)
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, gymUsersHandler.STATUS_INDEX)
+
+@pytest.mark.parametrize('cursor', ['', 'abc', 'abc.def', '.', forged_payload({'k': LAST_KEY, 's': SCOPE})])
+def test_rejects_malformed(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, SCOPE)
+
+def test_rejects_key_signed_with_other_secret(monkeypatch):
+    monkeypatch.setattr(gymUsersHandler, 'CURSOR_SECRET', b'other-secret')
+    cursor = encode_cursor(LAST_KEY, SCOPE)
+    monkeypatch.undo()
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, SCOPE)
+
+def test_api_rejects_tampered_cursor(api):
+    for index in range(3):
+        api('POST', '/users', {'name': f'Membro {index}', 'email': f'm{index}@example.com'})
+    status, _, body = api('GET', '/users', query={'limit': '1'})
+    assert status == 200 and body['hasMore']
+    payload, signature = body['nextCursor'].split('.', 1)
+
+    status, _, body = api('GET', '/users', query={'limit': '1', 'cursor': f"{payload}x.{signature}"})
+    assert status == 400
+    assert body['error'] == "Cursore non valido"
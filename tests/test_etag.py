@@ -0,0 +1,62 @@
+import pytest
+
+import gymUsersHandler
+
+def create_member(api, index):
+    status, _, body = api('POST', '/users', {'name': f'Membro {index}', 'email': f'm{index}@example.com'})
+    assert status == 201
+    return body['id']
+
+@pytest.mark.parametrize('path', ['/users', '/stats', '/dashboard'])
+def test_not_modified(api, path):
+    create_member(api, 0)
+    status, headers, _ = api('GET', path)
+    assert status == 200
+    etag = headers['ETag']
+    assert headers['Cache-Control'] == 'no-cache'
+
+    status, headers, body = api('GET', path, headers={'If-None-Match': etag})
+    assert status == 304 and body is None
+    assert headers['ETag'] == etag
+
+@pytest.mark.parametrize('if_none_match', ['W/{etag}', '"other", {etag}', '*', '{gzip}', 'W/{gzip}'])
+def test_weak_and_list_matches(api, if_none_match):
+    etag = api('GET', '/users')[1]['ETag']
+    header = if_none_match.format(etag=etag, gzip=etag[:-1] + '-gzip"')
+    assert api('GET', '/users', headers={'If-None-Match': header})[0] == 304
+
+@pytest.mark.parametrize('path', ['/users', '/stats'])
+def test_write_changes_etag(api, path):
+    member_id = create_member(api, 0)
+    etag = api('GET', path)[1]['ETag']
+
+    create_member(api, 1)
+    status, headers, _ = api('GET', path, headers={'If-None-Match': etag})
+    assert status == 200 and headers['ETag'] != etag
+
+    etag = headers['ETag']
+    assert api('DELETE', f'/users/{member_id}')[0] == 200
+    assert api('GET', path, headers={'If-None-Match': etag})[0] == 200
+
+def test_etag_depends_on_query(api):
+    create_member(api, 0)
+    first = api('GET', '/users', query={'limit': '1'})[1]['ETag']
+    assert api('GET', '/users', query={'limit': '2'})[1]['ETag'] != first
+    assert api('GET', '/users', query={'limit': '2'}, headers={'If-None-Match': first})[0] == 200
+
+def test_member_etag(api):
+    member_id = create_member(api, 0)
+    status, headers, _ = api('GET', f'/users/{member_id}')
+    assert status == 200
+    assert api('GET', f'/users/{member_id}', headers={'If-None-Match': headers['ETag']})[0] == 304
+    assert api('GET', f'/users/{member_id}', query={'include': 'details'},
+               headers={'If-None-Match': headers['ETag']})[0] == 200
+
+def test_missing_member_has_no_etag(api):
+    status, headers, _ = api('GET', '/users/inesistente')
+    assert status == 404 and 'ETag' not in headers
+
+def test_stats_etag_changes_at_midnight(api, monkeypatch):
+    etag = api('GET', '/stats')[1]['ETag']
+    monkeypatch.setattr(gymUsersHandler, 'utc_today', lambda: '2099-01-01')
+    assert api('GET', '/stats', headers={'If-None-Match': etag})[0] == 200
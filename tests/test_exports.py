@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+
+import pytest
+
+import awsClients
+import gymExports
+import gymUsersHandler
+
+ADMIN_HEADERS = {'X-Admin-Token': gymUsersHandler.ADMIN_TOKEN}
+MEMBERS = [
+    {'name': 'Anna Bianchi', 'email': 'anna@example.com', 'phone': '+39 333 1234567'},
+    {'name': '=HYPERLINK("http://example.com","premi") Rossi', 'email': 'formula@example.com',
+     'goal': 'Correre\nla maratona', 'medicalInfo': {'allergies': 'polline', 'conditions': 'Nessuna'}},
+    {'name': '@SUM(A1:A2)', 'email': 'somma@example.com', 'goal': '-1+1'}
+]
+
+@pytest.fixture
+def export_bucket(aws, api):
+    s3 = gymExports.get_s3()
+    s3.create_bucket(Bucket=gymExports.EXPORT_BUCKET,
+                     CreateBucketConfiguration={'LocationConstraint': awsClients.DEFAULT_REGION})
+    yield s3
+    for item in s3.list_objects_v2(Bucket=gymExports.EXPORT_BUCKET).get('Contents', []):
+        s3.delete_object(Bucket=gymExports.EXPORT_BUCKET, Key=item['Key'])
+    s3.delete_bucket(Bucket=gymExports.EXPORT_BUCKET)
+
+@pytest.fixture
+def members(api):
+    for member in MEMBERS:
+        assert api('POST', '/users', member)[0] == 201
+
+def export_body(s3, export):
+    job = gymExports.get_job(export['exportId'])
+    return s3.get_object(Bucket=gymExports.EXPORT_BUCKET, Key=job['s3Key'])['Body'].read().decode('utf-8')
+
+@pytest.mark.parametrize('value, expected', [
+    ('=1+1', "'=1+1"),
+    ('+39 333', "'+39 333"),
+    ('-2', "'-2"),
+    ('@SUM(A1)', "'@SUM(A1)"),
+    ('\t=1', "'\t=1"),
+    ('\r=1', "' =1"),
+    ('Riga uno\r\nriga due', 'Riga uno riga due'),
+    ('Mario Rossi', 'Mario Rossi'),
+    ('', ''),
+    (None, ''),
+    (True, True)
+])
+def test_csv_value_neutralizes_formulas_and_line_breaks(value, expected):
+    assert gymExports.csv_value(value) == expected
+
+def test_export_requires_admin(api):
+    assert api('POST', '/exports', {'format': 'csv'})[0] == 403
+
+def test_csv_export(api, export_bucket, members):
+    status, _, body = api('POST', '/exports', {'format': 'csv', 'fields': ['fullName', 'email', 'phone', 'goal']},
+                          headers=ADMIN_HEADERS)
+    assert status == 201
+    assert body['export']['status'] == 'completed' and body['export']['rows'] == len(MEMBERS)
+
+    text = export_body(export_bucket, body['export'])
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0] == ['userId', 'fullName', 'email', 'phone', 'goal']
+    assert len(text.splitlines()) == len(MEMBERS) + 1
+    by_email = {row[2]: dict(zip(rows[0], row)) for row in rows[1:]}
+    assert by_email['formula@example.com']['fullName'].startswith("'=HYPERLINK")
+    assert by_email['formula@example.com']['goal'] == 'Correre la maratona'
+    assert by_email['somma@example.com']['fullName'] == "'@SUM(A1:A2)"
+    assert by_email['somma@example.com']['goal'] == "'-1+1"
+    assert by_email['anna@example.com']['phone'] == "'+393331234567"
+
+def test_ndjson_export_and_status(api, export_bucket, members):
+    status, _, body = api('POST', '/exports', {'format': 'ndjson', 'fields': 'userId,fullName,medicalInfo'},
+                          headers=ADMIN_HEADERS)
+    assert status == 201
+    records = [json.loads(line) for line in export_body(export_bucket, body['export']).splitlines()]
+    assert sorted(record['fullName'] for record in records) == sorted(member['name'] for member in MEMBERS)
+    assert all(not record['userId'].startswith(('EMAIL#', 'STATS#', 'EXPORT#')) for record in records)
+    allergies = {record['fullName']: record['medicalInfo']['allergies'] for record in records}
+    assert allergies[MEMBERS[1]['name']] == 'polline'
+
+    status, _, body = api('GET', f"/exports/{body['export']['exportId']}", headers=ADMIN_HEADERS)
+    assert status == 200
+    assert body['export']['status'] == 'completed'
+    assert body['export']['downloadUrl'].startswith('https://')
+
+def test_export_unknown_format(api):
+    assert api('POST', '/exports', {'format': 'xlsx'}, headers=ADMIN_HEADERS)[0] == 400
+
+def test_csv_import_flattens_line_breaks():
+    import gymCsvImport
+    user_data, error = gymCsvImport.normalize_row(['Anna\r\n Bianchi', 'anna@example.com'], ['name', 'email'])
+    assert error is None
+    assert user_data['name'] == 'Anna Bianchi'
@@ -0,0 +1,147 @@
+import pytest
+
+import gymIdempotency
+
+MEMBERS = [
+    {'name': 'Anna Bianchi', 'email': 'anna@example.com', 'subscriptionType': 'basic'},
+    {'name': 'Bruno Verdi', 'email': 'bruno@example.com', 'subscriptionType': 'premium', 'status': 'inactive'},
+    {'name': 'Carla Neri', 'email': 'carla@example.com', 'subscriptionType': 'basic',
+     'medicalInfo': {'allergies': 'polline', 'conditions': 'Nessuna'}},
+    {'name': 'Dario Galli', 'email': 'dario@example.com', 'subscriptionType': 'yearly'}
+]
+
+# Elementi di servizio con gli attributi degli indici di status e membershipType, come
+# quelli scritti dalle versioni precedenti di esportazioni e importazioni
+LEGACY_SERVICE_ITEMS = [
+    {'userId': 'EXPORT#legacy', 'recordType': 'EXPORT', 'status': 'active', 'membershipType': 'basic',
+     'createdAt': '2000-01-01T00:00:00'},
+    {'userId': 'IMPORT#legacy', 'recordType': 'IMPORT', 'status': 'active', 'createdAt': '2099-01-01T00:00:00'}
+]
+
+LIST_QUERIES = [
+    {},
+    {'sort': '-createdAt'},
+    {'status': 'active'},
+    {'membershipType': 'basic'},
+    {'status': 'active', 'membershipType': 'basic'}
+]
+
+@pytest.fixture
+def member_ids(api, storage):
+    ids = set()
+    for member in MEMBERS:
+        status, _, body = api('POST', '/users', member)
+        assert status == 201
+        ids.add(body['id'])
+    for item in LEGACY_SERVICE_ITEMS:
+        storage.put(item)
+    return ids
+
+def list_all(api, path, query, limit):
+    members, cursor = [], None
+    while True:
+        params = {**query, 'limit': str(limit)}
+        if cursor:
+            params['cursor'] = cursor
+        status, _, body = api('GET', path, query=params)
+        assert status == 200
+        members.extend(body['members'])
+        cursor = body['nextCursor']
+        if not cursor:
+            return members
+
+def test_idempotent_replay(api):
+    headers = {'Idempotency-Key': 'key-1'}
+    status, first_headers, first = api('POST', '/users', MEMBERS[0], headers=headers)
+    assert status == 201
+    assert gymIdempotency.REPLAY_HEADER not in first_headers
+
+    status, replay_headers, replayed = api('POST', '/users', MEMBERS[0], headers=headers)
+    assert status == 201
+    assert replay_headers[gymIdempotency.REPLAY_HEADER] == 'true'
+    assert replayed == first
+
+    status, _, body = api('GET', '/users')
+    assert [member['userId'] for member in body['members']] == [first['id']]
+
+def test_idempotency_key_reused_with_other_body(api):
+    headers = {'Idempotency-Key': 'key-2'}
+    assert api('POST', '/users', MEMBERS[0], headers=headers)[0] == 201
+    status, _, _ = api('POST', '/users', MEMBERS[1], headers=headers)
+    assert status == 422
+    assert api('GET', '/users')[2]['count'] == 1
+
+def test_client_error_is_replayed(api):
+    headers = {'Idempotency-Key': 'key-3'}
+    invalid = {**MEMBERS[0], 'email': 'non-valida'}
+    assert api('POST', '/users', invalid, headers=headers)[0] == 400
+    status, replay_headers, _ = api('POST', '/users', invalid, headers=headers)
+    assert status == 400
+    assert replay_headers[gymIdempotency.REPLAY_HEADER] == 'true'
+
+@pytest.mark.parametrize('query', LIST_QUERIES)
+@pytest.mark.parametrize('limit', [1, 3, 100])
+def test_service_items_never_listed(api, member_ids, query, limit):
+    members = list_all(api, '/users', query, limit)
+    assert members
+    assert {member['userId'] for member in members} <= member_ids
+    assert all('recordType' not in member for member in members)
+
+@pytest.mark.parametrize('limit', [1, 3])
+def test_unfiltered_pages_are_full(api, member_ids, limit):
+    status, _, body = api('GET', '/users', query={'limit': str(limit)})
+    assert status == 200
+    assert body['count'] == limit and body['hasMore']
+    members = list_all(api, '/users', {}, limit)
+    assert sorted(member['userId'] for member in members) == sorted(member_ids)
+
+def test_dashboard_lists_only_members(api, member_ids):
+    status, _, body = api('GET', '/dashboard', query={'limit': '2'})
+    assert status == 200
+    assert body['count'] == 2
+    assert {member['userId'] for member in body['members']} <= member_ids
+    assert body['stats']['totalMembers'] == len(member_ids)
+
+@pytest.mark.parametrize('status', [None, 3, '', '   ', ['active'], 'x' * 65])
+def test_invalid_status_is_rejected(api, status):
+    code, _, body = api('POST', '/users', {**MEMBERS[0], 'status': status})
+    assert code == 400
+    assert body['error'].startswith("Stato non valido")
+    assert api('GET', '/users')[2]['count'] == 0
+
+def test_valid_status_is_indexed(api):
+    assert api('POST', '/users', {**MEMBERS[0], 'status': ' suspended '})[0] == 201
+    members = api('GET', '/users', query={'status': 'suspended'})[2]['members']
+    assert [member['status'] for member in members] == ['suspended']
+
+def test_csv_import_validates_status():
+    import gymCsvImport
+    user_data, error = gymCsvImport.normalize_row(['Anna Bianchi', 'anna@example.com', 'x' * 65],
+                                                  ['name', 'email', 'status'])
+    assert user_data is None and error.startswith("Stato non valido")
+
+# Membri salvati prima del controllo transazionale dell'email: la sentinella è di uno solo
+@pytest.fixture
+def legacy_duplicates(storage):
+    import gymCodec
+    import gymUsersHandler
+    users = [gymUsersHandler.build_user_item({'name': name, 'email': 'shared@example.com'})
+             for name in ('Primo Socio', 'Secondo Socio')]
+    for user in users:
+        storage.put(gymCodec.encode_member(user)[0])
+    storage.put(gymUsersHandler.email_sentinel('shared@example.com', users[0]['userId']))
+    return [user['userId'] for user in users]
+
+def test_delete_member_sharing_legacy_email(api, storage, legacy_duplicates):
+    import gymUsersHandler
+    owner_id, other_id = legacy_duplicates
+    sentinel_key = gymUsersHandler.email_key('shared@example.com')
+
+    status, _, body = api('DELETE', f'/users/{other_id}')
+    assert status == 200 and body['deletedUserId'] == other_id
+    assert storage.get({'userId': other_id}) is None
+    assert storage.get(sentinel_key)['ownerId'] == owner_id
+
+    assert api('DELETE', f'/users/{owner_id}')[0] == 200
+    assert storage.get(sentinel_key) is None
+    assert api('GET', '/users')[2]['count'] == 0
@@ -0,0 +1,34 @@
+import gymCodec
+import gymUsersHandler
+
+def legacy_member(storage, name, email):
+    user = gymUsersHandler.build_user_item({'name': name, 'email': email})
+    del user['listPartition']
+    storage.put(gymCodec.encode_member(user)[0])
+    return user['userId']
+
+def test_backfill_list_partition(api, storage):
+    assert api('POST', '/users', {'name': 'Nuovo Socio', 'email': 'nuovo@example.com'})[0] == 201
+    legacy_ids = {legacy_member(storage, f'Socio {index}', f's{index}@example.com') for index in range(3)}
+    status, headers, body = api('GET', '/users')
+    assert body['count'] == 1
+    etag = headers['ETag']
+
+    assert gymUsersHandler.backfill_list_partition() == 3
+    assert gymUsersHandler.backfill_list_partition() == 0
+
+    status, headers, body = api('GET', '/users', headers={'If-None-Match': etag})
+    assert status == 200
+    assert legacy_ids <= {member['userId'] for member in body['members']}
+    assert body['count'] == 4
+
+def test_backfill_email_sentinels(api, storage):
+    owners = {legacy_member(storage, 'Primo Socio', 'shared@example.com'),
+              legacy_member(storage, 'Secondo Socio', 'shared@example.com')}
+    version = gymUsersHandler.get_data_version()
+
+    assert gymUsersHandler.backfill_email_sentinels() == ['shared@example.com']
+    assert gymUsersHandler.get_data_version() == version + 1
+    assert storage.get(gymUsersHandler.email_key('shared@example.com'))['ownerId'] in owners
+    status, _, _ = api('POST', '/users', {'name': 'Terzo Socio', 'email': 'shared@example.com'})
+    assert status == 409
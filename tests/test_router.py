@@ -0,0 +1,80 @@
+import pytest
+
+from gymUsersHandler import MethodNotAllowed, RouteNotFound, Router
+
+def view(name):
+    return lambda request: name
+
+@pytest.fixture
+def router():
+    router = Router()
+    router.add('GET', '/users', view('list'))
+    router.add('GET', '/users/{id}', view('get'))
+    router.add('DELETE', '/users/{id}', view('delete'))
+    router.add('POST', '/users/batch', view('batch'))
+    router.add('GET', '/stats/timeseries', view('timeseries'))
+    return router
+
+@pytest.mark.parametrize('method, path, name, params', [
+    ('GET', '/users', 'list', {}),
+    ('GET', '/users/abc', 'get', {'id': 'abc'}),
+    ('DELETE', '/users/abc', 'delete', {'id': 'abc'}),
+    ('POST', '/users/batch', 'batch', {}),
+    ('GET', '/stats/timeseries', 'timeseries', {})
+])
+def test_resolve(router, method, path, name, params):
+    found, found_params, _ = router.resolve(method, path)
+    assert found({}) == name and found_params == params
+
+@pytest.mark.parametrize('path', ['/', '/stats', '/users/abc/details', '/unknown'])
+def test_unknown_path(router, path):
+    with pytest.raises(RouteNotFound):
+        router.resolve('GET', path)
+
+def test_method_not_allowed(router):
+    with pytest.raises(MethodNotAllowed) as error:
+        router.resolve('PUT', '/users/abc')
+    assert error.value.allowed_methods == ['DELETE', 'GET']
+
+# Un segmento statico con route ha la precedenza sul parametro
+def test_static_segment_wins(router):
+    with pytest.raises(MethodNotAllowed) as error:
+        router.resolve('GET', '/users/batch')
+    assert error.value.allowed_methods == ['POST']
+
+def test_rejects_duplicates_and_conflicting_params(router):
+    with pytest.raises(ValueError):
+        router.add('GET', '/users', view('again'))
+    with pytest.raises(ValueError):
+        router.add('GET', '/users/{userId}/details', view('details'))
+
+def test_middleware_order():
+    calls = []
+
+    def hook(name):
+        def middleware(request, next_handler):
+            calls.append(name)
+            return next_handler(request)
+        return middleware
+
+    router = Router()
+    router.add('GET', '/ping', lambda request: calls.append('view') or 'pong', middleware=(hook('a'), hook('b')))
+    found, _, _ = router.resolve('GET', '/ping')
+    assert found({}) == 'pong' and calls == ['a', 'b', 'view']
+
+def test_handler_not_found(api):
+    status, _, body = api('GET', '/inesistente')
+    assert status == 404
+    assert 'GET /users - ' in ' '.join(body['availableEndpoints'])
+
+def test_handler_method_not_allowed(api):
+    status, headers, body = api('PUT', '/users/abc')
+    assert status == 405
+    assert body['allowedMethods'] == ['DELETE', 'GET']
+    assert headers['Allow'] == 'DELETE, GET, OPTIONS'
+
+def test_handler_normalizes_path_and_aliases(api):
+    assert api('POST', '/members', {'name': 'Anna Bianchi', 'email': 'anna@example.com'})[0] == 201
+    assert api('GET', '//users/')[2]['count'] == 1
+    assert api('GET', '/members')[2]['count'] == 1
+    assert api('OPTIONS', '/qualsiasi')[0] == 200
@@ -0,0 +1,62 @@
+import datetime
+
+import gymUsersHandler
+
+ADMIN_HEADERS = {'X-Admin-Token': gymUsersHandler.ADMIN_TOKEN}
+FIXED_STATS_ATTRIBUTES = {'userId', 'recordType', 'dataVersion', 'totalMembers', 'activeMembers',
+                          'activeSubscriptions'}
+
+def stats_attributes(storage):
+    item = storage.get(gymUsersHandler.STATS_KEY)
+    return {name for name in item if not name.startswith('type_')}
+
+def test_counters_follow_creations_and_deletions(api):
+    ids = []
+    for index, membership_type in enumerate(['basic', 'premium', 'basic']):
+        status, _, body = api('POST', '/users', {'name': f'Membro {index}', 'email': f'm{index}@example.com',
+                                                 'subscriptionType': membership_type})
+        assert status == 201
+        ids.append(body['id'])
+    assert api('DELETE', f'/users/{ids[0]}')[0] == 200
+
+    stats = api('GET', '/stats')[2]['stats']
+    assert stats['totalMembers'] == 2
+    assert stats['newMembersToday'] == 2
+    assert stats['membershipTypes']['basic'] == 1
+    assert stats['membershipTypes']['premium'] == 1
+
+def test_global_item_has_fixed_attributes(api, storage):
+    # Importazione con date di iscrizione storiche, come gymCsvImport con joinDate
+    users = []
+    for year in (2015, 2016, 2017):
+        user = gymUsersHandler.build_user_item({'name': f'Storico {year}', 'email': f's{year}@example.com'})
+        user['createdAt'] = user['updatedAt'] = f"{year}-02-01T00:00:00"
+        users.append(user)
+    assert not gymUsersHandler.write_members_batch(users)
+    assert api('POST', '/users', {'name': 'Oggi', 'email': 'oggi@example.com'})[0] == 201
+
+    assert stats_attributes(storage) <= FIXED_STATS_ATTRIBUTES
+    stats = api('GET', '/stats')[2]['stats']
+    assert stats['totalMembers'] == 4
+    assert stats['newMembersToday'] == 1
+
+def test_recompute_drops_legacy_day_counters(api, storage):
+    assert api('POST', '/users', {'name': 'Anna Bianchi', 'email': 'anna@example.com'})[0] == 201
+    storage.update(gymUsersHandler.STATS_KEY, add_values={'day_2015-02-01': 3, 'totalMembers': 5})
+
+    status, _, body = api('POST', '/stats/recompute', headers=ADMIN_HEADERS)
+    assert status == 200
+    assert body['stats']['totalMembers'] == 1
+    assert body['stats']['newMembersToday'] == 1
+    assert stats_attributes(storage) <= FIXED_STATS_ATTRIBUTES
+
+def test_unknown_membership_type_is_rejected(api):
+    status, _, _ = api('POST', '/users', {'name': 'Anna Bianchi', 'email': 'anna@example.com',
+                                          'subscriptionType': 'x' * 1000})
+    assert status == 400
+
+def test_day_item_expires(api, storage):
+    assert api('POST', '/users', {'name': 'Anna Bianchi', 'email': 'anna@example.com'})[0] == 201
+    day_item = storage.get(gymUsersHandler.stats_day_key(gymUsersHandler.utc_today()))
+    assert day_item['signups'] == 1
+    assert int(day_item['expiresAt']) > datetime.datetime.utcnow().timestamp()
@@ -0,0 +1,91 @@
+import pytest
+
+import gymStatsStream
+
+# Record dello stream DynamoDB con le immagini nel formato DynamoDB JSON
+def record(event_id, event_name='INSERT', membership_type='basic', created_at='2024-03-05T10:00:00', **image):
+    image = {'userId': {'S': f'u-{event_id}'}, 'membershipType': {'S': membership_type},
+             'createdAt': {'S': created_at}, **{name: {'S': value} for name, value in image.items()}}
+    return {
+        'eventID': event_id,
+        'eventName': event_name,
+        'dynamodb': {
+            'SequenceNumber': f'seq-{event_id}',
+            'ApproximateCreationDateTime': 1709805600,  # 2024-03-07
+            'NewImage' if event_name == 'INSERT' else 'OldImage': image
+        }
+    }
+
+def rollup(storage, granularity, period):
+    return storage.get(gymStatsStream.rollup_key(granularity, period)) or {}
+
+def test_rollups_per_granularity(storage):
+    records = [record('1'), record('2', membership_type='premium'), record('3', 'REMOVE')]
+    assert gymStatsStream.handler({'Records': records}, None) == {'batchItemFailures': []}
+
+    day = rollup(storage, 'day', '2024-03-05')
+    assert day['signups'] == 2 and day['type_basic'] == 1 and day['type_premium'] == 1
+    assert rollup(storage, 'day', '2024-03-07')['deletions'] == 1
+    week = rollup(storage, 'week', '2024-W10')
+    assert week['signups'] == 2 and week['deletions'] == 1 and week['periodStart'] == '2024-03-04'
+    month = rollup(storage, 'month', '2024-03')
+    assert month['signups'] == 2 and month['deletedType_basic'] == 1
+
+def test_redelivered_records_are_counted_once(storage):
+    gymStatsStream.handler({'Records': [record('1'), record('2')]}, None)
+    assert gymStatsStream.handler({'Records': [record('1'), record('2')]}, None) == {'batchItemFailures': []}
+    # Blocco misto: un record già applicato e uno nuovo
+    gymStatsStream.handler({'Records': [record('2'), record('3')]}, None)
+    assert rollup(storage, 'day', '2024-03-05')['signups'] == 3
+    assert rollup(storage, 'month', '2024-03')['type_basic'] == 3
+
+def test_records_across_transactions(storage, monkeypatch):
+    monkeypatch.setattr(gymStatsStream, 'RECORDS_PER_TRANSACTION', 2)
+    records = [record(str(index)) for index in range(5)]
+    gymStatsStream.handler({'Records': records}, None)
+    gymStatsStream.handler({'Records': records[3:]}, None)
+    assert rollup(storage, 'day', '2024-03-05')['signups'] == 5
+
+def test_ignored_records(storage):
+    records = [
+        record('1', 'MODIFY'),
+        record('2', recordType='STATS'),
+        record('3', 'REMOVE', recordType='EVENT'),
+        {'eventID': '4', 'eventName': 'INSERT', 'dynamodb': {'SequenceNumber': 'seq-4'}}
+    ]
+    gymStatsStream.handler({'Records': records}, None)
+    assert rollup(storage, 'day', '2024-03-05') == {}
+    assert rollup(storage, 'day', '2024-03-07') == {}
+
+def test_unknown_membership_type(storage):
+    gymStatsStream.handler({'Records': [record('1', membership_type='x' * 40)]}, None)
+    day = rollup(storage, 'day', '2024-03-05')
+    assert day['type_other'] == 1
+    assert not any(name.startswith('type_x') for name in day)
+
+# La transazione fallita non applica nulla: Lambda riprende dal primo record del blocco e
+# la nuova consegna salta quelli già applicati dai blocchi precedenti
+def test_failure_reports_first_unapplied_record(storage, monkeypatch):
+    monkeypatch.setattr(gymStatsStream, 'RECORDS_PER_TRANSACTION', 2)
+    records = [record(str(index)) for index in range(4)]
+    original = type(storage).transact
+
+    def failing_transact(self, operations):
+        if any(operation.get('put', {}).get('userId') == 'EVENT#3' for operation in operations):
+            raise RuntimeError("ProvisionedThroughputExceeded")
+        return original(self, operations)
+
+    monkeypatch.setattr(type(storage), 'transact', failing_transact)
+    assert gymStatsStream.handler({'Records': records}, None) == {'batchItemFailures': [{'itemIdentifier': 'seq-2'}]}
+    assert rollup(storage, 'day', '2024-03-05')['signups'] == 2
+
+    monkeypatch.setattr(type(storage), 'transact', original)
+    assert gymStatsStream.handler({'Records': records}, None) == {'batchItemFailures': []}
+    assert rollup(storage, 'day', '2024-03-05')['signups'] == 4
+
+def test_timeseries_reads_rollups(api, storage):
+    gymStatsStream.handler({'Records': [record('1'), record('2', created_at='2024-03-06T09:00:00')]}, None)
+    status, _, body = api('GET', '/stats/timeseries', query={'from': '2024-03-04', 'to': '2024-03-07'})
+    assert status == 200
+    assert [point['signups'] for point in body['points']] == [0, 1, 1, 0]
+    assert body['points'][-1]['deletions'] == 0
@@ -0,0 +1,99 @@
+import pytest
+
+from gymStorage import ConditionFailed, IF_EXISTS, IF_NOT_EXISTS, MISSING
+
+def member(user_id, status, created_at, **attributes):
+    return {'userId': user_id, 'status': status, 'createdAt': created_at, 'listPartition': 'MEMBERS', **attributes}
+
+MEMBERS = [
+    member('u1', 'active', '2024-01-01T10:00:00', membershipType='basic'),
+    member('u2', 'inactive', '2024-01-02T10:00:00', membershipType='premium'),
+    member('u3', 'active', '2024-01-03T10:00:00', membershipType='basic'),
+    member('u4', 'active', '2024-01-04T10:00:00', membershipType='yearly'),
+    member('u5', 'active', '2024-01-05T10:00:00', membershipType='basic')
+]
+# Elemento di servizio con status: entra nell'indice di status ma non è un membro
+SERVICE_ITEM = {'userId': 'EXPORT#1', 'recordType': 'EXPORT', 'status': 'active', 'createdAt': '2024-01-03T12:00:00'}
+
+def read_all(read_page, limit):
+    ids, start_key = [], None
+    while True:
+        items, start_key = read_page(limit=limit, start_key=start_key)
+        ids.extend(item['userId'] for item in items)
+        if start_key is None:
+            return ids
+
+@pytest.fixture
+def filled(storage):
+    for item in [*MEMBERS, SERVICE_ITEM]:
+        storage.put(item)
+    return storage
+
+def test_put_condition(filled):
+    with pytest.raises(ConditionFailed):
+        filled.put(member('u1', 'active', '2024-02-01T10:00:00'), IF_NOT_EXISTS)
+    assert filled.get({'userId': 'u1'})['createdAt'] == '2024-01-01T10:00:00'
+
+def test_get_projection(filled):
+    assert filled.get({'userId': 'u2'}, ['status', 'missing']) == {'status': 'inactive'}
+    assert filled.get({'userId': 'nope'}) is None
+
+def test_update_add_and_condition(filled):
+    filled.update({'userId': 'STATS#GLOBAL'}, {'recordType': 'STATS'}, {'totalMembers': 2})
+    filled.update({'userId': 'STATS#GLOBAL'}, add_values={'totalMembers': -1})
+    assert filled.get({'userId': 'STATS#GLOBAL'})['totalMembers'] == 1
+    with pytest.raises(ConditionFailed):
+        filled.update({'userId': 'nope'}, {'status': 'active'}, condition=IF_EXISTS)
+    assert filled.get({'userId': 'nope'}) is None
+
+@pytest.mark.parametrize('limit', [1, 2, 10])
+def test_query_pagination_and_order(filled, limit):
+    def page(forward):
+        return lambda **kwargs: filled.query('status-createdAt-index', 'active', forward=forward, **kwargs)
+    assert read_all(page(True), limit) == ['u1', 'u3', 'EXPORT#1', 'u4', 'u5']
+    assert read_all(page(False), limit) == ['u5', 'u4', 'EXPORT#1', 'u3', 'u1']
+
+def test_query_filters(filled):
+    def page(**kwargs):
+        return filled.query('status-createdAt-index', 'active',
+                            filters={'recordType': MISSING, 'membershipType': 'basic'}, **kwargs)
+    assert read_all(page, 2) == ['u1', 'u3', 'u5']
+
+def test_sparse_index(filled):
+    def page(**kwargs):
+        return filled.query('listPartition-createdAt-index', 'MEMBERS', **kwargs)
+    assert read_all(page, 2) == ['u1', 'u2', 'u3', 'u4', 'u5']
+
+def test_scan_filters(filled):
+    def page(**kwargs):
+        return filled.scan(filters={'recordType': MISSING}, fields=['userId'], **kwargs)
+    assert sorted(read_all(page, 2)) == ['u1', 'u2', 'u3', 'u4', 'u5']
+
+def test_batch_get(filled):
+    found, unprocessed = filled.batch_get([{'userId': 'u1'}, {'userId': 'nope'}, {'userId': 'u4'}],
+                                          ['userId', 'status'])
+    assert not unprocessed
+    assert sorted(found, key=lambda item: item['userId']) == [
+        {'userId': 'u1', 'status': 'active'},
+        {'userId': 'u4', 'status': 'active'}
+    ]
+
+def test_transact_is_atomic(filled):
+    with pytest.raises(ConditionFailed) as failure:
+        filled.transact([
+            {'put': member('u6', 'active', '2024-01-06T10:00:00')},
+            {'put': member('u1', 'active', '2024-01-07T10:00:00'), 'condition': IF_NOT_EXISTS},
+            {'delete': {'userId': 'u2'}}
+        ])
+    assert failure.value.index == 1
+    assert filled.get({'userId': 'u6'}) is None
+    assert filled.get({'userId': 'u2'}) is not None
+
+    filled.transact([
+        {'put': member('u6', 'active', '2024-01-06T10:00:00'), 'condition': IF_NOT_EXISTS},
+        {'delete': {'userId': 'u2'}, 'condition': IF_EXISTS},
+        {'update': {'userId': 'u1'}, 'set': {'status': 'inactive'}}
+    ])
+    assert filled.get({'userId': 'u6'}) is not None
+    assert filled.get({'userId': 'u2'}) is None
+    assert filled.get({'userId': 'u1'})['status'] == 'inactive'